@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from movie_ninja.models import Token
+
+
+def token_key(token: str) -> str:
+    return Token.digest(token)
+
+
+class TokenCache:
+    """
+    Bounded in-process LRU of resolved access tokens.
+
+    Maps the SHA-256 of a bearer token to the owner's id and the token's
+    ``access_token_expires_at``. Entries live at most ``ttl`` seconds, which
+    also bounds how long another worker process may keep accepting a token
+    replaced elsewhere.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        key = token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            user_id, expires_at, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                self._discard(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return user_id, expires_at
+
+    def set(self, token: str, user_id: int, expires_at) -> None:
+        key = token_key(token)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (user_id, expires_at, time.monotonic())
+            self._user_keys.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for key in self._user_keys.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._user_keys.get(entry[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._user_keys[entry[0]]
+
+
+token_cache = TokenCache(
+    maxsize=getattr(settings, "AUTH_TOKEN_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "AUTH_TOKEN_CACHE_TTL", 60),
+)
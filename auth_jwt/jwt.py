@@ -1,41 +1,83 @@
+import time
 from django.shortcuts import get_object_or_404
-from django.http import Http404
 from datetime import datetime, timedelta
+from ninja.errors import AuthenticationError
 from ninja.security import HttpBearer
 
 from django.conf import settings
 
+from ninja_jwt.exceptions import TokenError
+from ninja_jwt.settings import api_settings
 from ninja_jwt.tokens import AccessToken, RefreshToken
 from datetime import datetime, timedelta, timezone
 from django.conf import settings
 from django.shortcuts import get_object_or_404
 from ninja.responses import Response
 from ninja_extra import status
-from movie_ninja.models import Token
+from django.utils.functional import SimpleLazyObject
+from movie_ninja.models import CustomUser, Token
+from .cache import token_cache
+
+
+class LazyUser(SimpleLazyObject):
+    """
+    User loaded on first attribute access. Always truthy, so Ninja's
+    ``if result`` check on the auth result does not trigger the query.
+    """
+
+    def __bool__(self):
+        return True
+
+
+def load_user(user_id):
+    """
+    The user a verified token names. Raises ``AuthenticationError`` (a 401)
+    when the account was deleted after the token was issued or cached.
+    """
+    try:
+        return CustomUser.objects.get(pk=user_id)
+    except CustomUser.DoesNotExist:
+        raise AuthenticationError
 
 
 class TokenHandler:
+    @staticmethod
+    def issue_token(token_class, user_id, minutes):
+        """
+        Signed JWT carrying the user id claim, with ``exp`` set to the same
+        instant that is stored in the ``Token`` row.
+        """
+        issued = token_class()
+        issued[api_settings.USER_ID_CLAIM] = user_id
+        expires_at = datetime.now(timezone.utc) + timedelta(minutes=minutes)
+        issued.set_exp(from_time=expires_at, lifetime=timedelta())
+        return issued, expires_at
+
     @staticmethod
     def generate_tokens(user):
-        access_token = AccessToken()
-        refresh_token = RefreshToken()
+        access_token, access_expires_at = TokenHandler.issue_token(
+            AccessToken, user.id, settings.NINJA_JWT_ACCESS_TOKEN_EXPIRES
+        )
+        refresh_token, refresh_expires_at = TokenHandler.issue_token(
+            RefreshToken, user.id, settings.NINJA_JWT_REFRESH_TOKEN_EXPIRES
+        )
 
         token, created = Token.objects.get_or_create(user=user)
+        if not created:
+            token_cache.invalidate_user(user.id)
         token.access_token = access_token
         token.refresh_token = refresh_token
-        token.access_token_expires_at = datetime.now(timezone.utc) + timedelta(
-            minutes=settings.NINJA_JWT_ACCESS_TOKEN_EXPIRES
-        )
-        token.refresh_token_expires_at = datetime.now(timezone.utc) + timedelta(
-            minutes=settings.NINJA_JWT_REFRESH_TOKEN_EXPIRES
-        )
+        token.access_token_expires_at = access_expires_at
+        token.refresh_token_expires_at = refresh_expires_at
         token.save()
 
         return token
 
     @staticmethod
     def refresh_tokens(refresh_token):
-        token = get_object_or_404(Token, refresh_token=refresh_token)
+        token = get_object_or_404(
+            Token, refresh_token_digest=Token.digest(refresh_token)
+        )
 
         if datetime.now(timezone.utc) > token.refresh_token_expires_at:
             return Response(
@@ -43,29 +85,92 @@ class TokenHandler:
                 status=status.HTTP_401_UNAUTHORIZED,
             )
 
-        new_access_token = AccessToken()
-        token.access_token = new_access_token
-        token.access_token_expires_at = datetime.now(timezone.utc) + timedelta(
-            minutes=settings.NINJA_JWT_ACCESS_TOKEN_EXPIRES
+        token_cache.invalidate_user(token.user_id)
+        new_access_token, access_expires_at = TokenHandler.issue_token(
+            AccessToken, token.user_id, settings.NINJA_JWT_ACCESS_TOKEN_EXPIRES
         )
+        token.access_token = new_access_token
+        token.access_token_expires_at = access_expires_at
         token.save()
 
         return token
 
     @staticmethod
-    def get_user_from_token(token: str):
+    def delete_expired_tokens(batch_size=1000, sleep=0.0):
+        """
+        Delete tokens whose refresh token has expired, ``batch_size`` rows per
+        statement with ``sleep`` seconds between batches so writers are never
+        locked out for long. Safe to call from a scheduler. Returns the number
+        of deleted rows and the elapsed time in seconds.
+        """
+        started = time.monotonic()
+        deleted = 0
+        while True:
+            expired_ids = list(
+                Token.objects.filter(
+                    refresh_token_expires_at__lt=datetime.now(timezone.utc)
+                )
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not expired_ids:
+                break
+
+            deleted += Token.objects.filter(id__in=expired_ids).delete()[0]
+            if len(expired_ids) < batch_size:
+                break
+            if sleep:
+                time.sleep(sleep)
+
+        return deleted, time.monotonic() - started
+
+    @staticmethod
+    def get_user_from_claims(token: str):
+        """
+        Stateless verification: checks the signature, token type and ``exp``
+        claim locally and never reads the ``Token`` table. The user is only
+        loaded when a view touches it. Tokens stay valid until they expire,
+        even if the ``Token`` row was replaced; a deleted account fails with
+        a 401 once the view touches the user.
+        """
         try:
-            token_obj = get_object_or_404(Token, access_token=token)
-            user = token_obj.user
-        except Http404:
+            access_token = AccessToken(token)
+        except TokenError:
+            return None
+
+        user_id = access_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return None
+        return LazyUser(lambda: load_user(user_id))
+
+    @staticmethod
+    def get_user_from_token(token: str):
+        now = datetime.now(timezone.utc)
+        cached = token_cache.get(token)
+        if cached is not None:
+            user_id, expires_at = cached
+            if now > expires_at:
+                return None
+            return LazyUser(lambda: load_user(user_id))
+
+        token_obj = (
+            Token.objects.select_related("user")
+            .filter(access_token_digest=Token.digest(token))
+            .first()
+        )
+        if token_obj is None or now > token_obj.access_token_expires_at:
             return None
 
-        return user
+        token_cache.set(token, token_obj.user_id, token_obj.access_token_expires_at)
+        return token_obj.user
 
 
 class AuthBearer(HttpBearer):
     def authenticate(self, request, token: str):
         if token:
-            user = TokenHandler.get_user_from_token(token)
-            if user:
+            if getattr(settings, "NINJA_JWT_STATELESS_AUTH", False):
+                user = TokenHandler.get_user_from_claims(token)
+            else:
+                user = TokenHandler.get_user_from_token(token)
+            if user is not None:
                 return user
@@ -10,6 +10,7 @@ from movie_ninja.models import CustomUser
 from ninja.responses import Response
 from ninja_extra import status
 from django.core.exceptions import ObjectDoesNotExist
+from .cache import token_cache
 from .jwt import AuthBearer, TokenHandler
 from django.shortcuts import get_object_or_404
 from email_validator import validate_email, EmailNotValidError
@@ -102,7 +103,7 @@ def refresh(request, refresh_token_data: RefreshTokenSchema):
 
 @auth_router.patch("/profile", auth=AuthBearer())
 def update_profile(request, update_data: UpdateSchema):
-    user = get_object_or_404(CustomUser, username=request.auth)
+    user = request.auth
 
     for attr, value in update_data.dict().items():
         if attr == "email" and value is not None:
@@ -126,6 +127,7 @@ def update_password(request, data: PasswordUpdateSchema):
         if user.check_password(data.password):
             user.set_password(data.new_password)
             user.save()
+            token_cache.invalidate_user(user.id)
             return {"detail": "Password updated successfully"}
         else:
             return Response(
@@ -139,6 +141,7 @@ def update_password(request, data: PasswordUpdateSchema):
 
 @auth_router.delete("/delete-account", auth=AuthBearer(), response={204: None})
 def user_delete(request):
-    user = get_object_or_404(CustomUser, username=request.auth)
+    user = request.auth
+    token_cache.invalidate_user(user.id)
     user.delete()
     return {"detail": "User has been deleted successfully"}
@@ -0,0 +1,181 @@
+"""
+Load-test the read endpoints under ASGI, sync views against async views.
+
+Each mode runs in its own process (``API_ASYNC_VIEWS`` decides which views
+are mounted when the URLconf is imported) on a freshly seeded throwaway
+database. ``--concurrency`` clients share one event loop and call
+``ninja_api.asgi.application`` directly, like a single ASGI worker behind a
+server would, so the numbers show how many requests one worker multiplexes:
+
+    python -m benchmarks.load --scale 0.01 --concurrency 50 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import django
+
+
+MODES = ("sync", "async")
+
+
+async def _get(application, url):
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"testserver")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    sent = False
+    status = None
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            # The client stays connected until the response is complete.
+            await asyncio.Future()
+        sent = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await application(scope, receive, send)
+    return status
+
+
+async def _load(application, urls, concurrency, total):
+    latencies, statuses = [], {}
+    issued = 0
+
+    async def client():
+        nonlocal issued
+        while issued < total:
+            url = urls[issued % len(urls)]
+            issued += 1
+            started = time.perf_counter()
+            status = await _get(application, url)
+            latencies.append(time.perf_counter() - started)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def _urls(data):
+    movies, actors = data["movies"], data["actors"]
+    urls = ["/api/movies", "/api/actors"]
+    for i in range(20):
+        movie = movies[i * 7919 % len(movies)]
+        urls.append(f"/api/movies/{movie.id}")
+        urls.append(f"/api/movies/{movie.id}/reviews?max_depth=3")
+        urls.append(f"/api/actors/{actors[i * 7919 % len(actors)].id}")
+    return urls
+
+
+def run_mode(mode, scale, concurrency, total):
+    """Seed a test database and load it with ``mode`` views mounted."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ninja_api.settings")
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    from benchmarks.suite import _percentile, seed
+
+    # Must happen before the URLconf is first imported.
+    settings.API_ASYNC_VIEWS = mode == "async"
+    from ninja_api.asgi import application
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        urls = _urls(seed(scale))
+        asyncio.run(_load(application, urls, concurrency, min(total, 50)))  # warm-up
+        latencies, statuses, elapsed = asyncio.run(
+            _load(application, urls, concurrency, total)
+        )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    ordered = sorted(latencies)
+    return {
+        "mode": mode,
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_second": total / elapsed,
+        "status_codes": statuses,
+        "latency_ms": {
+            "p50": _percentile(ordered, 0.50) * 1000,
+            "p95": _percentile(ordered, 0.95) * 1000,
+            "p99": _percentile(ordered, 0.99) * 1000,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mode", choices=MODES + ("both",), default="both")
+    parser.add_argument("--scale", type=float, default=0.01)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--output", default="-", help="JSON file, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    if args.mode == "both":
+        report = {}
+        for mode in MODES:
+            command = [sys.executable, "-m", "benchmarks.load", "--mode", mode]
+            command += ["--scale", str(args.scale)]
+            command += ["--concurrency", str(args.concurrency)]
+            command += ["--requests", str(args.requests)]
+            output = subprocess.check_output(command, text=True)
+            report[mode] = json.loads(output)
+        report["speedup"] = (
+            report["async"]["requests_per_second"]
+            / report["sync"]["requests_per_second"]
+        )
+    else:
+        report = run_mode(args.mode, args.scale, args.concurrency, args.requests)
+
+    payload = json.dumps(report, indent=2, sort_keys=True)
+    if args.output == "-":
+        sys.stdout.write(payload + "\n")
+    else:
+        with open(args.output, "w") as output:
+            output.write(payload + "\n")
+
+    if args.mode == "both":
+        for mode in MODES:
+            result = report[mode]
+            latency = result["latency_ms"]
+            sys.stderr.write(
+                f"{mode:6} {result['requests_per_second']:8.1f} req/s  "
+                f"p50 {latency['p50']:8.2f}ms  p99 {latency['p99']:8.2f}ms\n"
+            )
+        sys.stderr.write(f"async/sync throughput: {report['speedup']:.2f}x\n")
+
+
+if __name__ == "__main__":
+    main()
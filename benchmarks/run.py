@@ -0,0 +1,84 @@
+"""
+Benchmark every API route against a throwaway database.
+
+Seeds realistic volumes (``--scale 1`` is 10k movies, 50k actors, 500k
+ratings and 50k reviews including one deep thread), calls each route in
+``movie_ninja.views`` and ``auth_jwt.views`` through the full Django stack
+and writes p50/p95/p99 latency, queries per request and peak memory as
+JSON, so runs can be diffed between releases:
+
+    python -m benchmarks.run --scale 0.1 --iterations 200 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import django
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--route", action="append", dest="routes", help="Only these")
+    parser.add_argument("--output", default="-", help="JSON file, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ninja_api.settings")
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    from benchmarks.suite import run_benchmarks
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        report = run_benchmarks(args.scale, args.iterations, args.routes)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    report["meta"] = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "scale": args.scale,
+    }
+
+    payload = json.dumps(report, indent=2, sort_keys=True)
+    if args.output == "-":
+        sys.stdout.write(payload + "\n")
+    else:
+        with open(args.output, "w") as output:
+            output.write(payload + "\n")
+
+    for name, result in report["routes"].items():
+        latency = result["latency_ms"]
+        sys.stderr.write(
+            f"{name:28} p50 {latency['p50']:8.2f}ms  p95 {latency['p95']:8.2f}ms  "
+            f"p99 {latency['p99']:8.2f}ms  queries {result['queries']['mean']:6.1f}\n"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,505 @@
+import json
+import random
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+import email_validator
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from auth_jwt.jwt import TokenHandler
+from ninja_api.cache import get_cache
+from movie_ninja.ratings import rating_queue
+from movie_ninja.models import (
+    Actor,
+    Category,
+    CustomUser,
+    Genre,
+    Movie,
+    Rating,
+    RatingStar,
+    Review,
+    Token,
+)
+from tests.factories import (
+    ActorFactory,
+    CategoryFactory,
+    GenreFactory,
+    MovieFactory,
+    ReviewFactory,
+)
+
+
+# Volumes at --scale 1.0
+BASE_VOLUMES = {
+    "movies": 10_000,
+    "actors": 50_000,
+    "ratings": 500_000,
+    "reviews": 50_000,
+}
+PASSWORD = "benchmark-password"
+CHUNK_SIZE = 2000
+# Hashing a password is deliberately slow, cap the routes that do it.
+SLOW_ROUTE_ITERATIONS = 10
+# Movies per call of the bulk import route.
+IMPORT_BATCH = 100
+
+
+def _bulk_create(model, objects):
+    created = []
+    for start in range(0, len(objects), CHUNK_SIZE):
+        created.extend(model.objects.bulk_create(objects[start : start + CHUNK_SIZE]))
+    return created
+
+
+def _seed_reviews(movies, total, rng):
+    """
+    Plain root reviews scattered over the catalog, plus one "viral" movie
+    with a wide, deep thread (and one long reply chain) taking half of the
+    budget.
+    """
+    viral = movies[0]
+    roots = ReviewFactory.build_batch(max(1, total // 2))
+    for review in roots:
+        review.movie_id = rng.choice(movies).id
+    _bulk_create(Review, roots)
+
+    budget = max(1, total - len(roots))
+    level = _bulk_create(Review, ReviewFactory.build_batch(50, movie=viral))
+    thread = level[0]
+    budget -= len(level)
+    while budget > 0:
+        width = min(budget, len(level) * 3, 2000)
+        replies = ReviewFactory.build_batch(width, movie=viral)
+        for reply in replies:
+            reply.parent_id = rng.choice(level).id
+        level = _bulk_create(Review, replies)
+        budget -= len(level)
+
+    chain_depth = 200
+    for _ in range(chain_depth):
+        thread = Review.objects.create(
+            email="chain@example.com",
+            name="chain",
+            text="reply",
+            parent=thread,
+            movie=viral,
+        )
+    return viral
+
+
+def seed(scale=1.0, rng=None):
+    """Fill the current database with ``BASE_VOLUMES`` times ``scale`` rows."""
+    rng = rng or random.Random(0)
+    volumes = {name: max(2, int(count * scale)) for name, count in BASE_VOLUMES.items()}
+
+    categories = _bulk_create(Category, CategoryFactory.build_batch(10))
+    genres = _bulk_create(Genre, GenreFactory.build_batch(20))
+    stars = _bulk_create(RatingStar, [RatingStar(value=value) for value in range(1, 6)])
+    actors = _bulk_create(
+        Actor, ActorFactory.build_batch(volumes["actors"], image="actor.jpg")
+    )
+
+    movies = MovieFactory.build_batch(volumes["movies"], poster="poster.jpg")
+    for movie in movies:
+        movie.category = rng.choice(categories)
+    movies = _bulk_create(Movie, movies)
+
+    cast, crew, tags = [], [], []
+    for movie in movies:
+        for actor in rng.sample(actors, min(5, len(actors))):
+            cast.append(Movie.actors.through(movie_id=movie.id, actor_id=actor.id))
+        for actor in rng.sample(actors, min(2, len(actors))):
+            crew.append(Movie.directors.through(movie_id=movie.id, actor_id=actor.id))
+        for genre in rng.sample(genres, 2):
+            tags.append(Movie.genres.through(movie_id=movie.id, genre_id=genre.id))
+    _bulk_create(Movie.actors.through, cast)
+    _bulk_create(Movie.directors.through, crew)
+    _bulk_create(Movie.genres.through, tags)
+
+    # (ip, movie) pairs are unique: the ip is derived from the row number.
+    ratings, totals = [], {}
+    for i in range(volumes["ratings"]):
+        movie = movies[i % len(movies)]
+        voter = i // len(movies)
+        star = rng.choice(stars)
+        ratings.append(
+            Rating(
+                ip=f"10.{voter >> 16 & 255}.{voter >> 8 & 255}.{voter & 255}",
+                star_id=star.id,
+                movie_id=movie.id,
+            )
+        )
+        count, total = totals.get(movie.id, (0, 0))
+        totals[movie.id] = (count + 1, total + star.value)
+    _bulk_create(Rating, ratings)
+    for movie in movies:
+        count, total = totals.get(movie.id, (0, 0))
+        movie.rating_count, movie.rating_sum = count, total
+        movie.rating_avg = total / count if count else 0
+    Movie.objects.bulk_update(
+        movies, ["rating_count", "rating_sum", "rating_avg"], batch_size=CHUNK_SIZE
+    )
+
+    viral = _seed_reviews(movies, volumes["reviews"], rng)
+    return {
+        "volumes": volumes,
+        "movies": movies,
+        "actors": actors,
+        "stars": stars,
+        "viral": viral,
+        "review": Review.objects.filter(movie=viral, parent=None).first(),
+    }
+
+
+def _make_users(prefix, count):
+    password = make_password(PASSWORD)
+    users = CustomUser.objects.bulk_create(
+        CustomUser(
+            username=f"{prefix}{i}", email=f"{prefix}{i}@example.com", password=password
+        )
+        for i in range(count)
+    )
+    for user in users:
+        TokenHandler.generate_tokens(user)
+    return users
+
+
+def _token(user):
+    # Re-read on every call: login and refresh replace the stored tokens.
+    return Token.objects.get(user=user)
+
+
+def _bearer(user):
+    return {"HTTP_AUTHORIZATION": f"Bearer {_token(user).access_token}"}
+
+
+def routes(data, iterations):
+    """
+    ``(name, method, request)`` for every route; ``request(i)`` builds the
+    path, JSON body and extra headers of the i-th call.
+    """
+    movies, actors, stars = data["movies"], data["actors"], data["stars"]
+    viral, review = data["viral"], data["review"]
+    users = _make_users("bench", 20)
+    doomed = _make_users("doomed", iterations + 1)
+    staff = users[-1]
+    CustomUser.objects.filter(pk=staff.pk).update(is_staff=True)
+    first_page = Client().get("/api/movies")
+    next_cursor = first_page.get("X-Next-Cursor", "")
+
+    def movie(i):
+        return movies[i * 7919 % len(movies)]
+
+    def user(i):
+        return users[i % len(users)]
+
+    return [
+        ("list_actors", "GET", lambda i: ("/api/actors", None, {})),
+        (
+            "get_actor",
+            "GET",
+            lambda i: (f"/api/actors/{actors[i * 7919 % len(actors)].id}", None, {}),
+        ),
+        (
+            "create_actor",
+            "POST",
+            lambda i: (
+                "/api/actors",
+                {"name": f"Bench {i}", "age": 30, "description": "d", "image": "a.jpg"},
+                {},
+            ),
+        ),
+        ("list_movies", "GET", lambda i: ("/api/movies", None, {})),
+        (
+            "list_movies_by_rating",
+            "GET",
+            lambda i: ("/api/movies?sort=-rating", None, {}),
+        ),
+        (
+            "list_movies_next_page",
+            "GET",
+            lambda i: (f"/api/movies?after={next_cursor}", None, {}),
+        ),
+        (
+            "search_movies",
+            "GET",
+            lambda i: (
+                f"/api/movies/search?q={movie(i).title.split()[0][:4]}",
+                None,
+                {},
+            ),
+        ),
+        (
+            "suggest",
+            "GET",
+            lambda i: (f"/api/suggest?prefix={movie(i).title[:3]}", None, {}),
+        ),
+        ("get_chart", "GET", lambda i: ("/api/charts/top-rated", None, {})),
+        (
+            "get_chart_by_year",
+            "GET",
+            lambda i: (f"/api/charts/most-reviewed?year={movie(i).year}", None, {}),
+        ),
+        ("export_movies", "GET", lambda i: ("/api/movies/export", None, {})),
+        (
+            "import_movies_bulk",
+            "POST",
+            lambda i: (
+                "/api/movies/bulk",
+                [
+                    {
+                        "title": f"Imported {i}-{n}",
+                        "description": "d",
+                        "poster": "poster.jpg",
+                        "country": "US",
+                        "url": f"imported-{i}-{n}",
+                        "actors": [actors[n % len(actors)].id],
+                    }
+                    for n in range(IMPORT_BATCH)
+                ],
+                _bearer(staff),
+            ),
+        ),
+        ("get_movie", "GET", lambda i: (f"/api/movies/{movie(i).id}", None, {})),
+        (
+            "get_movie_reviews",
+            "GET",
+            lambda i: (f"/api/movies/{movie(i).id}/reviews", None, {}),
+        ),
+        (
+            "get_movie_reviews_viral",
+            "GET",
+            lambda i: (f"/api/movies/{viral.id}/reviews?max_depth=3", None, {}),
+        ),
+        (
+            "get_review_replies",
+            "GET",
+            lambda i: (f"/api/reviews/{review.id}/replies?max_depth=3", None, {}),
+        ),
+        (
+            "create_review",
+            "POST",
+            lambda i: (
+                f"/api/reviews?movie_id={movie(i).id}",
+                {"email": "b@example.com", "name": "b", "text": "t", "parent": None},
+                {},
+            ),
+        ),
+        (
+            "create_rating",
+            "POST",
+            lambda i: (
+                "/api/ratings",
+                {
+                    "ip": f"192.168.{i >> 8 & 255}.{i & 255}",
+                    "star_id": stars[i % len(stars)].id,
+                    "movie_id": movie(i).id,
+                },
+                {},
+            ),
+        ),
+        (
+            "create_rating_write_behind",
+            "POST",
+            lambda i: (
+                "/api/ratings",
+                {
+                    "ip": f"192.169.{i >> 8 & 255}.{i & 255}",
+                    "star_id": stars[i % len(stars)].id,
+                    "movie_id": movie(i).id,
+                },
+                {},
+            ),
+        ),
+        (
+            "register",
+            "POST",
+            lambda i: (
+                "/api/auth/register",
+                {
+                    "username": f"newcomer{i}",
+                    "password": PASSWORD,
+                    "email": f"newcomer{i}@example.com",
+                    "first_name": "New",
+                    "last_name": "Comer",
+                },
+                {},
+            ),
+        ),
+        (
+            "login",
+            "POST",
+            lambda i: (
+                "/api/auth/login",
+                {"username": user(i).username, "password": PASSWORD},
+                {},
+            ),
+        ),
+        (
+            "refresh",
+            "POST",
+            lambda i: (
+                "/api/auth/refresh",
+                {"refresh_token": _token(user(i)).refresh_token},
+                {},
+            ),
+        ),
+        (
+            "update_profile",
+            "PATCH",
+            lambda i: (
+                "/api/auth/profile",
+                {"first_name": f"Name{i}"},
+                _bearer(user(0)),
+            ),
+        ),
+        (
+            "update_password",
+            "PUT",
+            lambda i: (
+                "/api/auth/update_password",
+                {
+                    "username": user(0).username,
+                    "password": PASSWORD,
+                    "new_password": PASSWORD,
+                },
+                _bearer(user(0)),
+            ),
+        ),
+        (
+            "delete_account",
+            "DELETE",
+            lambda i: ("/api/auth/delete-account", None, _bearer(doomed[i])),
+        ),
+    ]
+
+
+# No flusher threads: they would write to the benchmark database while
+# requests are measured (and after it is destroyed).
+SUITE_SETTINGS = {"CHARTS_FLUSH_INTERVAL": 0, "RATING_FLUSH_INTERVAL": 0}
+
+# Settings a route is measured with. Queued votes are flushed by the
+# requests filling a batch, so their writes are part of the measurement.
+ROUTE_SETTINGS = {
+    "create_rating_write_behind": {
+        "RATING_WRITE_BEHIND": True,
+        "RATING_FLUSH_INTERVAL": 0,
+        "RATING_BATCH_SIZE": 50,
+    },
+}
+
+
+@contextmanager
+def _offline_email_checks():
+    # A DNS lookup per registration would time the resolver, not the API;
+    # example.com does not accept mail either.
+    checked = email_validator.CHECK_DELIVERABILITY
+    email_validator.CHECK_DELIVERABILITY = False
+    try:
+        yield
+    finally:
+        email_validator.CHECK_DELIVERABILITY = checked
+
+
+class RouteFailed(Exception):
+    """A benchmarked request did not get a 2xx response."""
+
+
+def _percentile(ordered, fraction):
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _call(client, method, path, body, headers):
+    payload = json.dumps(body) if body is not None else ""
+    response = client.generic(
+        method, path, payload, content_type="application/json", **headers
+    )
+    if response.streaming:
+        b"".join(response.streaming_content)
+    if not 200 <= response.status_code < 300:
+        # Timing an error page would make a broken route look fast.
+        raise RouteFailed(
+            f"{method} {path} returned {response.status_code}: "
+            f"{response.content[:200]!r}"
+        )
+    return response
+
+
+def measure(client, method, request, iterations):
+    latencies, queries, statuses = [], [], Counter()
+    first_path = None
+    for i in range(iterations):
+        path, body, headers = request(i)
+        first_path = first_path or path
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = _call(client, method, path, body, headers)
+            latencies.append(time.perf_counter() - started)
+        queries.append(len(captured.captured_queries))
+        statuses[response.status_code] += 1
+
+    # Tracing slows everything down, so memory is sampled on a separate call.
+    path, body, headers = request(iterations)
+    tracemalloc.start()
+    _call(client, method, path, body, headers)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    ordered = sorted(latencies)
+    return {
+        "method": method,
+        "path": first_path,
+        "iterations": iterations,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "latency_ms": {
+            "p50": _percentile(ordered, 0.50) * 1000,
+            "p95": _percentile(ordered, 0.95) * 1000,
+            "p99": _percentile(ordered, 0.99) * 1000,
+            "mean": sum(ordered) / len(ordered) * 1000,
+            "max": ordered[-1] * 1000,
+        },
+        "queries": {
+            "mean": sum(queries) / len(queries),
+            "max": max(queries),
+        },
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+def run_benchmarks(scale=1.0, iterations=100, only=None, seed_value=0):
+    """
+    Seed the current database and benchmark every route. Returns a
+    JSON-serialisable report; raises ``RouteFailed`` if any request does not
+    succeed.
+    """
+    with override_settings(**SUITE_SETTINGS), _offline_email_checks():
+        started = time.perf_counter()
+        data = seed(scale, random.Random(seed_value))
+        seeded_in = time.perf_counter() - started
+
+        client = Client()
+        results = {}
+        for name, method, request in routes(data, iterations):
+            if only and name not in only:
+                continue
+            count = iterations
+            if name in ("register", "login", "update_password"):
+                count = min(iterations, SLOW_ROUTE_ITERATIONS)
+            # Every route starts with a cold response cache.
+            get_cache().clear()
+            with override_settings(**ROUTE_SETTINGS.get(name, {})):
+                results[name] = measure(client, method, request, count)
+                rating_queue.flush()
+
+    return {
+        "volumes": data["volumes"],
+        "seed_seconds": seeded_in,
+        "routes": results,
+    }
@@ -1,9 +1,16 @@
 from django import forms
 from django.contrib import admin
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from ckeditor_uploader.widgets import CKEditorUploadingWidget
+from ninja_api.response_cache import invalidate
 
 from .models import Category, Genre, Movie, MovieShots, Actor, Rating, RatingStar, Review
+from .charts import leaderboards
+from .search import match_expression, matching_ids
+from .suggest import MOVIE, suggest_index
 
 
 class MovieAdminForm(forms.ModelForm):
@@ -78,9 +85,24 @@ class MovieAdmin(admin.ModelAdmin):
     def get_image(self, obj):
         return mark_safe(f'<img src={obj.poster.url} width="100" height="110"')
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу вместо LIKE по названию"""
+        expression = match_expression(search_term)
+        if expression is None:
+            return super().get_search_results(request, queryset, search_term)
+        sql, params = matching_ids(expression)
+        matches = Q(id__in=RawSQL(sql, params)) | Q(category__name__icontains=search_term)
+        return queryset.filter(matches), False
+
     def unpublish(self, request, queryset):
         """Снять с публикации"""
-        row_update = queryset.update(draft=True)
+        movie_ids = list(queryset.values_list("id", flat=True))
+        row_update = queryset.update(draft=True, updated_at=timezone.now())
+        # QuerySet.update() sends no post_save
+        invalidate("movies")
+        for movie_id in movie_ids:
+            suggest_index.remove(MOVIE, movie_id)
+        leaderboards.mark(movie_ids)
         if row_update == 1:
             message_bit = "1 запись была обновлена"
         else:
@@ -89,7 +111,12 @@ class MovieAdmin(admin.ModelAdmin):
 
     def publish(self, request, queryset):
         """Опубликовать"""
-        row_update = queryset.update(draft=False)
+        movies = list(queryset.values_list("id", "title"))
+        row_update = queryset.update(draft=False, updated_at=timezone.now())
+        invalidate("movies")
+        for movie_id, title in movies:
+            suggest_index.put(MOVIE, movie_id, title)
+        leaderboards.mark([movie_id for movie_id, _ in movies])
         if row_update == 1:
             message_bit = "1 запись была обновлена"
         else:
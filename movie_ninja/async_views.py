@@ -0,0 +1,167 @@
+"""
+ASGI-native versions of the read endpoints.
+
+Mounted in front of ``api_router`` when ``API_ASYNC_VIEWS`` is on, so under
+an ASGI server these paths run on the event loop instead of being handed to
+the sync thread one request at a time. Responses are identical to the sync
+views, which stay in use under WSGI.
+"""
+from ninja import Router, Path, Query
+from .models import Actor, Movie
+from .schemas import (
+    ActorListSchema,
+    ActorDetailSchema,
+    MovieDetailSchema,
+    MovieListSchema,
+    ReviewSchema,
+)
+from .filters import (
+    DEFAULT_SORT,
+    MOVIE_SORTS,
+    MovieFilterSchema,
+    MovieSort,
+    sort_fields,
+    sort_scope,
+)
+from .reviews import build_review_tree, detail_reviews, thread_reviews
+from .ratings import arated_movie_ids, client_ip
+from .pagination import (
+    DEFAULT_PAGE_SIZE,
+    InvalidCursor,
+    NEXT_CURSOR_HEADER,
+    apaginate_keyset,
+)
+from .views import (
+    ACTOR_LIST_FIELDS,
+    REVIEW_FIELDS,
+    _movie_detail,
+    _movie_detail_queryset,
+    _movie_list_items,
+    _movie_list_rows,
+    _review_page,
+    create_actor,
+)
+from ninja_api.instrumentation import query_budget
+from ninja_api.renderers import trusted_response
+from ninja_api.response_cache import cache_response
+from typing import List, Optional
+from django.http import Http404, HttpResponse
+from ninja.responses import Response
+from ninja_extra import status
+
+
+async_api_router = Router()
+
+
+@async_api_router.get(
+    "/actors", response=List[ActorListSchema], summary="Get list of all actors"
+)
+@query_budget(1)
+@cache_response("actors")
+async def list_actors(request):
+    actors = [actor async for actor in Actor.objects.values(*ACTOR_LIST_FIELDS)]
+    return trusted_response(request, actors)
+
+
+# The sync view keeps POST working on the path this router takes over.
+async_api_router.post(
+    "/actors", response=ActorListSchema, summary="Create a new actor"
+)(create_actor)
+
+
+@async_api_router.get(
+    "/actors/{int:actor_id}",
+    response=ActorDetailSchema,
+    summary="Get one actor's details",
+)
+@query_budget(1)
+@cache_response("actors")
+async def get_actor(request, actor_id: int = Path(...)):
+    try:
+        return await Actor.objects.aget(id=actor_id)
+    except Actor.DoesNotExist:
+        raise Http404
+
+
+@async_api_router.get(
+    "/movies", response=List[MovieListSchema], summary="Get list all movies"
+)
+@query_budget(2)
+@cache_response("movies", "ratings", per_client=True)
+async def list_movies(
+    request,
+    response: HttpResponse,
+    filters: MovieFilterSchema = Query(...),
+    sort: MovieSort = DEFAULT_SORT,
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    extra = sort_fields(sort)
+    movies = filters.filter(_movie_list_rows(*extra))
+    try:
+        movies, next_cursor = await apaginate_keyset(
+            movies, MOVIE_SORTS[sort], after, limit, scope=sort_scope(sort)
+        )
+    except InvalidCursor:
+        return Response(
+            {"detail": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if next_cursor:
+        response[NEXT_CURSOR_HEADER] = next_cursor
+
+    rated = await arated_movie_ids(
+        client_ip(request), [movie["id"] for movie in movies]
+    )
+    return trusted_response(request, _movie_list_items(movies, rated, extra), response)
+
+
+@async_api_router.get(
+    "/movies/{int:movie_id}",
+    response=MovieDetailSchema,
+    summary="Get details of the movie",
+)
+@query_budget(5)
+@cache_response("movies")
+async def get_movie(request, movie_id: int = Path(...)):
+    try:
+        movie = await _movie_detail_queryset().aget(id=movie_id)
+    except Movie.DoesNotExist:
+        raise Http404
+    reviews = [
+        review
+        async for review in detail_reviews(movie.id)
+        .order_by("id")
+        .values(*REVIEW_FIELDS)
+    ]
+    return _movie_detail(movie, reviews)
+
+
+@async_api_router.get(
+    "/movies/{int:movie_id}/reviews",
+    summary="Get all reviews for a movie",
+    response=List[ReviewSchema],
+)
+@query_budget(2)
+async def get_movie_reviews(
+    request,
+    movie_id: int,
+    response: HttpResponse,
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    max_depth: Optional[int] = Query(None, ge=1),
+    children_limit: Optional[int] = Query(None, ge=0),
+):
+    if not await Movie.objects.filter(id=movie_id).aexists():
+        raise Http404
+
+    try:
+        reviews = thread_reviews(movie_id, after, limit, max_depth)
+    except InvalidCursor:
+        return Response(
+            {"detail": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    reviews = [review async for review in reviews.order_by("id").values(*REVIEW_FIELDS)]
+    return _review_page(
+        response, build_review_tree(reviews), None, limit, max_depth, children_limit
+    )
@@ -0,0 +1,372 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Literal
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, Q
+
+from .models import ChartEntry, Movie, Review
+
+
+logger = logging.getLogger(__name__)
+
+TOP_RATED = "top-rated"
+MOST_REVIEWED = "most-reviewed"
+CHART_KINDS = (TOP_RATED, MOST_REVIEWED)
+ChartKind = Literal["top-rated", "most-reviewed"]
+
+# Movies kept per chart, and so the most GET /charts/{kind} can list.
+CHART_SIZE = 100
+DEFAULT_CHART_LIMIT = 10
+
+OVERALL = "all"
+
+
+def genre_scope(genre_id):
+    return f"genre:{genre_id}"
+
+
+def year_scope(year):
+    return f"year:{year}"
+
+
+def clamp_chart_limit(limit):
+    return max(1, min(limit or DEFAULT_CHART_LIMIT, CHART_SIZE))
+
+
+class TopN:
+    """
+    The ``size`` best scored movies of one chart, ``{movie_id: score}``.
+
+    A min-heap of ``(score, -movie_id)`` finds the weakest member to evict
+    in O(log n). Heap items left behind by a score change or a removal are
+    skipped when they surface, and dropped whenever the heap is rebuilt.
+    Ties rank the lower movie id first.
+    """
+
+    def __init__(self, entries=(), size=CHART_SIZE):
+        self.size = size
+        self.scores = dict(
+            heapq.nlargest(size, entries, key=lambda entry: (entry[1], -entry[0]))
+        )
+        self._heapify()
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __contains__(self, movie_id):
+        return movie_id in self.scores
+
+    def _heapify(self):
+        self._heap = [(score, -movie_id) for movie_id, score in self.scores.items()]
+        heapq.heapify(self._heap)
+
+    def _push(self, movie_id, score):
+        heapq.heappush(self._heap, (score, -movie_id))
+        if len(self._heap) > 2 * self.size:
+            self._heapify()
+
+    def _weakest(self):
+        while self._heap:
+            score, negated_id = self._heap[0]
+            if self.scores.get(-negated_id) == score:
+                return -negated_id, score
+            heapq.heappop(self._heap)
+        return None
+
+    def offer(self, movie_id, score):
+        """
+        Put ``movie_id`` in the chart with ``score`` if it makes the cut.
+        Returns whether the chart changed and the id of the movie it
+        evicted, if any.
+        """
+        if movie_id in self.scores:
+            if self.scores[movie_id] == score:
+                return False, None
+            self.scores[movie_id] = score
+            self._push(movie_id, score)
+            return True, None
+        if len(self.scores) < self.size:
+            self.scores[movie_id] = score
+            self._push(movie_id, score)
+            return True, None
+
+        weakest_id, weakest = self._weakest()
+        if (score, -movie_id) <= (weakest, -weakest_id):
+            return False, None
+        heapq.heappop(self._heap)
+        del self.scores[weakest_id]
+        self.scores[movie_id] = score
+        self._push(movie_id, score)
+        return True, weakest_id
+
+    def discard(self, movie_id):
+        """Take ``movie_id`` out of the chart; returns whether it was in."""
+        return self.scores.pop(movie_id, None) is not None
+
+    def ranked(self, limit=None):
+        """``(movie_id, score)`` best first."""
+        ranked = sorted(self.scores.items(), key=lambda entry: (-entry[1], entry[0]))
+        return ranked[:limit]
+
+
+def _score(kind, rating_avg, rating_count, reviews):
+    """A movie's score in the charts of ``kind``; ``None`` keeps it out."""
+    if kind == TOP_RATED:
+        return rating_avg if rating_count else None
+    return float(reviews) if reviews else None
+
+
+def _movie_scores(movies, kinds):
+    """
+    ``{movie_id: (scopes, {kind: score})}`` of the movies of the queryset
+    ``movies``, in two or three queries.
+    """
+    ids = movies.values("id")
+    genres = defaultdict(list)
+    for movie_id, genre_id in Movie.genres.through.objects.filter(
+        movie_id__in=ids
+    ).values_list("movie_id", "genre_id"):
+        genres[movie_id].append(genre_scope(genre_id))
+    reviews = {}
+    if MOST_REVIEWED in kinds:
+        reviews = dict(
+            Review.objects.filter(movie_id__in=ids)
+            .values("movie_id")
+            .annotate(count=Count("id"))
+            .values_list("movie_id", "count")
+            .order_by()
+        )
+
+    scored = {}
+    for movie_id, year, rating_avg, rating_count in movies.values_list(
+        "id", "year", "rating_avg", "rating_count"
+    ):
+        scopes = [OVERALL, year_scope(year), *genres[movie_id]]
+        scores = {
+            kind: _score(kind, rating_avg, rating_count, reviews.get(movie_id))
+            for kind in kinds
+        }
+        scored[movie_id] = (scopes, scores)
+    return scored
+
+
+class Leaderboards:
+    """
+    Top ``CHART_SIZE`` movies of each chart, held in memory and persisted
+    to the ChartEntry table.
+
+    A chart is a kind (top rated, most reviewed) in a scope: every movie,
+    one genre or one year. Rating and review writes only ``mark`` their
+    movies. The marked movies are re-scored in one batch (``apply``) by a
+    background thread every ``CHARTS_FLUSH_INTERVAL`` seconds, or sooner
+    once ``CHARTS_BATCH_SIZE`` are pending, and before a chart is read.
+    Without the thread (an interval of 0) only reads apply them. Each
+    process writes the entries it changes to the table and reloads the
+    charts from it every ``CHARTS_RELOAD_INTERVAL`` seconds, picking up
+    the changes of the others.
+
+    Only chart members are known: a member whose score drops keeps its
+    place over movies outside the chart that now score better, until
+    those are written to again or the charts are rebuilt (``rebuild``,
+    the ``rebuild_charts`` command).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._charts = {}
+        self._pending = defaultdict(set)
+        self._loaded_at = None
+        self._wake = threading.Event()
+        self._pid = None
+        self._background = False
+
+    def clear(self):
+        with self._lock:
+            self._charts = {}
+            self._pending = defaultdict(set)
+            self._loaded_at = None
+
+    def load(self):
+        """Read every chart from the table; rebuild them if it is empty."""
+        entries = defaultdict(list)
+        for kind, scope, movie_id, score in ChartEntry.objects.values_list(
+            "kind", "scope", "movie_id", "score"
+        ):
+            entries[kind, scope].append((movie_id, score))
+        if not entries:
+            self.rebuild()
+            return
+        charts = {key: TopN(rows) for key, rows in entries.items()}
+        with self._lock:
+            self._charts = charts
+            self._loaded_at = time.monotonic()
+
+    def rebuild(self):
+        """Score every published movie again; returns the number of charts."""
+        scored = _movie_scores(Movie.objects.filter(draft=False), CHART_KINDS)
+        entries = defaultdict(list)
+        for movie_id, (scopes, scores) in scored.items():
+            for kind, score in scores.items():
+                if score is None:
+                    continue
+                for scope in scopes:
+                    entries[kind, scope].append((movie_id, score))
+        charts = {key: TopN(rows) for key, rows in entries.items()}
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {ChartEntry._meta.db_table}")
+            ChartEntry.objects.bulk_create(
+                ChartEntry(kind=kind, scope=scope, movie_id=movie_id, score=score)
+                for (kind, scope), chart in charts.items()
+                for movie_id, score in chart.scores.items()
+            )
+        with self._lock:
+            # Scored above, so nothing marked before is left to apply.
+            self._charts = charts
+            self._pending = defaultdict(set)
+            self._loaded_at = time.monotonic()
+        return len(charts)
+
+    def _refresh(self):
+        interval = getattr(settings, "CHARTS_RELOAD_INTERVAL", 60)
+        if self._loaded_at is None or (
+            interval and time.monotonic() - self._loaded_at >= interval
+        ):
+            self.load()
+
+    def mark(self, movie_ids, kinds=CHART_KINDS):
+        """
+        Note that the scores of ``movie_ids`` in ``kinds`` may have changed.
+        Runs no query: called on every rating and review write.
+        """
+        movie_ids = set(movie_ids)
+        if not movie_ids:
+            return
+        with self._lock:
+            for kind in kinds:
+                self._pending[kind] |= movie_ids
+            pending = sum(len(ids) for ids in self._pending.values())
+
+        if self._start() and pending >= getattr(settings, "CHARTS_BATCH_SIZE", 100):
+            self._wake.set()
+
+    def apply(self):
+        """Re-score the marked movies and persist the entries that changed."""
+        if not self._pending:
+            return
+        self._refresh()
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(set)
+        if not pending:
+            return
+
+        movie_ids = set().union(*pending.values())
+        try:
+            scored = _movie_scores(
+                Movie.objects.filter(id__in=movie_ids, draft=False), list(pending)
+            )
+        except BaseException:
+            # Keep the marks for the next attempt.
+            with self._lock:
+                for kind, kind_ids in pending.items():
+                    self._pending[kind] |= kind_ids
+            raise
+        changed = set()
+        with self._lock:
+            for kind, kind_ids in pending.items():
+                for movie_id in kind_ids:
+                    scopes, scores = scored.get(movie_id, ((), {}))
+                    changed |= self._update(kind, movie_id, scopes, scores.get(kind))
+            entries = {
+                key: self._charts[key[:2]].scores.get(key[2])
+                for key in changed
+                if (key[0], key[1]) in self._charts
+            }
+        _persist(entries)
+
+    def _update(self, kind, movie_id, scopes, score):
+        """Move one movie within the charts of ``kind``; the changed entries."""
+        changed = set()
+        for (chart_kind, scope), chart in self._charts.items():
+            if chart_kind != kind or (score is not None and scope in scopes):
+                continue
+            # Deleted, unpublished, unrated, or moved to another genre or year.
+            if chart.discard(movie_id):
+                changed.add((kind, scope, movie_id))
+        if score is None:
+            return changed
+        for scope in scopes:
+            chart = self._charts.setdefault((kind, scope), TopN())
+            updated, evicted = chart.offer(movie_id, score)
+            if updated:
+                changed.add((kind, scope, movie_id))
+            if evicted is not None:
+                changed.add((kind, scope, evicted))
+        return changed
+
+    def top(self, kind, scope, limit=DEFAULT_CHART_LIMIT):
+        """The first ``limit`` ``(movie_id, score)`` of a chart."""
+        self._refresh()
+        self.apply()
+        with self._lock:
+            chart = self._charts.get((kind, scope))
+            return chart.ranked(clamp_chart_limit(limit)) if chart else []
+
+    def _start(self):
+        """Start this process's flusher once; False when there is none."""
+        if self._pid == os.getpid():
+            return self._background
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker inherits the charts but not the thread.
+                self._pid = os.getpid()
+                self._background = getattr(settings, "CHARTS_FLUSH_INTERVAL", 1.0) > 0
+                if self._background:
+                    threading.Thread(
+                        target=self._run, name="charts-flush", daemon=True
+                    ).start()
+        return self._background
+
+    def _run(self):
+        while True:
+            self._wake.wait(getattr(settings, "CHARTS_FLUSH_INTERVAL", 1.0))
+            self._wake.clear()
+            try:
+                self.apply()
+            except Exception:
+                logger.exception("Updating the charts failed")
+            finally:
+                close_old_connections()
+
+
+def _persist(entries):
+    """Write ``{(kind, scope, movie_id): score}``; ``None`` removes the entry."""
+    removed = Q()
+    kept = []
+    for (kind, scope, movie_id), score in entries.items():
+        if score is None:
+            removed |= Q(kind=kind, scope=scope, movie_id=movie_id)
+        else:
+            kept.append(
+                ChartEntry(kind=kind, scope=scope, movie_id=movie_id, score=score)
+            )
+    with transaction.atomic():
+        if removed:
+            ChartEntry.objects.filter(removed).delete()
+        if kept:
+            ChartEntry.objects.bulk_create(
+                kept,
+                update_conflicts=True,
+                unique_fields=["kind", "scope", "movie"],
+                update_fields=["score"],
+            )
+
+
+leaderboards = Leaderboards()
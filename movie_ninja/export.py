@@ -0,0 +1,119 @@
+from itertools import chain, islice
+
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+
+from ninja_api.renderers import FastJSONRenderer
+
+from .models import Actor, Genre, Movie, MovieDeletion
+
+
+EXPORT_CHUNK_SIZE = 2000
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+# When the export started: the ``since`` of the next incremental pull.
+EXPORT_STARTED_HEADER = "X-Export-Started-At"
+
+
+def export_queryset(since=None):
+    """Published movies, oldest id first, changed at or after ``since``"""
+    movies = (
+        Movie.objects.filter(draft=False)
+        .select_related("category")
+        .prefetch_related(
+            Prefetch("genres", queryset=Genre.objects.only("id", "name")),
+            Prefetch("actors", queryset=Actor.objects.only("id")),
+            Prefetch("directors", queryset=Actor.objects.only("id")),
+        )
+        .order_by("id")
+    )
+    if since is not None:
+        movies = movies.filter(updated_at__gte=since)
+    return movies
+
+
+def export_row(movie):
+    return {
+        "id": movie.id,
+        "title": movie.title,
+        "tagline": movie.tagline,
+        "description": movie.description,
+        "poster": movie.poster,
+        "year": movie.year,
+        "country": movie.country,
+        "world_premiere": movie.world_premiere,
+        "budget": movie.budget,
+        "fees_in_usa": movie.fees_in_usa,
+        "fees_in_world": movie.fess_in_world,
+        "category": movie.category.name if movie.category else None,
+        "url": movie.url,
+        "genres": [genre.name for genre in movie.genres.all()],
+        "actors": [actor.id for actor in movie.actors.all()],
+        "directors": [director.id for director in movie.directors.all()],
+        "rating_count": movie.rating_count,
+        "rating_avg": movie.rating_avg,
+        "updated_at": movie.updated_at,
+    }
+
+
+def export_tombstones(since):
+    """
+    Rows of the movies an incremental pull must drop: unpublished ones
+    (``"draft": true``) and deleted ones (``"deleted": true``), changed at
+    or after ``since``. Drafts that were never published are listed too.
+    """
+    drafts = (
+        Movie.objects.filter(draft=True, updated_at__gte=since)
+        .order_by("id")
+        .values_list("id", "updated_at")
+    )
+    for movie_id, updated_at in drafts.iterator():
+        yield {"id": movie_id, "draft": True, "updated_at": updated_at}
+    deletions = (
+        MovieDeletion.objects.filter(deleted_at__gte=since)
+        .order_by("movie_id")
+        .values_list("movie_id", "deleted_at")
+    )
+    for movie_id, deleted_at in deletions.iterator():
+        yield {"id": movie_id, "deleted": True, "updated_at": deleted_at}
+
+
+def export_lines(since=None, chunk_size=None):
+    """
+    NDJSON lines of the catalog export, one movie per line, followed by the
+    ``export_tombstones`` of an incremental (``since``) export.
+
+    Rows are fetched ``chunk_size`` (``EXPORT_CHUNK_SIZE``) movies at a time
+    from a server-side cursor where the database has them, each chunk with
+    its own prefetch queries, so memory use does not grow with the catalog.
+    """
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    encode = FastJSONRenderer().encode
+    rows = (
+        export_row(movie)
+        for movie in export_queryset(since).iterator(chunk_size=chunk_size)
+    )
+    if since is not None:
+        rows = chain(rows, export_tombstones(since))
+    for row in rows:
+        line = encode(row)
+        if isinstance(line, str):
+            line = line.encode()
+        yield line + b"\n"
+
+
+async def aexport_lines(since=None, chunk_size=None):
+    """
+    ``export_lines`` for ASGI responses: each ``chunk_size`` lines are
+    produced in the request's sync thread and sent as one chunk, so the
+    export is never buffered whole (as Django does with a sync iterator).
+    """
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    lines = export_lines(since, chunk_size)
+    next_chunk = sync_to_async(lambda: b"".join(islice(lines, chunk_size)))
+    try:
+        while chunk := await next_chunk():
+            yield chunk
+    finally:
+        # Closes the cursor in the thread that opened it, also when the
+        # client goes away mid-export.
+        await sync_to_async(lines.close)()
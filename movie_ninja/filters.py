@@ -0,0 +1,95 @@
+from typing import List, Literal, Optional
+
+from django.db.models import Count, Q
+from ninja import Field, FilterSchema
+
+from .models import Movie
+
+
+# ``sort`` values of the movie listings and their keyset orderings. Each
+# ends with id so ties keep a stable order, and has a matching index on Movie.
+MOVIE_SORTS = {
+    "id": ("id",),
+    "-rating": ("-rating_avg", "id"),
+    "-fess_in_world": ("-fess_in_world", "id"),
+    "-budget": ("-budget", "id"),
+    "world_premiere": ("world_premiere", "id"),
+}
+DEFAULT_SORT = "id"
+MovieSort = Literal["id", "-rating", "-fess_in_world", "-budget", "world_premiere"]
+
+
+def sort_fields(sort):
+    """Columns besides id the rows must carry for the cursor of ``sort``."""
+    return [field.lstrip("-") for field in MOVIE_SORTS[sort][:-1]]
+
+
+def sort_scope(sort):
+    """Cursor scope of ``sort``; default-sort cursors stay unscoped."""
+    return None if sort == DEFAULT_SORT else sort
+
+
+class MovieFilterSchema(FilterSchema):
+    """
+    Query parameters of the movie listings. Several ``genres`` slugs match
+    movies in any of them; the other filters must all hold. Drafts are
+    left out unless ``draft=true``.
+    """
+
+    genres: Optional[List[str]] = None
+    year_min: Optional[int] = Field(None, q="year__gte")
+    year_max: Optional[int] = Field(None, q="year__lte")
+    country: Optional[str] = None
+    category: Optional[str] = Field(None, q="category__url")
+    draft: bool = False
+
+    def filter_genres(self, slugs):
+        if not slugs:
+            return Q()
+        # A subquery rather than a join, which would repeat a movie once per
+        # matching genre.
+        through = Movie.genres.through.objects.filter(genre__url__in=slugs)
+        return Q(id__in=through.values("movie_id"))
+
+    def expression(self, *exclude):
+        """The filter, without the fields named in ``exclude``."""
+        q = Q()
+        for name, field in self.__fields__.items():
+            value = getattr(self, name)
+            if name in exclude or value is None:
+                continue
+            q &= self._resolve_field_expression(name, value, field)
+        return q
+
+
+def movie_facets(filters):
+    """
+    Movie counts per genre and per year, one grouped query each.
+
+    Each facet is counted under every filter but its own, so the counts of
+    the other genres (or years) stay visible once one is selected.
+    """
+    genre_movies = Movie.objects.filter(filters.expression("genres"))
+    genres = (
+        Movie.genres.through.objects.filter(movie__in=genre_movies.values("id"))
+        .values("genre__url", "genre__name")
+        .annotate(count=Count("movie_id"))
+        .order_by("-count", "genre__name")
+    )
+    years = (
+        Movie.objects.filter(filters.expression("year_min", "year_max"))
+        .values("year")
+        .annotate(count=Count("id"))
+        .order_by("-year")
+    )
+    return {
+        "genres": [
+            {
+                "slug": row["genre__url"],
+                "name": row["genre__name"],
+                "count": row["count"],
+            }
+            for row in genres
+        ],
+        "years": list(years),
+    }
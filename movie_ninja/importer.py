@@ -0,0 +1,206 @@
+import csv
+import json
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from pydantic import ValidationError
+
+from ninja_api.response_cache import invalidate
+
+from .models import Actor, Category, Genre, Movie
+from .schemas import MovieImportSchema
+from .search import index_movies
+from .suggest import MOVIE, suggest_index
+
+
+IMPORT_CHUNK_SIZE = 1000
+# Separator of the directors, actors and genres values in CSV files.
+CSV_LIST_SEPARATOR = "|"
+CSV_LIST_FIELDS = ("directors", "actors", "genres")
+
+
+class ImportFormatError(ValueError):
+    """Входной поток не удалось разобрать"""
+
+
+def read_json(stream):
+    try:
+        rows = json.load(stream)
+    except ValueError as e:
+        raise ImportFormatError(f"Invalid JSON: {e}")
+    if not isinstance(rows, list):
+        raise ImportFormatError("Expected a JSON array of movies")
+    return rows
+
+
+def read_ndjson(stream):
+    """Rows of a JSON-lines stream; a line that is not JSON becomes an error row"""
+    for number, line in enumerate(stream, 1):
+        if isinstance(line, bytes):
+            line = line.decode()
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ImportFormatError(f"Invalid JSON on line {number}: {e}")
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        for field in CSV_LIST_FIELDS:
+            value = (row.get(field) or "").strip()
+            row[field] = value.split(CSV_LIST_SEPARATOR) if value else []
+        yield {field: value for field, value in row.items() if value != ""}
+
+
+READERS = {"json": read_json, "ndjson": read_ndjson, "csv": read_csv}
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _error(number, row, messages):
+    url = row.get("url") if isinstance(row, dict) else None
+    return {"row": number, "url": url, "errors": messages}
+
+
+def _validation_messages(error):
+    return [
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+        for item in error.errors()
+    ]
+
+
+def _resolve(chunk):
+    """Categories, genres, actors and taken urls of a chunk, one query each"""
+    slugs = {row.category for _, row in chunk if row.category}
+    genre_slugs = {slug for _, row in chunk for slug in row.genres}
+    actor_ids = {
+        actor_id for _, row in chunk for actor_id in row.actors + row.directors
+    }
+    urls = [row.url for _, row in chunk]
+    return (
+        dict(Category.objects.filter(url__in=slugs).values_list("url", "id")),
+        dict(Genre.objects.filter(url__in=genre_slugs).values_list("url", "id")),
+        set(Actor.objects.filter(id__in=actor_ids).values_list("id", flat=True)),
+        set(Movie.objects.filter(url__in=urls).values_list("url", flat=True)),
+    )
+
+
+def _movie(row, category_id):
+    fields = row.dict(exclude={"directors", "actors", "genres", "category"})
+    if fields["world_premiere"] is None:
+        del fields["world_premiere"]
+    return Movie(category_id=category_id, **fields)
+
+
+def _relations(movie, row, genre_ids):
+    actors = [
+        Movie.actors.through(movie_id=movie.id, actor_id=actor_id)
+        for actor_id in dict.fromkeys(row.actors)
+    ]
+    directors = [
+        Movie.directors.through(movie_id=movie.id, actor_id=actor_id)
+        for actor_id in dict.fromkeys(row.directors)
+    ]
+    genres = [
+        Movie.genres.through(movie_id=movie.id, genre_id=genre_ids[slug])
+        for slug in dict.fromkeys(row.genres)
+    ]
+    return actors, directors, genres
+
+
+def _insert(movies, rows, genre_ids):
+    with transaction.atomic():
+        movies = Movie.objects.bulk_create(movies)
+        cast, crew, tags = [], [], []
+        for movie, row in zip(movies, rows):
+            actors, directors, genres = _relations(movie, row, genre_ids)
+            cast += actors
+            crew += directors
+            tags += genres
+        Movie.actors.through.objects.bulk_create(cast)
+        Movie.directors.through.objects.bulk_create(crew)
+        Movie.genres.through.objects.bulk_create(tags)
+        # bulk_create sends no post_save or m2m_changed
+        index_movies(movie.id for movie in movies)
+        for movie in movies:
+            if not movie.draft:
+                suggest_index.put(MOVIE, movie.id, movie.title)
+
+
+def _import_chunk(chunk, seen_urls, errors):
+    valid = []
+    for number, raw in chunk:
+        if isinstance(raw, ImportFormatError):
+            errors.append(_error(number, None, [str(raw)]))
+            continue
+        try:
+            valid.append((number, MovieImportSchema.parse_obj(raw)))
+        except ValidationError as e:
+            errors.append(_error(number, raw, _validation_messages(e)))
+
+    categories, genres, actors, taken = _resolve(valid)
+    accepted = []
+    for number, row in valid:
+        messages = []
+        if row.url in taken or row.url in seen_urls:
+            messages.append(f"url: movie '{row.url}' already exists")
+        if row.category and row.category not in categories:
+            messages.append(f"category: unknown slug '{row.category}'")
+        messages += [
+            f"genres: unknown slug '{slug}'"
+            for slug in row.genres
+            if slug not in genres
+        ]
+        messages += [
+            f"actors: unknown id {actor_id}"
+            for actor_id in sorted(set(row.actors + row.directors) - actors)
+        ]
+        if messages:
+            errors.append(_error(number, row.dict(), messages))
+            continue
+        seen_urls.add(row.url)
+        accepted.append((number, row))
+
+    rows = [row for _, row in accepted]
+    movies = [_movie(row, categories.get(row.category)) for row in rows]
+    try:
+        _insert(movies, rows, genres)
+        return len(movies)
+    except IntegrityError:
+        pass
+
+    # Someone inserted a conflicting row meanwhile: find it row by row.
+    created = 0
+    for (number, row), movie in zip(accepted, movies):
+        try:
+            _insert([movie], [row], genres)
+            created += 1
+        except IntegrityError as e:
+            errors.append(_error(number, row.dict(), [str(e)]))
+    return created
+
+
+def import_movies(rows, chunk_size=None):
+    """
+    Validate and insert movie rows (dicts shaped like ``MovieImportSchema``).
+
+    Rows are consumed lazily, ``chunk_size`` (``IMPORT_CHUNK_SIZE``) at a
+    time. Each chunk resolves its category and genre slugs, actor ids and
+    taken urls with one query per kind, then inserts the movies and their
+    through rows with ``bulk_create`` in one transaction. Invalid rows are
+    reported by their 1-based position and skipped; the others are kept.
+    Returns ``{"created": ..., "errors": [...]}``.
+    """
+    created, errors, seen_urls = 0, [], set()
+    numbered = enumerate(rows, 1)
+    for chunk in _chunks(numbered, chunk_size or IMPORT_CHUNK_SIZE):
+        created += _import_chunk(chunk, seen_urls, errors)
+        # bulk_create sends no post_save
+        invalidate("movies")
+    return {"created": created, "errors": errors}
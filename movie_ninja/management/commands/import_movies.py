@@ -0,0 +1,69 @@
+import codecs
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movie_ninja.importer import (
+    IMPORT_CHUNK_SIZE,
+    READERS,
+    ImportFormatError,
+    import_movies,
+)
+
+
+EXTENSIONS = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+
+
+class Command(BaseCommand):
+    help = "Import movies from a JSON, JSON lines or CSV file ('-' for stdin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            help="Input format (default: from the file extension)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=IMPORT_CHUNK_SIZE,
+            help=f"Rows validated and inserted together (default: {IMPORT_CHUNK_SIZE})",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        input_format = options["format"]
+        if input_format is None:
+            input_format = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if input_format is None:
+            raise CommandError("Cannot tell the format from the path, use --format")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        if path == "-":
+            stream = codecs.getreader("utf-8")(sys.stdin.buffer)
+        else:
+            try:
+                stream = open(path, encoding="utf-8", newline="")
+            except OSError as e:
+                raise CommandError(e)
+
+        with stream:
+            try:
+                result = import_movies(
+                    READERS[input_format](stream), chunk_size=options["chunk_size"]
+                )
+            except ImportFormatError as e:
+                raise CommandError(e)
+
+        for error in result["errors"]:
+            url = f" ({error['url']})" if error["url"] else ""
+            self.stderr.write(f"row {error['row']}{url}: {'; '.join(error['errors'])}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result['created']} movies, "
+                f"{len(result['errors'])} rows rejected"
+            )
+        )
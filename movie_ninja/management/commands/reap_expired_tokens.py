@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auth_jwt.jwt import TokenHandler
+
+
+class Command(BaseCommand):
+    help = "Delete tokens whose refresh token has expired, in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows deleted per statement (default: 1000)",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="Seconds to pause between batches (default: 0.1)",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        if options["sleep"] < 0:
+            raise CommandError("--sleep must not be negative")
+
+        deleted, elapsed = TokenHandler.delete_expired_tokens(
+            batch_size=options["batch_size"], sleep=options["sleep"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Removed {deleted} expired tokens in {elapsed:.2f}s")
+        )
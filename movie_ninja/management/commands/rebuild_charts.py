@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from movie_ninja.charts import leaderboards
+
+
+class Command(BaseCommand):
+    help = "Recompute the top rated and most reviewed charts from the database"
+
+    def handle(self, *args, **options):
+        charts = leaderboards.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {charts} charts"))
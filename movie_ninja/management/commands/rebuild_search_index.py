@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from movie_ninja.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text movie search index from the database"
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} movies"))
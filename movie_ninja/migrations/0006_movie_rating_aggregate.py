@@ -0,0 +1,47 @@
+# Generated by Django 4.2.6 on 2026-10-18 13:27
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_rating_aggregate(apps, schema_editor):
+    Movie = apps.get_model("movie_ninja", "Movie")
+    Rating = apps.get_model("movie_ninja", "Rating")
+
+    totals = (
+        Rating.objects.values("movie_id")
+        .annotate(count=Count("id"), total=Sum("star__value"))
+        .order_by()
+    )
+    for row in totals:
+        Movie.objects.filter(id=row["movie_id"]).update(
+            rating_count=row["count"],
+            rating_sum=row["total"],
+            rating_avg=row["total"] / row["count"],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_ninja', '0005_alter_movie_poster_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='rating_avg',
+            field=models.FloatField(default=0, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_sum',
+            field=models.IntegerField(default=0, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_rating_aggregate, migrations.RunPython.noop),
+    ]
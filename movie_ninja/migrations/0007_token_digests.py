@@ -0,0 +1,62 @@
+# Generated by Django 4.2.6 on 2026-10-18 13:58
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def _digest(token):
+    if not token:
+        return None
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def fill_token_digests(apps, schema_editor):
+    Token = apps.get_model("movie_ninja", "Token")
+
+    tokens = Token.objects.only("id", "access_token", "refresh_token")
+    for token in tokens.iterator():
+        token.access_token_digest = _digest(token.access_token)
+        token.refresh_token_digest = _digest(token.refresh_token)
+        token.save(update_fields=["access_token_digest", "refresh_token_digest"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_ninja', '0006_movie_rating_aggregate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='token',
+            name='access_token',
+            field=models.TextField(),
+        ),
+        migrations.AlterField(
+            model_name='token',
+            name='refresh_token',
+            field=models.TextField(),
+        ),
+        migrations.AddField(
+            model_name='token',
+            name='access_token_digest',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='token',
+            name='refresh_token_digest',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_token_digests, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='token',
+            name='access_token_digest',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='token',
+            name='refresh_token_digest',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.6 on 2026-10-18 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("movie_ninja", "0007_token_digests"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="movie",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, verbose_name="Изменен"
+            ),
+        ),
+    ]
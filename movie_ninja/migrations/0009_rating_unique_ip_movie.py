@@ -0,0 +1,52 @@
+# Generated by Django 4.2.6 on 2026-10-18 14:40
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def drop_duplicate_ratings(apps, schema_editor):
+    """Keep the latest vote of each (ip, movie) and recount the aggregates."""
+    Movie = apps.get_model("movie_ninja", "Movie")
+    Rating = apps.get_model("movie_ninja", "Rating")
+
+    duplicated = (
+        Rating.objects.values("ip", "movie_id")
+        .annotate(count=Count("id"), last=Max("id"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    movie_ids = set()
+    for row in duplicated:
+        Rating.objects.filter(ip=row["ip"], movie_id=row["movie_id"]).exclude(
+            id=row["last"]
+        ).delete()
+        movie_ids.add(row["movie_id"])
+
+    totals = (
+        Rating.objects.filter(movie_id__in=movie_ids)
+        .values("movie_id")
+        .annotate(count=Count("id"), total=Sum("star__value"))
+        .order_by()
+    )
+    for row in totals:
+        Movie.objects.filter(id=row["movie_id"]).update(
+            rating_count=row["count"],
+            rating_sum=row["total"],
+            rating_avg=row["total"] / row["count"],
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("movie_ninja", "0008_movie_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_ratings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="rating",
+            constraint=models.UniqueConstraint(
+                fields=("ip", "movie"), name="unique_rating_ip_movie"
+            ),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:05
+
+import unicodedata
+from itertools import chain
+
+from django.db import migrations
+from django.utils.html import strip_tags
+
+
+# Full-text index of the catalog, see movie_ninja.search.
+CREATE_INDEX = {
+    "sqlite": [
+        """
+        CREATE VIRTUAL TABLE movie_ninja_moviesearch USING fts5(
+            title, tagline, description, actors, genres,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+        """,
+    ],
+    "postgresql": [
+        """
+        CREATE TABLE movie_ninja_moviesearch (
+            movie_id bigint PRIMARY KEY
+                REFERENCES movie_ninja_movie (id) ON DELETE CASCADE,
+            document tsvector NOT NULL
+        )
+        """,
+        "CREATE INDEX movie_ninja_moviesearch_document "
+        "ON movie_ninja_moviesearch USING gin (document)",
+    ],
+}
+
+INSERT_DOCUMENT = {
+    "sqlite": "INSERT INTO movie_ninja_moviesearch "
+    "(rowid, title, tagline, description, actors, genres) "
+    "VALUES (%s, %s, %s, %s, %s, %s)",
+    "postgresql": "INSERT INTO movie_ninja_moviesearch (movie_id, document) "
+    "VALUES (%s, "
+    + " || ".join(
+        f"setweight(to_tsvector('simple', %s), '{weight}')" for weight in "ABDBC"
+    )
+    + ")",
+}
+
+
+def fold(text):
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_INDEX:
+        raise NotImplementedError(f"No movie search index for {vendor}")
+    for statement in CREATE_INDEX[vendor]:
+        schema_editor.execute(statement)
+
+    Movie = apps.get_model("movie_ninja", "Movie")
+    movies = Movie.objects.prefetch_related("actors", "directors", "genres")
+    documents = [
+        (
+            movie.id,
+            fold(movie.title),
+            fold(movie.tagline),
+            fold(strip_tags(movie.description)),
+            fold(
+                " ".join(
+                    actor.name
+                    for actor in chain(movie.actors.all(), movie.directors.all())
+                )
+            ),
+            fold(" ".join(genre.name for genre in movie.genres.all())),
+        )
+        for movie in movies.iterator(chunk_size=500)
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(INSERT_DOCUMENT[vendor], documents)
+
+
+def drop_index(apps, schema_editor):
+    schema_editor.execute("DROP TABLE IF EXISTS movie_ninja_moviesearch")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("movie_ninja", "0009_rating_unique_ip_movie"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
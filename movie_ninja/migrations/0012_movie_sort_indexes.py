@@ -0,0 +1,34 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("movie_ninja", "0011_movie_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="movie",
+            index=models.Index(
+                fields=["-rating_avg", "id"], name="movie_rating_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="movie",
+            index=models.Index(
+                fields=["-fess_in_world", "id"], name="movie_fees_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="movie",
+            index=models.Index(fields=["-budget", "id"], name="movie_budget_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="movie",
+            index=models.Index(
+                fields=["world_premiere", "id"], name="movie_premiere_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.6 on 2026-10-18 16:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("movie_ninja", "0012_movie_sort_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChartEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("kind", models.CharField(max_length=20, verbose_name="Рейтинг")),
+                ("scope", models.CharField(max_length=40, verbose_name="Раздел")),
+                ("score", models.FloatField(verbose_name="Оценка")),
+                (
+                    "movie",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chart_entries",
+                        to="movie_ninja.movie",
+                        verbose_name="фильм",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Место в рейтинге",
+                "verbose_name_plural": "Места в рейтингах",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="chartentry",
+            constraint=models.UniqueConstraint(
+                fields=("kind", "scope", "movie"), name="unique_chart_entry"
+            ),
+        ),
+    ]
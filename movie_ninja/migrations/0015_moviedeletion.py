@@ -0,0 +1,37 @@
+# Generated by Django 4.2.6 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("movie_ninja", "0013_chartentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MovieDeletion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("movie_id", models.BigIntegerField(verbose_name="Фильм")),
+                (
+                    "deleted_at",
+                    models.DateTimeField(
+                        auto_now_add=True, db_index=True, verbose_name="Удален"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Удаленный фильм",
+                "verbose_name_plural": "Удаленные фильмы",
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("movie_ninja", "0015_moviedeletion"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["movie", "parent", "id"], name="review_movie_thread_idx"
+            ),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import hashlib
+
 from django.db import models
 from django.urls import reverse
 from datetime import date
@@ -23,11 +25,35 @@ class CustomUser(AbstractUser):
 
 class Token(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
-    access_token = models.CharField(max_length=200)
+    access_token = models.TextField()
+    access_token_digest = models.CharField(
+        max_length=64, unique=True, null=True, editable=False
+    )
     access_token_expires_at = models.DateTimeField(default=datetime.now(timezone.utc))
-    refresh_token = models.CharField(max_length=200)
+    refresh_token = models.TextField()
+    refresh_token_digest = models.CharField(
+        max_length=64, unique=True, null=True, editable=False
+    )
     refresh_token_expires_at = models.DateTimeField(default=datetime.now(timezone.utc))
 
+    @staticmethod
+    def digest(token):
+        """Fixed-length SHA-256 hex digest used to look tokens up by index"""
+        if not token:
+            return None
+        return hashlib.sha256(str(token).encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.access_token_digest = self.digest(self.access_token)
+        self.refresh_token_digest = self.digest(self.refresh_token)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | {
+                "access_token_digest",
+                "refresh_token_digest",
+            }
+        super().save(*args, **kwargs)
+
 
 class Category(models.Model):
     """Категории"""
@@ -109,6 +135,10 @@ class Movie(models.Model):
     )
     url = models.SlugField(max_length=130, unique=True)
     draft = models.BooleanField("Черновик", default=False)
+    rating_count = models.PositiveIntegerField("Количество оценок", default=0)
+    rating_sum = models.IntegerField("Сумма оценок", default=0)
+    rating_avg = models.FloatField("Средняя оценка", default=0)
+    updated_at = models.DateTimeField("Изменен", auto_now=True, db_index=True)
 
     def __str__(self):
         return self.title
@@ -122,6 +152,33 @@ class Movie(models.Model):
     class Meta:
         verbose_name = "Фильм"
         verbose_name_plural = "Фильмы"
+        # Filters of the movie listings (movie_ninja.filters).
+        indexes = [
+            models.Index(fields=["year"], name="movie_year_idx"),
+            models.Index(fields=["country"], name="movie_country_idx"),
+            models.Index(fields=["draft"], name="movie_draft_idx"),
+            # Sorted listings (filters.MOVIE_SORTS): keyset pages on
+            # (column, id) in the listing's direction.
+            models.Index(fields=["-rating_avg", "id"], name="movie_rating_id_idx"),
+            models.Index(fields=["-fess_in_world", "id"], name="movie_fees_id_idx"),
+            models.Index(fields=["-budget", "id"], name="movie_budget_id_idx"),
+            models.Index(fields=["world_premiere", "id"], name="movie_premiere_id_idx"),
+        ]
+
+
+class MovieDeletion(models.Model):
+    """Удаленный фильм"""
+
+    # Not a foreign key: the movie is gone.
+    movie_id = models.BigIntegerField("Фильм")
+    deleted_at = models.DateTimeField("Удален", auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.movie_id}"
+
+    class Meta:
+        verbose_name = "Удаленный фильм"
+        verbose_name_plural = "Удаленные фильмы"
 
 
 class MovieShots(models.Model):
@@ -171,6 +228,13 @@ class Rating(models.Model):
     class Meta:
         verbose_name = "Рейтинг"
         verbose_name_plural = "Рейтинги"
+        # Movie.rating_* are kept up to date by movie_ninja.ratings for
+        # votes, and by the Rating signals for other saves and deletes.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ip", "movie"], name="unique_rating_ip_movie"
+            ),
+        ]
 
 
 class Review(models.Model):
@@ -197,3 +261,37 @@ class Review(models.Model):
     class Meta:
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+        indexes = [
+            # Keyset pages of a movie's top-level reviews (parent IS NULL).
+            models.Index(
+                fields=["movie", "parent", "id"], name="review_movie_thread_idx"
+            ),
+        ]
+
+
+class ChartEntry(models.Model):
+    """Место фильма в рейтинге"""
+
+    kind = models.CharField("Рейтинг", max_length=20)
+    scope = models.CharField("Раздел", max_length=40)
+    movie = models.ForeignKey(
+        Movie,
+        on_delete=models.CASCADE,
+        verbose_name="фильм",
+        related_name="chart_entries",
+    )
+    score = models.FloatField("Оценка")
+
+    def __str__(self):
+        return f"{self.kind} {self.scope} - {self.movie}"
+
+    class Meta:
+        verbose_name = "Место в рейтинге"
+        verbose_name_plural = "Места в рейтингах"
+        # The in-memory charts of movie_ninja.charts, persisted; a chart
+        # holds at most charts.CHART_SIZE movies.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "scope", "movie"], name="unique_chart_entry"
+            ),
+        ]
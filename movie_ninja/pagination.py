@@ -0,0 +1,102 @@
+import base64
+import json
+
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    """Курсор не удалось разобрать"""
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor(cursor)
+    return values
+
+
+def clamp_limit(limit):
+    return max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+def _keyset_filter(ordering, values):
+    """
+    Row-value comparison ``(f1, f2, ...) > (v1, v2, ...)`` spelled out as
+    ``f1 > v1 OR (f1 = v1 AND f2 > v2) ...`` so it works on every backend
+    and can use a composite index on the ordering columns.
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        condition |= equal & Q(**{f"{name}__{lookup}": value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def _row_value(row, name):
+    if isinstance(row, dict):
+        return row[name]
+    return getattr(row, name)
+
+
+def _keyset_slice(queryset, ordering, after, limit, scope):
+    queryset = queryset.order_by(*ordering)
+    if after:
+        values = decode_cursor(after, len(ordering) + (scope is not None))
+        if scope is not None and values.pop(0) != scope:
+            raise InvalidCursor(after)
+        queryset = queryset.filter(_keyset_filter(ordering, values))
+    return queryset[: limit + 1]
+
+
+def _keyset_page(rows, ordering, limit, scope):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        values = [_row_value(last, field.lstrip("-")) for field in ordering]
+        next_cursor = encode_cursor(values if scope is None else [scope, *values])
+    return rows, next_cursor
+
+
+def paginate_keyset(
+    queryset, ordering, after=None, limit=DEFAULT_PAGE_SIZE, scope=None
+):
+    """
+    Keyset (cursor) pagination over ``queryset`` ordered by ``ordering``.
+
+    The last field of ``ordering`` must be unique (normally ``id``) so the
+    order is total. A ``scope`` (such as the name of the requested sort) is
+    stored in the cursor, and cursors of another scope are rejected.
+    Returns the page rows and the opaque cursor of the next page, or
+    ``None`` when this is the last one. Raises ``InvalidCursor``.
+    """
+    limit = clamp_limit(limit)
+    rows = list(_keyset_slice(queryset, ordering, after, limit, scope))
+    return _keyset_page(rows, ordering, limit, scope)
+
+
+async def apaginate_keyset(
+    queryset, ordering, after=None, limit=DEFAULT_PAGE_SIZE, scope=None
+):
+    """Async version of ``paginate_keyset``."""
+    limit = clamp_limit(limit)
+    rows = [row async for row in _keyset_slice(queryset, ordering, after, limit, scope)]
+    return _keyset_page(rows, ordering, limit, scope)
@@ -0,0 +1,303 @@
+import atexit
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from ninja_api.response_cache import invalidate
+
+from .charts import TOP_RATED, leaderboards
+from .models import Movie, Rating, RatingStar
+
+
+logger = logging.getLogger(__name__)
+
+_star_values = None
+
+
+def client_ip(request):
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def star_values():
+    """``{RatingStar id: value}``, loaded once per process."""
+    global _star_values
+    if _star_values is None:
+        _star_values = dict(RatingStar.objects.values_list("id", "value"))
+    return _star_values
+
+
+def clear_star_values():
+    global _star_values
+    _star_values = None
+
+
+MOVIE_TABLE = Movie._meta.db_table
+RATING_TABLE = Rating._meta.db_table
+STAR_TABLE = RatingStar._meta.db_table
+
+# Adds the ``added`` votes worth ``delta`` stars of each row of a subquery to
+# its movie's rating aggregate (UPDATE ... FROM needs SQLite 3.33).
+ADJUST_SQL = (
+    f"UPDATE {MOVIE_TABLE} SET "
+    "rating_count = rating_count + d.added, "
+    "rating_sum = rating_sum + d.delta, "
+    "rating_avg = CASE WHEN rating_count + d.added > 0 "
+    "THEN (rating_sum + d.delta) * 1.0 / (rating_count + d.added) ELSE 0 END, "
+    "updated_at = %s "
+    f"FROM ({{changes}}) d WHERE {MOVIE_TABLE}.id = d.movie_id"
+)
+
+# What storing the vote of an ip will change, read before it is stored.
+VOTE_CHANGE = (
+    "SELECT m.id AS movie_id, "
+    "CASE WHEN r.id IS NULL THEN 1 ELSE 0 END AS added, "
+    "s.value - COALESCE(o.value, 0) AS delta "
+    f"FROM {MOVIE_TABLE} m JOIN {STAR_TABLE} s ON s.id = %s "
+    f"LEFT JOIN {RATING_TABLE} r ON r.movie_id = m.id AND r.ip = %s "
+    f"LEFT JOIN {STAR_TABLE} o ON o.id = r.star_id "
+    "WHERE m.id = %s"
+)
+
+GIVEN_CHANGE = "SELECT %s AS movie_id, %s AS added, %s AS delta"
+
+UPSERT_SQL = (
+    f"INSERT INTO {RATING_TABLE} (ip, star_id, movie_id) VALUES (%s, %s, %s) "
+    "ON CONFLICT (ip, movie_id) DO UPDATE SET star_id = excluded.star_id"
+)
+
+
+def _now():
+    return connection.ops.adapt_datetimefield_value(timezone.now())
+
+
+def _lock_movies(cursor, movie_ids):
+    """
+    Lock the rows of ``movie_ids`` until the end of the transaction and
+    return the ids that exist. On SQLite this is a write, so the database
+    lock is taken before anything is read (RETURNING needs SQLite 3.35).
+    """
+    placeholders = ", ".join(["%s"] * len(movie_ids))
+    if connection.vendor == "postgresql":
+        sql = (
+            f"SELECT id FROM {MOVIE_TABLE} WHERE id IN ({placeholders}) "
+            "ORDER BY id FOR UPDATE"
+        )
+    else:
+        sql = (
+            f"UPDATE {MOVIE_TABLE} SET updated_at = updated_at "
+            f"WHERE id IN ({placeholders}) RETURNING id"
+        )
+    cursor.execute(sql, list(movie_ids))
+    return {movie_id for movie_id, in cursor.fetchall()}
+
+
+def upsert_vote(ip, movie_id, star_id):
+    """
+    Store a vote and add it to the movie's rating aggregate.
+
+    One UPDATE adds the change the vote makes (a new vote, or the
+    difference to the ip's previous star) to the movie's aggregate, then
+    an ``INSERT ... ON CONFLICT DO UPDATE`` stores it, in one transaction.
+    The UPDATE comes first, so it holds the write lock of SQLite (the row
+    lock of the movie, taken beforehand, on PostgreSQL) while it reads the
+    previous vote. Returns whether the movie and the star exist.
+
+    It is not one statement: SQLite cannot write two tables in a statement
+    without triggers, and a PostgreSQL data-modifying CTE would read the
+    previous vote from the snapshot taken before it waits for the movie's
+    row lock, so concurrent first votes of an ip would both be counted.
+    """
+    with transaction.atomic(savepoint=False), connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            _lock_movies(cursor, [movie_id])
+        cursor.execute(
+            ADJUST_SQL.format(changes=VOTE_CHANGE), [_now(), star_id, ip, movie_id]
+        )
+        if not cursor.rowcount:
+            return False
+        cursor.execute(UPSERT_SQL, [ip, star_id, movie_id])
+    return True
+
+
+def adjust_ratings(changes):
+    """Add ``{movie_id: (votes, stars)}`` to the movies' rating aggregates."""
+    now = _now()
+    rows = [
+        (now, movie_id, added, delta)
+        for movie_id, (added, delta) in changes.items()
+        if added or delta
+    ]
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(ADJUST_SQL.format(changes=GIVEN_CHANGE), rows)
+
+
+def write_votes(votes):
+    """
+    Store a batch of votes, ``{(ip, movie_id): star_id}``.
+
+    In one transaction the batch's movies are locked, the previous votes
+    of its ips read, the whole batch written with a single ``bulk_create``
+    upsert on ``(ip, movie)`` and each movie's aggregate adjusted by the
+    batch's summed change. Votes for movies or stars that no longer exist
+    are dropped. Returns the number of votes stored.
+    """
+    values = star_values()
+    with transaction.atomic(savepoint=False):
+        with connection.cursor() as cursor:
+            movies = _lock_movies(cursor, {movie_id for _, movie_id in votes})
+        previous = {
+            (ip, movie_id): star_id
+            for ip, movie_id, star_id in Rating.objects.filter(
+                ip__in={ip for ip, _ in votes}, movie_id__in=movies
+            ).values_list("ip", "movie_id", "star_id")
+        }
+
+        ratings, changes = [], defaultdict(lambda: (0, 0))
+        for (ip, movie_id), star_id in votes.items():
+            if movie_id not in movies or star_id not in values:
+                logger.info("Dropped vote of %s for movie %s", ip, movie_id)
+                continue
+            ratings.append(Rating(ip=ip, movie_id=movie_id, star_id=star_id))
+            old = previous.get((ip, movie_id))
+            added, delta = changes[movie_id]
+            changes[movie_id] = (
+                added + (old is None),
+                delta + values[star_id] - values.get(old, 0),
+            )
+
+        Rating.objects.bulk_create(
+            ratings,
+            update_conflicts=True,
+            unique_fields=["ip", "movie"],
+            update_fields=["star"],
+        )
+        adjust_ratings(changes)
+    if ratings:
+        # Bulk writes send no post_save
+        invalidate("ratings")
+        leaderboards.mark({rating.movie_id for rating in ratings}, [TOP_RATED])
+    return len(ratings)
+
+
+class RatingQueue:
+    """
+    In-process write-behind buffer of votes.
+
+    Votes are keyed on ``(ip, movie_id)``, so a voter changing their mind
+    before the next flush only replaces the pending star (last write wins).
+    A background thread flushes every ``RATING_FLUSH_INTERVAL`` seconds or
+    as soon as ``RATING_BATCH_SIZE`` votes are pending; without it (an
+    interval of 0) full batches are flushed by the request that fills them.
+    Once ``RATING_QUEUE_MAX`` votes are pending, requests flush
+    synchronously until the queue drains. Pending votes are flushed at
+    interpreter exit too.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._background = False
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, ip, movie_id, star_id):
+        with self._lock:
+            # Re-inserting moves the key to the end: votes flush in the
+            # order of their latest change.
+            self._pending.pop((ip, movie_id), None)
+            self._pending[(ip, movie_id)] = star_id
+            pending = len(self._pending)
+
+        background = self._start()
+        if pending >= getattr(settings, "RATING_QUEUE_MAX", 10000):
+            self.flush()
+        elif pending >= getattr(settings, "RATING_BATCH_SIZE", 500):
+            if background:
+                self._wake.set()
+            else:
+                self.flush()
+
+    def flush(self):
+        """Write every pending vote now; returns how many were stored."""
+        with self._flush_lock:
+            with self._lock:
+                votes, self._pending = self._pending, {}
+            if not votes:
+                return 0
+            try:
+                return write_votes(votes)
+            except BaseException:
+                # Keep the batch, unless a newer vote replaced it meanwhile.
+                with self._lock:
+                    for key, star_id in votes.items():
+                        self._pending.setdefault(key, star_id)
+                raise
+
+    def _start(self):
+        """Start this process's flusher once; False when there is none."""
+        if self._pid == os.getpid():
+            return self._background
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker inherits the queue but not its thread.
+                self._pid = os.getpid()
+                self._background = getattr(settings, "RATING_FLUSH_INTERVAL", 0.5) > 0
+                if self._background:
+                    threading.Thread(
+                        target=self._run, name="rating-flush", daemon=True
+                    ).start()
+                atexit.register(self._flush_at_exit)
+        return self._background
+
+    def _run(self):
+        while True:
+            self._wake.wait(getattr(settings, "RATING_FLUSH_INTERVAL", 0.5))
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing queued votes failed")
+            finally:
+                close_old_connections()
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("%d queued votes were lost", len(self))
+
+
+rating_queue = RatingQueue()
+
+
+def rated_movie_ids(ip, movie_ids):
+    """Ids among ``movie_ids`` the given ip has voted for, in one query."""
+    if not ip or not movie_ids:
+        return set()
+    return set(
+        Rating.objects.filter(ip=ip, movie_id__in=movie_ids).values_list(
+            "movie_id", flat=True
+        )
+    )
+
+
+async def arated_movie_ids(ip, movie_ids):
+    """Async version of ``rated_movie_ids``."""
+    if not ip or not movie_ids:
+        return set()
+    return {
+        movie_id
+        async for movie_id in Rating.objects.filter(
+            ip=ip, movie_id__in=movie_ids
+        ).values_list("movie_id", flat=True)
+    }
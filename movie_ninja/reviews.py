@@ -0,0 +1,184 @@
+from django.db.models.expressions import RawSQL
+
+from .models import Review
+from .pagination import (
+    DEFAULT_PAGE_SIZE,
+    InvalidCursor,
+    clamp_limit,
+    decode_cursor,
+    encode_cursor,
+)
+
+# Deeper threads are cut (with ``more_replies``) even when no ``max_depth``
+# is requested: the recursive response schema cannot validate them.
+MAX_THREAD_DEPTH = 50
+
+# GET /movies/{id} embeds the first page of threads, cut to this many levels
+# and replies per review; the reviews endpoints page through the rest.
+DETAIL_THREAD_DEPTH = 3
+DETAIL_THREAD_CHILDREN = 5
+
+# Ids of the reviews of ``{anchor}`` (depth 1) and of their replies, down
+# to the depth given as the last parameter.
+THREAD_SQL = """
+WITH RECURSIVE thread (id, depth) AS (
+    {anchor}
+    UNION ALL
+    SELECT reply.id, thread.depth + 1
+    FROM {table} reply JOIN thread ON reply.parent_id = thread.id
+    WHERE thread.depth < %s AND reply.id <> reply.parent_id
+)
+SELECT id FROM thread
+"""
+# The direct replies to a review.
+REPLIES_ANCHOR = "SELECT id, 1 FROM {table} WHERE parent_id = %s AND id <> parent_id"
+# A keyset page of a movie's top-level reviews: movie id, after id, limit.
+ROOTS_ANCHOR = """SELECT id, 1 FROM (
+        SELECT id FROM {table}
+        WHERE movie_id = %s AND parent_id IS NULL AND id > %s
+        ORDER BY id LIMIT %s
+    ) roots"""
+
+
+def index_reviews(reviews):
+    """
+    Assemble threaded reviews in a single pass.
+
+    ``reviews`` are rows of one movie (model instances or ``.values()``
+    dicts) with ``id``, ``parent_id``, ``name`` and ``text``. Every node is
+    indexed by id, then attached to its parent; reviews whose parent is
+    missing from the set are treated as roots. Sibling order follows the
+    input order. Returns the id index and the list of root nodes.
+    """
+    nodes = {}
+    parents = []
+    for review in reviews:
+        if isinstance(review, dict):
+            review_id, parent_id = review["id"], review["parent_id"]
+            name, text = review["name"], review["text"]
+        else:
+            review_id, parent_id = review.id, review.parent_id
+            name, text = review.name, review.text
+        nodes[review_id] = {
+            "id": review_id,
+            "name": name,
+            "text": text,
+            "children": [],
+            "more_replies": 0,
+            "replies_cursor": None,
+        }
+        parents.append((review_id, parent_id))
+
+    roots = []
+    for review_id, parent_id in parents:
+        parent = nodes.get(parent_id)
+        if parent is None or parent_id == review_id:
+            roots.append(nodes[review_id])
+        else:
+            parent["children"].append(nodes[review_id])
+    return nodes, roots
+
+
+def build_review_tree(reviews):
+    return index_reviews(reviews)[1]
+
+
+def _after_id(cursor):
+    (after_id,) = decode_cursor(cursor, 1)
+    if not isinstance(after_id, int):
+        raise InvalidCursor(cursor)
+    return after_id
+
+
+def paginate_nodes(nodes, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Cursor page over sibling nodes already sorted by id. Returns the page
+    and the cursor of the next one. Raises ``InvalidCursor``.
+    """
+    limit = clamp_limit(limit)
+    if after:
+        after_id = _after_id(after)
+        nodes = [node for node in nodes if node["id"] > after_id]
+
+    page = nodes[:limit]
+    next_cursor = encode_cursor([page[-1]["id"]]) if len(nodes) > limit else None
+    return page, next_cursor
+
+
+def truncate_thread(nodes, max_depth=None, children_limit=None):
+    """
+    Cut the threads below ``nodes`` in place.
+
+    Levels deeper than ``max_depth`` (``nodes`` being level 1, capped at
+    ``MAX_THREAD_DEPTH``) are dropped and at most ``children_limit`` replies
+    are kept per review. A truncated review gets the number of hidden direct
+    replies in ``more_replies`` and a ``replies_cursor`` to continue from,
+    usable with the replies endpoint.
+    """
+    max_depth = thread_depth(max_depth)
+    stack = [(node, 1) for node in nodes]
+    while stack:
+        node, depth = stack.pop()
+        children = node["children"]
+        if depth >= max_depth:
+            shown = []
+        elif children_limit is not None:
+            shown = children[:children_limit]
+        else:
+            shown = children
+
+        if len(shown) < len(children):
+            node["children"] = shown
+            node["more_replies"] = len(children) - len(shown)
+            node["replies_cursor"] = encode_cursor([shown[-1]["id"]]) if shown else None
+        stack.extend((child, depth + 1) for child in shown)
+    return nodes
+
+
+def thread_depth(max_depth=None):
+    """The levels ``truncate_thread`` keeps for a requested ``max_depth``."""
+    return min(max_depth or MAX_THREAD_DEPTH, MAX_THREAD_DEPTH)
+
+
+def _thread_reviews(anchor, params, max_depth):
+    table = Review._meta.db_table
+    sql = THREAD_SQL.format(anchor=anchor.format(table=table), table=table)
+    ids = RawSQL(sql, (*params, thread_depth(max_depth) + 1))
+    return Review.objects.filter(id__in=ids)
+
+
+def subtree_reviews(review_id, max_depth=None):
+    """
+    Reviews below ``review_id``, down to the level ``truncate_thread`` counts
+    in ``more_replies`` for ``max_depth``, without the rest of the movie's.
+    """
+    return _thread_reviews(REPLIES_ANCHOR, (review_id,), max_depth)
+
+
+def thread_reviews(movie_id, after=None, limit=DEFAULT_PAGE_SIZE, max_depth=None):
+    """
+    Reviews of a page of the movie's threads: the first ``limit``
+    top-level reviews after the cursor ``after``, plus one to tell whether
+    there is a next page, and their replies down to the level
+    ``truncate_thread`` counts for ``max_depth``. Raises ``InvalidCursor``.
+    """
+    params = (movie_id, _after_id(after) if after else 0, clamp_limit(limit) + 1)
+    return _thread_reviews(ROOTS_ANCHOR, params, max_depth)
+
+
+def detail_reviews(movie_id):
+    """The reviews ``detail_threads`` needs."""
+    return thread_reviews(movie_id, max_depth=DETAIL_THREAD_DEPTH)
+
+
+def detail_threads(reviews):
+    """
+    The review threads embedded in a movie detail, from ``detail_reviews``
+    rows, and the cursor of the next page of them, for the movie reviews
+    endpoint.
+    """
+    page, next_cursor = paginate_nodes(build_review_tree(reviews))
+    return (
+        truncate_thread(page, DETAIL_THREAD_DEPTH, DETAIL_THREAD_CHILDREN),
+        next_cursor,
+    )
@@ -1,5 +1,6 @@
 from ninja import Schema
 from datetime import date
+from pydantic import conint, constr
 from typing import Optional, List
 
 
@@ -30,7 +31,7 @@ class MovieListSchema(Schema):
     tagline: str
     category: str
     rating_user: bool
-    middle_star: int
+    middle_star: float
     poster: str
 
 
@@ -54,6 +55,36 @@ class CreateMovieSchema(Schema):
     draft: bool
 
 
+class MovieImportSchema(Schema):
+    title: constr(min_length=1, max_length=100)
+    tagline: constr(max_length=100) = ""
+    description: str
+    poster: constr(max_length=200)
+    year: conint(ge=0, le=32767) = 2019
+    country: constr(max_length=30)
+    directors: List[int] = []
+    actors: List[int] = []
+    genres: List[str] = []
+    world_premiere: Optional[date]
+    budget: conint(ge=0) = 0
+    fees_in_usa: conint(ge=0) = 0
+    fess_in_world: conint(ge=0) = 0
+    category: Optional[str]
+    url: constr(regex=r"^[-a-zA-Z0-9_]+$", max_length=130)
+    draft: bool = False
+
+
+class MovieImportErrorSchema(Schema):
+    row: int
+    url: Optional[str]
+    errors: List[str]
+
+
+class MovieImportResultSchema(Schema):
+    created: int
+    errors: List[MovieImportErrorSchema]
+
+
 class ReviewCreateSchema(Schema):
     email: str
     name: str
@@ -73,6 +104,8 @@ class ReviewSchema(Schema):
     name: str
     text: str
     children: List["ReviewSchema"]
+    more_replies: int = 0
+    replies_cursor: Optional[str] = None
 
 
 class MovieDetailSchema(Schema):
@@ -93,6 +126,41 @@ class MovieDetailSchema(Schema):
     category: Optional[str]
     url: str
     reviews: Optional[List[ReviewSchema]]
+    # Next page of review threads, for GET /movies/{id}/reviews?after=.
+    reviews_cursor: Optional[str] = None
+
+
+class GenreFacetSchema(Schema):
+    slug: str
+    name: str
+    count: int
+
+
+class YearFacetSchema(Schema):
+    year: int
+    count: int
+
+
+class MovieFacetsSchema(Schema):
+    genres: List[GenreFacetSchema]
+    years: List[YearFacetSchema]
+
+
+class SuggestionSchema(Schema):
+    kind: str
+    id: int
+    label: str
+
+
+class ChartEntrySchema(Schema):
+    rank: int
+    score: float
+    id: int
+    title: str
+    tagline: str
+    category: str
+    middle_star: float
+    poster: str
 
 
 class CreateRatingSchema(Schema):
@@ -0,0 +1,176 @@
+import re
+import unicodedata
+from itertools import chain
+
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.utils.html import strip_tags
+
+from .models import Actor, Genre, Movie
+from .pagination import (
+    DEFAULT_PAGE_SIZE,
+    InvalidCursor,
+    clamp_limit,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+# Full-text index of the catalog, one row per movie, created by migration
+# 0010: an FTS5 table on SQLite, a tsvector column with a GIN index on
+# PostgreSQL. Ranked by bm25() / ts_rank_cd(), best match first.
+SEARCH_TABLE = "movie_ninja_moviesearch"
+INDEX_CHUNK_SIZE = 500
+# bm25() weights of the title, tagline, description, actors and genres columns.
+BM25_WEIGHTS = "10.0, 4.0, 1.0, 3.0, 2.0"
+
+WORD_RE = re.compile(r"\w+")
+
+_WEIGHTED_DOCUMENT = " || ".join(
+    f"setweight(to_tsvector('simple', %s), '{weight}')" for weight in "ABDBC"
+)
+
+KEY_COLUMN = {"sqlite": "rowid", "postgresql": "movie_id"}
+
+INSERT_SQL = {
+    "sqlite": f"INSERT INTO {SEARCH_TABLE} "
+    "(rowid, title, tagline, description, actors, genres) "
+    "VALUES (%s, %s, %s, %s, %s, %s)",
+    "postgresql": f"INSERT INTO {SEARCH_TABLE} (movie_id, document) "
+    f"VALUES (%s, {_WEIGHTED_DOCUMENT})",
+}
+
+MATCH_SQL = {
+    "sqlite": f"SELECT rowid AS id, bm25({SEARCH_TABLE}, {BM25_WEIGHTS}) AS score "
+    f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s",
+    "postgresql": "SELECT movie_id AS id, "
+    "-ts_rank_cd(document, query)::float8 AS score "
+    f"FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query WHERE document @@ query",
+}
+
+
+def _vendor():
+    return connection.vendor
+
+
+def fold(text):
+    """
+    Lower-case ``text`` and strip its diacritics, ё to е included, which
+    the FTS5 tokenizer only does for Latin letters. Documents and queries
+    are both folded.
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def match_expression(text):
+    """
+    The full-text query of ``text``: every word must match, as a prefix, so
+    partly typed words find results too. ``None`` when there is no word.
+    """
+    words = WORD_RE.findall(fold(text))
+    if not words:
+        return None
+    if _vendor() == "postgresql":
+        return " & ".join(f"{word}:*" for word in words)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _documents(movie_ids):
+    names = Actor.objects.only("id", "name")
+    movies = (
+        Movie.objects.filter(id__in=movie_ids)
+        .only("id", "title", "tagline", "description")
+        .prefetch_related(
+            Prefetch("actors", names),
+            Prefetch("directors", names),
+            Prefetch("genres", Genre.objects.only("id", "name")),
+        )
+    )
+    for movie in movies:
+        people = chain(movie.actors.all(), movie.directors.all())
+        yield (
+            movie.id,
+            fold(movie.title),
+            fold(movie.tagline),
+            fold(strip_tags(movie.description)),
+            fold(" ".join(actor.name for actor in people)),
+            fold(" ".join(genre.name for genre in movie.genres.all())),
+        )
+
+
+def _delete(cursor, movie_ids):
+    placeholders = ", ".join(["%s"] * len(movie_ids))
+    cursor.execute(
+        f"DELETE FROM {SEARCH_TABLE} "
+        f"WHERE {KEY_COLUMN[_vendor()]} IN ({placeholders})",
+        movie_ids,
+    )
+
+
+def index_movies(movie_ids):
+    """(Re)index the given movies; ids of deleted movies are dropped."""
+    movie_ids = list(dict.fromkeys(movie_ids))
+    for start in range(0, len(movie_ids), INDEX_CHUNK_SIZE):
+        chunk = movie_ids[start : start + INDEX_CHUNK_SIZE]
+        documents = list(_documents(chunk))
+        with transaction.atomic(), connection.cursor() as cursor:
+            _delete(cursor, chunk)
+            cursor.executemany(INSERT_SQL[_vendor()], documents)
+
+
+def unindex_movies(movie_ids):
+    movie_ids = list(movie_ids)
+    if movie_ids:
+        with connection.cursor() as cursor:
+            _delete(cursor, movie_ids)
+
+
+def rebuild_index():
+    """Index every movie again, ``INDEX_CHUNK_SIZE`` at a time; returns the count."""
+    movie_ids = list(Movie.objects.order_by("id").values_list("id", flat=True))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    index_movies(movie_ids)
+    return len(movie_ids)
+
+
+def matching_ids(expression):
+    """SQL and params of the ids of every movie matching ``expression``."""
+    return f"SELECT id FROM ({MATCH_SQL[_vendor()]}) matches", [expression]
+
+
+def search_movie_ids(expression, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Published movies matching ``expression`` (see ``match_expression``),
+    best first, as keyset pages on (score, id). Returns the page's movie
+    ids and the cursor of the next page, or ``None`` on the last one.
+    Raises ``InvalidCursor``.
+    """
+    limit = clamp_limit(limit)
+    params = [expression]
+    keyset = ""
+    if after:
+        score, movie_id = decode_cursor(after, 2)
+        if not all(isinstance(value, (int, float)) for value in (score, movie_id)):
+            raise InvalidCursor(after)
+        keyset = "AND (s.score > %s OR (s.score = %s AND s.id > %s))"
+        params += [score, score, movie_id]
+    params.append(limit + 1)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT s.id, s.score FROM ({MATCH_SQL[_vendor()]}) s "
+            f"JOIN {Movie._meta.db_table} m ON m.id = s.id "
+            f"WHERE NOT m.draft {keyset} "
+            "ORDER BY s.score, s.id LIMIT %s",
+            params,
+        )
+        rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        movie_id, score = rows[-1]
+        next_cursor = encode_cursor([score, movie_id])
+    return [movie_id for movie_id, _ in rows], next_cursor
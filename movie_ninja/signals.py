@@ -0,0 +1,207 @@
+from collections import defaultdict
+
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from ninja_api.response_cache import invalidate
+
+from .charts import CHART_KINDS, MOST_REVIEWED, TOP_RATED, leaderboards
+from .models import (
+    Actor,
+    Category,
+    Genre,
+    Movie,
+    MovieDeletion,
+    Rating,
+    RatingStar,
+    Review,
+)
+from .ratings import adjust_ratings, clear_star_values, star_values
+from .search import index_movies, unindex_movies
+from .suggest import ACTOR, MOVIE, suggest_index
+
+
+# Cached API namespaces each model appears in (see ninja_api.response_cache).
+# "ratings" holds the responses showing rating aggregates or the caller's
+# votes (listings, search, charts), so a vote leaves the rest cached.
+CACHED_IN = {
+    Movie: ("movies",),
+    Category: ("movies",),
+    Genre: ("movies",),
+    Review: ("movies",),
+    Rating: ("ratings",),
+    Actor: ("actors", "movies"),
+}
+
+
+def invalidate_cached_responses(sender, **kwargs):
+    invalidate(*CACHED_IN[sender])
+
+
+# Connected per model: a delete receiver on every model would keep
+# QuerySet.delete() from fast-deleting (Token, ChartEntry, m2m rows).
+for model in CACHED_IN:
+    post_save.connect(invalidate_cached_responses, sender=model)
+    post_delete.connect(invalidate_cached_responses, sender=model)
+
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+@receiver(m2m_changed, sender=Movie.directors.through)
+@receiver(m2m_changed, sender=Movie.genres.through)
+def invalidate_movie_relations(sender, action, **kwargs):
+    if action.startswith("post_"):
+        invalidate("movies")
+
+
+@receiver(post_save, sender=RatingStar)
+@receiver(post_delete, sender=RatingStar)
+def clear_cached_stars(sender, **kwargs):
+    clear_star_values()
+
+
+@receiver(pre_save, sender=Rating)
+def remember_previous_vote(sender, instance, **kwargs):
+    # The vote an update replaces, to take it out of the aggregate.
+    instance._previous_vote = None
+    if instance.pk is not None:
+        instance._previous_vote = (
+            Rating.objects.filter(pk=instance.pk)
+            .values_list("movie_id", "star_id")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def adjust_rating_aggregate(sender, instance, signal, origin=None, **kwargs):
+    # Votes stored by ratings.upsert_vote/write_votes adjust it themselves.
+    if isinstance(origin, Movie) or getattr(origin, "model", None) is Movie:
+        # Cascaded from deleting the movie: nothing left to adjust.
+        return
+    vote = (instance.movie_id, instance.star_id)
+    if signal is post_save:
+        removed, added = instance.__dict__.pop("_previous_vote", None), vote
+    else:
+        removed, added = vote, None
+
+    values = star_values()
+    changes = defaultdict(lambda: (0, 0))
+    for change, sign in ((removed, -1), (added, 1)):
+        if change is not None:
+            movie_id, star_id = change
+            votes, stars = changes[movie_id]
+            changes[movie_id] = (votes + sign, stars + sign * values.get(star_id, 0))
+    adjust_ratings(changes)
+
+
+@receiver(post_save, sender=Movie)
+def index_movie(sender, instance, **kwargs):
+    index_movies([instance.pk])
+
+
+@receiver(post_delete, sender=Movie)
+def unindex_movie(sender, instance, **kwargs):
+    unindex_movies([instance.pk])
+
+
+@receiver(post_delete, sender=Movie)
+def log_movie_deletion(sender, instance, **kwargs):
+    # Tombstone for incremental exports (export.export_tombstones).
+    MovieDeletion.objects.create(movie_id=instance.pk)
+
+
+def touch_movies(movie_ids):
+    """Bump ``updated_at``, so incremental exports pick the movies up again."""
+    if movie_ids:
+        Movie.objects.filter(id__in=movie_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Actor)
+@receiver(post_save, sender=Genre)
+def reindex_related_movies(sender, instance, created, **kwargs):
+    # A new actor or genre is not linked to any movie yet.
+    if created:
+        return
+    if sender is Actor:
+        related = Q(actors=instance) | Q(directors=instance)
+    else:
+        related = Q(genres=instance)
+    movie_ids = list(Movie.objects.filter(related).values_list("id", flat=True))
+    index_movies(movie_ids)
+    if sender is Genre:
+        # Exported rows carry genre names (actors only by id).
+        touch_movies(movie_ids)
+
+
+@receiver(post_save, sender=Category)
+def touch_category_movies(sender, instance, created, **kwargs):
+    # Exported rows carry the category name.
+    if not created:
+        touch_movies(
+            Movie.objects.filter(category=instance).values_list("id", flat=True)
+        )
+
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+@receiver(m2m_changed, sender=Movie.directors.through)
+@receiver(m2m_changed, sender=Movie.genres.through)
+def reindex_movie_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        movie_ids = [instance.pk]
+    elif action == "pre_clear":
+        # The cleared movies are unknown once post_clear is sent.
+        field = "genre" if sender is Movie.genres.through else "actor"
+        related = sender.objects.filter(**{field: instance})
+        instance._cleared_movie_ids = list(related.values_list("movie_id", flat=True))
+        return
+    elif action == "post_clear":
+        movie_ids = getattr(instance, "_cleared_movie_ids", [])
+    else:
+        movie_ids = pk_set or []
+    if action.startswith("post_"):
+        index_movies(movie_ids)
+        touch_movies(movie_ids)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=Actor)
+def update_suggestions(sender, instance, **kwargs):
+    if sender is Actor:
+        suggest_index.put(ACTOR, instance.pk, instance.name)
+    elif instance.draft:
+        suggest_index.remove(MOVIE, instance.pk)
+    else:
+        suggest_index.put(MOVIE, instance.pk, instance.title)
+
+
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=Actor)
+def remove_suggestion(sender, instance, **kwargs):
+    suggest_index.remove(ACTOR if sender is Actor else MOVIE, instance.pk)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def mark_chart_scores(sender, instance, **kwargs):
+    kind = TOP_RATED if sender is Rating else MOST_REVIEWED
+    leaderboards.mark([instance.movie_id], [kind])
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def mark_chart_movie(sender, instance, **kwargs):
+    # Published, unpublished or moved to another year.
+    leaderboards.mark([instance.pk], CHART_KINDS)
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+def mark_chart_genres(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action.startswith("post_"):
+        leaderboards.mark([instance.pk], CHART_KINDS)
+    elif action in ("post_add", "post_remove"):
+        # Clearing a genre is left to the next rebuild.
+        leaderboards.mark(pk_set, CHART_KINDS)
@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+from .models import Actor, Movie
+from .search import WORD_RE, fold
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+MOVIE = "movie"
+ACTOR = "actor"
+
+
+def clamp_suggest_limit(limit):
+    return max(1, min(limit or DEFAULT_SUGGEST_LIMIT, MAX_SUGGEST_LIMIT))
+
+
+def _normalize(text):
+    return " ".join(WORD_RE.findall(fold(text)))
+
+
+def _keys(label):
+    """The folded words of ``label``, and the same from each later word on."""
+    words = WORD_RE.findall(fold(label))
+    if not words:
+        return None, []
+    return " ".join(words), [" ".join(words[i:]) for i in range(1, len(words))]
+
+
+class SuggestIndex:
+    """
+    In-memory prefix index of published movie titles and actor names.
+
+    Two sorted lists of ``(key, label, kind, id)`` are searched with
+    ``bisect``: one keyed on the whole label, one on the label from each
+    later word on, so "wars" suggests "Star Wars" after any label that
+    starts with it. Keys are the label's words, case and diacritic folded
+    like the search index (``search.fold``) and joined by single spaces.
+
+    The index is loaded once per process (``build``), then kept up to date
+    by model signals; writes made by other processes are picked up by a
+    background rebuild every ``SUGGEST_REBUILD_INTERVAL`` seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._starts = []
+        self._words = []
+        self._entries = {}
+        self._built_at = None
+        self._rebuilding = False
+
+    @property
+    def built(self):
+        return self._built_at is not None
+
+    def build(self):
+        """Load every published movie and every actor (two queries)."""
+        items = [
+            (MOVIE, movie_id, title)
+            for movie_id, title in Movie.objects.filter(draft=False).values_list(
+                "id", "title"
+            )
+        ]
+        items += [
+            (ACTOR, actor_id, name)
+            for actor_id, name in Actor.objects.values_list("id", "name")
+        ]
+
+        starts, words, entries = [], [], {}
+        for kind, item_id, label in items:
+            start, later = _keys(label)
+            if start is None:
+                continue
+            entries[kind, item_id] = (label, start, later)
+            starts.append((start, label, kind, item_id))
+            words += [(key, label, kind, item_id) for key in later]
+        starts.sort()
+        words.sort()
+
+        with self._lock:
+            self._starts, self._words, self._entries = starts, words, entries
+            self._built_at = time.monotonic()
+
+    def warm_up(self):
+        """
+        ``build`` at startup, unless the tables are not there yet (before
+        migrate). The connection it opened is closed again: with a preloading
+        server the workers are forked afterwards and must not share it.
+        """
+        try:
+            self.build()
+        except DatabaseError:
+            logger.warning("Suggest index not built", exc_info=True)
+        finally:
+            connection.close()
+
+    def clear(self):
+        with self._lock:
+            self._starts, self._words, self._entries = [], [], {}
+            self._built_at = None
+
+    def put(self, kind, item_id, label):
+        # Processes that never suggest anything do not keep the index.
+        if not self.built:
+            return
+        with self._lock:
+            self._remove(kind, item_id)
+            start, later = _keys(label)
+            if start is None:
+                return
+            self._entries[kind, item_id] = (label, start, later)
+            insort(self._starts, (start, label, kind, item_id))
+            for key in later:
+                insort(self._words, (key, label, kind, item_id))
+
+    def remove(self, kind, item_id):
+        if not self.built:
+            return
+        with self._lock:
+            self._remove(kind, item_id)
+
+    def _remove(self, kind, item_id):
+        entry = self._entries.pop((kind, item_id), None)
+        if entry is None:
+            return
+        label, start, later = entry
+        _discard(self._starts, (start, label, kind, item_id))
+        for key in later:
+            _discard(self._words, (key, label, kind, item_id))
+
+    def suggest(self, prefix, limit=DEFAULT_SUGGEST_LIMIT):
+        """
+        Up to ``limit`` ``(kind, id, label)`` whose label starts with
+        ``prefix``, then those with a later word starting with it; each
+        group in alphabetical order.
+        """
+        self._refresh()
+        prefix = _normalize(prefix)
+        if not prefix:
+            return []
+        limit = clamp_suggest_limit(limit)
+
+        found, seen = [], set()
+        with self._lock:
+            for entries in (self._starts, self._words):
+                index = bisect_left(entries, (prefix,))
+                while index < len(entries) and len(found) < limit:
+                    key, label, kind, item_id = entries[index]
+                    if not key.startswith(prefix):
+                        break
+                    if (kind, item_id) not in seen:
+                        seen.add((kind, item_id))
+                        found.append((kind, item_id, label))
+                    index += 1
+        return found
+
+    def _refresh(self):
+        if not self.built:
+            self.build()
+            return
+        interval = getattr(settings, "SUGGEST_REBUILD_INTERVAL", 300)
+        if not interval or time.monotonic() - self._built_at < interval:
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        # Keep answering from the current lists while the new ones load.
+        threading.Thread(target=self._rebuild, daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Rebuilding the suggest index failed")
+        finally:
+            self._rebuilding = False
+            connection.close()
+
+
+def _discard(entries, entry):
+    index = bisect_left(entries, entry)
+    if index < len(entries) and entries[index] == entry:
+        del entries[index]
+
+
+suggest_index = SuggestIndex()
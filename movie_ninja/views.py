@@ -1,36 +1,111 @@
-from ninja import Router, Path
-from .models import Actor, Movie, Review, Rating, RatingStar
+from ninja import Router, Path, Query
+from .models import Actor, Genre, Movie, Review
 from .schemas import (
     ActorListSchema,
     ActorDetailSchema,
     ActorCreateSchema,
     MovieDetailSchema,
+    MovieFacetsSchema,
+    MovieImportResultSchema,
     MovieListSchema,
     ReviewCreateSchema,
     ReviewResponseSchema,
     ReviewSchema,
+    ChartEntrySchema,
     CreateRatingSchema,
+    SuggestionSchema,
 )
-from typing import List
+from .reviews import (
+    build_review_tree,
+    detail_reviews,
+    detail_threads,
+    paginate_nodes,
+    subtree_reviews,
+    thread_reviews,
+    truncate_thread,
+)
+from .ratings import (
+    client_ip,
+    rated_movie_ids,
+    rating_queue,
+    star_values,
+    upsert_vote,
+)
+from .importer import READERS, ImportFormatError, import_movies
+from .export import (
+    EXPORT_STARTED_HEADER,
+    NDJSON_CONTENT_TYPE,
+    aexport_lines,
+    export_lines,
+)
+from .filters import (
+    DEFAULT_SORT,
+    MOVIE_SORTS,
+    MovieFilterSchema,
+    MovieSort,
+    movie_facets,
+    sort_fields,
+    sort_scope,
+)
+from .charts import (
+    DEFAULT_CHART_LIMIT,
+    OVERALL,
+    TOP_RATED,
+    ChartKind,
+    genre_scope,
+    leaderboards,
+    year_scope,
+)
+from .search import match_expression, search_movie_ids
+from .suggest import DEFAULT_SUGGEST_LIMIT, suggest_index
+from .pagination import (
+    DEFAULT_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    InvalidCursor,
+    paginate_keyset,
+)
+from auth_jwt.jwt import AuthBearer
+from ninja_api.instrumentation import query_budget
+from ninja_api.renderers import trusted_response
+from ninja_api.response_cache import cache_response, invalidate
+from datetime import datetime
+from typing import List, Optional
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F, Prefetch
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from ninja.responses import Response
 from ninja_extra import status
+import codecs
 import os
 
 
 api_router = Router()
 
+IMPORT_CONTENT_TYPES = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "text/csv": "csv",
+}
+
+ACTOR_LIST_FIELDS = ("id", "name", "image")
+REVIEW_FIELDS = ("id", "parent_id", "name", "text")
+
 
 @api_router.get(
     "/actors", response=List[ActorListSchema], summary="Get list of all actors"
 )
+@query_budget(1)
+@cache_response("actors")
 def list_actors(request):
-    actors = Actor.objects.all()
-    actor_list = [
-        {"id": actor.id, "name": actor.name, "image": actor.image.url}
-        for actor in actors
-    ]
-    return actor_list
+    actors = Actor.objects.values(*ACTOR_LIST_FIELDS)
+    return trusted_response(request, list(actors))
+
+
+def _actor_list_item(actor):
+    return {"id": actor.id, "name": actor.name, "image": actor.image}
 
 
 @api_router.post("/actors", response=ActorListSchema, summary="Create a new actor")
@@ -60,12 +135,16 @@ def create_actor(request, actor_in: ActorCreateSchema):
         image=actor_in.image,
     )
 
-    return {"id": actor.id, "name": actor.name, "image": actor.image}
+    return _actor_list_item(actor)
 
 
 @api_router.get(
-    "/actors/{actor_id}", response=ActorDetailSchema, summary="Get one actor's details"
+    "/actors/{int:actor_id}",
+    response=ActorDetailSchema,
+    summary="Get one actor's details",
 )
+@query_budget(1)
+@cache_response("actors")
 def get_actor(request, actor_id: int = Path(...)):
     actor = get_object_or_404(Actor, id=actor_id)
     return actor
@@ -81,30 +160,251 @@ def get_actor(request, actor_id: int = Path(...)):
 @api_router.get(
     "/movies", response=List[MovieListSchema], summary="Get list all movies"
 )
-def list_movies(request):
-    movies = Movie.objects.all()
-    movie_list = [
-        {
-            "id": movie.id,
-            "title": movie.title,
-            "tagline": movie.tagline,
-            "category": movie.category.name if movie.category else "",
-            "rating_user": True,
-            "middle_star": 0,
-            "poster": movie.poster,
-        }
-        for movie in movies
+@query_budget(2)
+@cache_response("movies", "ratings", per_client=True)
+def list_movies(
+    request,
+    response: HttpResponse,
+    filters: MovieFilterSchema = Query(...),
+    sort: MovieSort = DEFAULT_SORT,
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    extra = sort_fields(sort)
+    movies = filters.filter(_movie_list_rows(*extra))
+    try:
+        movies, next_cursor = paginate_keyset(
+            movies, MOVIE_SORTS[sort], after, limit, scope=sort_scope(sort)
+        )
+    except InvalidCursor:
+        return Response(
+            {"detail": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if next_cursor:
+        response[NEXT_CURSOR_HEADER] = next_cursor
+
+    rated = rated_movie_ids(client_ip(request), [movie["id"] for movie in movies])
+    return trusted_response(request, _movie_list_items(movies, rated, extra), response)
+
+
+@api_router.get(
+    "/movies/facets",
+    response=MovieFacetsSchema,
+    summary="Movie counts per genre and year",
+)
+@query_budget(2)
+@cache_response("movies")
+def get_movie_facets(request, filters: MovieFilterSchema = Query(...)):
+    """Takes the filters of ``GET /movies``."""
+    return trusted_response(request, movie_facets(filters))
+
+
+def _movie_list_rows(*extra):
+    """``extra``: more columns, for the cursor of a sorted listing"""
+    return Movie.objects.values(
+        "id",
+        "title",
+        "tagline",
+        "poster",
+        *extra,
+        category_name=F("category__name"),
+        middle_star=F("rating_avg"),
+    )
+
+
+def _movie_list_items(movies, rated, extra=()):
+    """Complete ``_movie_list_rows`` into ``MovieListSchema`` rows, in place"""
+    for movie in movies:
+        movie["category"] = movie.pop("category_name") or ""
+        movie["rating_user"] = movie["id"] in rated
+        for name in extra:
+            del movie[name]
+    return movies
+
+
+@api_router.get(
+    "/movies/search", response=List[MovieListSchema], summary="Full-text movie search"
+)
+@query_budget(3)
+@cache_response("movies", "ratings", per_client=True)
+def search_movies(
+    request,
+    response: HttpResponse,
+    q: str = Query(..., min_length=1, max_length=200),
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """
+    Published movies whose title, tagline, description, actor or genre
+    names contain every word of ``q`` (as a prefix), best match first.
+    """
+    expression = match_expression(q)
+    if expression is None:
+        return trusted_response(request, [], response)
+    try:
+        movie_ids, next_cursor = search_movie_ids(expression, after, limit)
+    except InvalidCursor:
+        return Response(
+            {"detail": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if next_cursor:
+        response[NEXT_CURSOR_HEADER] = next_cursor
+
+    rows = {row["id"]: row for row in _movie_list_rows().filter(id__in=movie_ids)}
+    movies = [rows[movie_id] for movie_id in movie_ids if movie_id in rows]
+    rated = rated_movie_ids(client_ip(request), movie_ids)
+    return trusted_response(request, _movie_list_items(movies, rated), response)
+
+
+@api_router.get(
+    "/suggest",
+    response=List[SuggestionSchema],
+    summary="Suggest movie titles and actor names",
+)
+@query_budget(0)
+def suggest(
+    request,
+    prefix: str = Query(..., max_length=100),
+    limit: int = DEFAULT_SUGGEST_LIMIT,
+):
+    """Answered from the in-memory ``suggest_index``, without the database."""
+    suggestions = [
+        {"kind": kind, "id": item_id, "label": label}
+        for kind, item_id, label in suggest_index.suggest(prefix, limit)
     ]
+    return trusted_response(request, suggestions)
+
+
+@api_router.get(
+    "/charts/{kind}",
+    response=List[ChartEntrySchema],
+    summary="Top movies overall, in a genre or in a year",
+)
+@cache_response("movies", "ratings")
+def get_chart(
+    request,
+    kind: ChartKind,
+    genre: Optional[str] = None,
+    year: Optional[int] = None,
+    limit: int = DEFAULT_CHART_LIMIT,
+):
+    """
+    Ranked from the in-memory ``leaderboards``, then one query for the
+    listed movies (and one to look the ``genre`` slug up).
+    """
+    if genre is not None and year is not None:
+        return Response(
+            {"detail": "Pass genre or year, not both."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if genre is not None:
+        scope = genre_scope(get_object_or_404(Genre.objects.only("id"), url=genre).id)
+    elif year is not None:
+        scope = year_scope(year)
+    else:
+        scope = OVERALL
+
+    ranked = leaderboards.top(kind, scope, limit)
+    rows = _movie_list_rows().filter(
+        id__in=[movie_id for movie_id, _ in ranked], draft=False
+    )
+    rows = {row["id"]: row for row in rows}
+    entries = []
+    for movie_id, score in ranked:
+        # Unpublished or deleted by another process since its last reload.
+        row = rows.get(movie_id)
+        if row is None:
+            continue
+        row["category"] = row.pop("category_name") or ""
+        entries.append({"rank": len(entries) + 1, "score": score, **row})
+    return trusted_response(request, entries)
+
+
+@api_router.get("/movies/export", summary="Export the published catalog as NDJSON")
+def export_movies(request, since: Optional[datetime] = None):
+    if since is not None and timezone.is_naive(since):
+        since = timezone.make_aware(since)
+
+    # Under ASGI, Django reads a sync iterator into a list before sending it.
+    lines = aexport_lines if isinstance(request, ASGIRequest) else export_lines
+    response = StreamingHttpResponse(lines(since), content_type=NDJSON_CONTENT_TYPE)
+    response[EXPORT_STARTED_HEADER] = timezone.now().isoformat()
+    return response
+
+
+@api_router.post(
+    "/movies/bulk",
+    response=MovieImportResultSchema,
+    auth=AuthBearer(),
+    summary="Import movies in bulk",
+)
+def import_movies_bulk(request):
+    """
+    Body: a JSON array, JSON lines (application/x-ndjson) or CSV (text/csv)
+    of MovieImportSchema rows. Staff only. A JSON array is capped at
+    DATA_UPLOAD_MAX_MEMORY_SIZE; JSON lines and CSV bodies are not.
+    """
+    if not request.auth.is_staff:
+        return Response({"detail": "Staff only"}, status=status.HTTP_403_FORBIDDEN)
+
+    content_type = IMPORT_CONTENT_TYPES.get(request.content_type)
+    if content_type is None:
+        return Response(
+            {"detail": "Unsupported content type"},
+            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        )
 
-    return movie_list
+    # A JSON array is parsed whole, so it stays under
+    # DATA_UPLOAD_MAX_MEMORY_SIZE like any other body.
+    if content_type == "json" and _over_upload_limit(request):
+        return Response(
+            {"detail": "JSON body too large: send large imports as JSON lines"},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+
+    # JSON lines and CSV are read as a stream, one chunk of rows at a time:
+    # large imports are above the limit, which only request.body enforces.
+    stream = codecs.iterdecode(request, "utf-8") if content_type == "csv" else request
+    try:
+        return import_movies(READERS[content_type](stream))
+    except ImportFormatError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _over_upload_limit(request):
+    limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = 0
+    return limit is not None and length > limit
 
 
 @api_router.get(
-    "/movies/{movie_id}", response=MovieDetailSchema, summary="Get details of the movie"
+    "/movies/{int:movie_id}",
+    response=MovieDetailSchema,
+    summary="Get details of the movie",
 )
+@query_budget(5)
+@cache_response("movies")
 def get_movie(request, movie_id: int = Path(...)):
-    movie = get_object_or_404(Movie, id=movie_id)
+    movie = get_object_or_404(_movie_detail_queryset(), id=movie_id)
+    reviews = detail_reviews(movie.id).order_by("id").values(*REVIEW_FIELDS)
+    return _movie_detail(movie, reviews)
+
 
+def _movie_detail_queryset():
+    return Movie.objects.select_related("category").prefetch_related(
+        Prefetch("directors", queryset=Actor.objects.only("id", "name", "image")),
+        Prefetch("actors", queryset=Actor.objects.only("id", "name", "image")),
+        Prefetch("genres", queryset=Genre.objects.only("id", "name")),
+    )
+
+
+def _movie_detail(movie, reviews):
+    reviews, reviews_cursor = detail_threads(reviews)
     return {
         "id": movie.id,
         "title": movie.title,
@@ -113,16 +413,23 @@ def get_movie(request, movie_id: int = Path(...)):
         "poster": movie.poster,
         "year": movie.year,
         "country": movie.country,
-        "directors": [director.id for director in movie.directors.all()],
-        "actors": [actor.id for actor in movie.actors.all()],
-        "genres": [genre.id for genre in movie.genres.all()],
-        "world_premiere": movie.world_premiere.strftime("%Y-%m-%d"),
+        "directors": [
+            {"id": director.id, "name": director.name, "image": director.image}
+            for director in movie.directors.all()
+        ],
+        "actors": [
+            {"id": actor.id, "name": actor.name, "image": actor.image}
+            for actor in movie.actors.all()
+        ],
+        "genres": [genre.name for genre in movie.genres.all()],
+        "world_premiere": movie.world_premiere,
         "budget": movie.budget,
         "fees_in_usa": movie.fees_in_usa,
-        "fess_in_world": movie.fess_in_world,
-        "category": movie.category.name,
+        "fees_in_world": movie.fess_in_world,
+        "category": movie.category.name if movie.category else None,
         "url": movie.url,
-        "reviews": [review.id for review in movie.reviews.all()],
+        "reviews": reviews,
+        "reviews_cursor": reviews_cursor,
     }
 
 
@@ -152,30 +459,80 @@ def create_review(request, movie_id: int, review: ReviewCreateSchema):
 
 
 @api_router.get(
-    "/movies/{movie_id}/reviews",
+    "/movies/{int:movie_id}/reviews",
     summary="Get all reviews for a movie",
     response=List[ReviewSchema],
 )
-def get_movie_reviews(request, movie_id: int):
-    movie = get_object_or_404(Movie, id=movie_id)
-    reviews = Review.objects.filter(movie=movie)
-    review_list = []
-    for review in reviews:
-        review_dict = {"id": review.id, "name": review.name, "text": review.text}
-        if review.children:
-            children = []
-            for child in review.children.all():
-                children.append(
-                    {"id": child.id, "name": child.name, "text": child.text}
-                )
-            review_dict["children"] = children
-        review_list.append(review_dict)
-    return review_list
+@query_budget(2)
+def get_movie_reviews(
+    request,
+    movie_id: int,
+    response: HttpResponse,
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    max_depth: Optional[int] = Query(None, ge=1),
+    children_limit: Optional[int] = Query(None, ge=0),
+):
+    movie = get_object_or_404(Movie.objects.only("id"), id=movie_id)
+    try:
+        reviews = thread_reviews(movie.id, after, limit, max_depth)
+    except InvalidCursor:
+        return Response(
+            {"detail": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    reviews = reviews.order_by("id").values(*REVIEW_FIELDS)
+    # Only the page's roots were read: no cursor to apply again.
+    return _review_page(
+        response, build_review_tree(reviews), None, limit, max_depth, children_limit
+    )
+
+
+@api_router.get(
+    "/reviews/{int:review_id}/replies",
+    summary="Get replies to a review",
+    response=List[ReviewSchema],
+)
+@query_budget(2)
+def get_review_replies(
+    request,
+    review_id: int,
+    response: HttpResponse,
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    max_depth: Optional[int] = Query(None, ge=1),
+    children_limit: Optional[int] = Query(None, ge=0),
+):
+    review = get_object_or_404(Review.objects.only("id"), id=review_id)
+    reviews = (
+        subtree_reviews(review.id, max_depth).order_by("id").values(*REVIEW_FIELDS)
+    )
+    # The direct replies have no parent in the set, so they are the roots.
+    return _review_page(
+        response,
+        build_review_tree(reviews),
+        after,
+        limit,
+        max_depth,
+        children_limit,
+    )
+
+
+def _review_page(response, nodes, after, limit, max_depth, children_limit):
+    try:
+        page, next_cursor = paginate_nodes(nodes, after, limit)
+    except InvalidCursor:
+        return Response(
+            {"detail": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if next_cursor:
+        response[NEXT_CURSOR_HEADER] = next_cursor
+    return truncate_thread(page, max_depth, children_limit)
 
 
 @api_router.post(
     "/ratings",
-    response={201: CreateRatingSchema},
+    response={201: CreateRatingSchema, 202: CreateRatingSchema},
     summary="Create a rating for a specific movie",
 )
 def create_rating(request, data: CreateRatingSchema):
@@ -183,15 +540,17 @@ def create_rating(request, data: CreateRatingSchema):
     star_id = data.star_id
     movie_id = data.movie_id
 
-    star = get_object_or_404(RatingStar, id=star_id)
-    movie = get_object_or_404(Movie, id=movie_id)
-
-    rating, created = Rating.objects.update_or_create(
-        ip=ip, movie=movie, defaults={"star": star}
-    )
+    if star_id not in star_values():
+        raise Http404("No RatingStar matches the given query.")
 
-    if not created and rating.star != star:
-        rating.star = star
-        rating.save()
+    if getattr(settings, "RATING_WRITE_BEHIND", False):
+        get_object_or_404(Movie.objects.only("id"), id=movie_id)
+        rating_queue.put(ip, movie_id, star_id)
+        return 202, data
 
-    return 201, rating
+    if not upsert_vote(ip, movie_id, star_id):
+        raise Http404("No Movie matches the given query.")
+    # A raw upsert sends no post_save
+    invalidate("ratings")
+    leaderboards.mark([movie_id], [TOP_RATED])
+    return 201, data
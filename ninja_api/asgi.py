@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ninja_api.settings')
 
 application = get_asgi_application()
+
+# Load the suggest index before the first request (and before forking, with
+# a preloading server).
+from movie_ninja.suggest import suggest_index  # noqa: E402
+
+suggest_index.warm_up()
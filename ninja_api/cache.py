@@ -0,0 +1,53 @@
+"""
+The cache every caching feature of the API goes through.
+
+``API_CACHE_ALIAS`` picks the ``CACHES`` entry: ``"shared"``
+(``ninja_api.cache_backends.SQLiteCache``) so that all worker processes on a
+host see the same entries and invalidations, or the per-process default for
+a single-process server.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+
+# How long a fill lock is held at most, and so how long others wait for it.
+FILL_TIMEOUT = 10
+POLL_INTERVAL = 0.01
+
+_missing = object()
+
+
+def get_cache():
+    return caches[getattr(settings, "API_CACHE_ALIAS", DEFAULT_CACHE_ALIAS)]
+
+
+def _fill_key(key):
+    return f"{key}:filling"
+
+
+def acquire_fill(key, timeout=FILL_TIMEOUT):
+    """
+    Claim the right to compute ``key``. Only one caller in all processes
+    sharing the cache gets ``True`` until ``release_fill`` or ``timeout``.
+    """
+    return get_cache().add(_fill_key(key), True, timeout)
+
+
+def release_fill(key):
+    get_cache().delete(_fill_key(key))
+
+
+def wait_for(key, timeout=FILL_TIMEOUT, default=None):
+    """Poll for ``key`` while another caller fills it."""
+    cache = get_cache()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = cache.get(key, _missing)
+        if value is not _missing:
+            return value
+        if not cache.has_key(_fill_key(key)):
+            break
+        time.sleep(POLL_INTERVAL)
+    return cache.get(key, default)
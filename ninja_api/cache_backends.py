@@ -0,0 +1,165 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache in a local SQLite file, shared by every worker process on the host.
+
+    ``LOCATION`` is the database path; put it on a tmpfs such as ``/dev/shm``
+    to keep it in memory. The file is opened in WAL mode and memory-mapped,
+    so readers never block each other or the writer. Updates are single
+    statements or ``BEGIN IMMEDIATE`` transactions, which makes ``add`` and
+    ``incr`` atomic across processes. Each thread of each process has its own
+    connection.
+
+    Expired rows are dropped, and the oldest ``1 / CULL_FREQUENCY`` of the
+    entries culled when there are more than ``MAX_ENTRIES``, every
+    ``CULL_EVERY`` writes of a process.
+    """
+
+    CULL_EVERY = 100
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = str(location)
+        self._mmap_size = params.get("OPTIONS", {}).get("MMAP_SIZE", 64 * 1024 * 1024)
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        # A connection inherited through fork() must not be used by the child.
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self._path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA mmap_size={int(self._mmap_size)}")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)"
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _expires(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return default if row is None else pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._connection().execute(
+            "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE "
+            "SET value = excluded.value, expires = excluded.expires",
+            (key, self._dumps(value), self._expires(timeout)),
+        )
+        self._wrote()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE "
+            "SET value = excluded.value, expires = excluded.expires "
+            "WHERE cache.expires IS NOT NULL AND cache.expires <= ?",
+            (key, self._dumps(value), self._expires(timeout), time.time()),
+        )
+        self._wrote()
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            "UPDATE cache SET expires = ? "
+            "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (self._expires(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = (
+            self._connection()
+            .execute(
+                "SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT value FROM cache "
+                "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                "UPDATE cache SET value = ? WHERE key = ?", (self._dumps(value), key)
+            )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return value
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Connections are per thread and reused across requests.
+        pass
+
+    def _dumps(self, value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _wrote(self):
+        self._writes += 1
+        if self._writes % self.CULL_EVERY == 0:
+            self._cull()
+
+    def _cull(self):
+        connection = self._connection()
+        connection.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        (count,) = connection.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self._max_entries and self._cull_frequency == 0:
+            connection.execute("DELETE FROM cache")
+        elif count > self._max_entries:
+            connection.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY rowid LIMIT ?)",
+                (max(1, count // self._cull_frequency),),
+            )
@@ -0,0 +1,210 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .metrics import (
+    QUERY_BUDGET_OVERRUNS,
+    REQUEST_LATENCY,
+    REQUEST_QUERIES,
+    REQUEST_SERIALIZATION_TIME,
+    REQUEST_SQL_TIME,
+    REQUESTS_IN_FLIGHT,
+    ThreadShards,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries):
+    """
+    Declare how many SQL queries a view may run per request. Checked by
+    ``QueryInstrumentationMiddleware``; apply it below the router decorator.
+    """
+
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+
+    return decorator
+
+
+class QueryCounter:
+    """Counts queries and their total time on every database connection."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._wrapped = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+    def __enter__(self):
+        for connection in connections.all():
+            wrapper = connection.execute_wrapper(self)
+            wrapper.__enter__()
+            self._wrapped.append(wrapper)
+        return self
+
+    def __exit__(self, *exc_info):
+        while self._wrapped:
+            self._wrapped.pop().__exit__(*exc_info)
+
+
+def resolve_operation(request):
+    """The Ninja operation that served ``request``, or ``None``."""
+    match = getattr(request, "resolver_match", None)
+    path_view = getattr(getattr(match, "func", None), "__self__", None)
+    find_operation = getattr(path_view, "_find_operation", None)
+    if find_operation is None:
+        return None
+    return find_operation(request)
+
+
+def operation_id(operation):
+    return operation.operation_id or operation.api.get_openapi_operation_id(operation)
+
+
+class RouteStats:
+    """Per-route totals since process start, kept in per-thread shards."""
+
+    FIELDS = (
+        "requests",
+        "queries",
+        "max_queries",
+        "sql_seconds",
+        "serialization_seconds",
+        "over_budget",
+    )
+
+    def __init__(self):
+        self._shards = ThreadShards(dict, self._fold)
+
+    def record(self, route, queries, sql_seconds, serialization_seconds, over_budget):
+        shard = self._shards.local()
+        stats = shard.get(route)
+        if stats is None:
+            stats = shard[route] = dict.fromkeys(self.FIELDS, 0)
+        stats["requests"] += 1
+        stats["queries"] += queries
+        stats["max_queries"] = max(stats["max_queries"], queries)
+        stats["sql_seconds"] += sql_seconds
+        stats["serialization_seconds"] += serialization_seconds
+        stats["over_budget"] += over_budget
+
+    @classmethod
+    def _fold(cls, total, shard):
+        for route, stats in list(shard.items()):
+            into = total.setdefault(route, dict.fromkeys(cls.FIELDS, 0))
+            for field, value in list(stats.items()):
+                if field == "max_queries":
+                    into[field] = max(into[field], value)
+                else:
+                    into[field] += value
+
+    def snapshot(self):
+        return self._shards.merged()
+
+    def reset(self):
+        self._shards.clear()
+
+
+route_stats = RouteStats()
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records query count, SQL time and serialization time of every API call.
+
+    Totals are kept per Ninja operation in ``route_stats`` and fed to the
+    latency, query, SQL and serialization time histograms and the query
+    budget overrun counter exported on ``/api/metrics``. With ``DEBUG``
+    they are also sent back as ``X-Query-Count``, ``X-Query-Time-Ms`` and
+    ``X-Serialization-Time-Ms`` headers. Views declaring a ``query_budget``
+    that run more queries are logged, or fail with ``QueryBudgetExceeded``
+    when ``QUERY_BUDGET_STRICT`` is on (as in the test suite). Queries run
+    while a streaming response is consumed are not counted.
+
+    Works in both sync and async chains, so async views are not pushed back
+    onto a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            with QueryCounter() as counter:
+                response = self.get_response(request)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+        return self.process(request, response, counter, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        # Connections are per thread: wrap the ones of the thread the async
+        # ORM runs this request's queries in.
+        counter = QueryCounter()
+        await sync_to_async(counter.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(counter.__exit__)(None, None, None)
+            REQUESTS_IN_FLIGHT.dec()
+        return self.process(request, response, counter, started)
+
+    def process(self, request, response, counter, started):
+        elapsed = time.perf_counter() - started
+        operation = resolve_operation(request)
+        if operation is None:
+            return response
+
+        serialization = getattr(request, "serialization_time", 0.0)
+        budget = getattr(operation.view_func, "query_budget", None)
+        over_budget = budget is not None and counter.count > budget
+        route = operation_id(operation)
+        route_stats.record(
+            route, counter.count, counter.duration, serialization, over_budget
+        )
+        REQUEST_LATENCY.observe(elapsed, (route, response.status_code))
+        REQUEST_QUERIES.observe(counter.count, (route,))
+        REQUEST_SQL_TIME.observe(counter.duration, (route,))
+        REQUEST_SERIALIZATION_TIME.observe(serialization, (route,))
+        if over_budget:
+            QUERY_BUDGET_OVERRUNS.inc((route,))
+
+        if settings.DEBUG:
+            response["X-Query-Count"] = str(counter.count)
+            response["X-Query-Time-Ms"] = f"{counter.duration * 1000:.2f}"
+            response["X-Serialization-Time-Ms"] = f"{serialization * 1000:.2f}"
+
+        if over_budget:
+            message = f"{route} ran {counter.count} queries, budget is {budget}"
+            if getattr(settings, "QUERY_BUDGET_STRICT", False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
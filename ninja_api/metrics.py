@@ -0,0 +1,257 @@
+"""
+Process-local metrics in the Prometheus text exposition format.
+
+Every thread writes to its own shard (a plain dict reached through a
+``threading.local``), so recording a sample never takes a lock; the shards
+are only summed when ``/api/metrics`` is scraped. The lock below is taken
+once per thread, when its shard is registered. The shards of threads that
+have finished are folded into one retired total then and on every scrape,
+so a server that keeps replacing its threads does not accumulate them.
+"""
+import threading
+from collections import defaultdict
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def add_shard(total, shard):
+    """Fold a ``defaultdict(float)`` shard into ``total`` by summing."""
+    for key, value in list(shard.items()):
+        total[key] += value
+
+
+class ThreadShards:
+    def __init__(self, factory=lambda: defaultdict(float), fold=add_shard):
+        self._factory = factory
+        self._fold = fold
+        self._local = threading.local()
+        self._shards = []
+        self._retired = factory()
+        self._lock = threading.Lock()
+
+    def local(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._factory()
+            with self._lock:
+                self._retire()
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _retire(self):
+        # A finished thread no longer writes to its shard. Hold the lock.
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._fold(self._retired, shard)
+        self._shards = live
+
+    def all(self):
+        with self._lock:
+            self._retire()
+            return [self._retired, *(shard for _, shard in self._shards)]
+
+    def merged(self):
+        total = self._factory()
+        for shard in self.all():
+            self._fold(total, shard)
+        return total
+
+    def clear(self):
+        for shard in self.all():
+            shard.clear()
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = ThreadShards()
+
+    def header(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+
+    def clear(self):
+        self._shards.clear()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, labels=(), amount=1):
+        self._shards.local()[tuple(labels)] += amount
+
+    def collect(self):
+        lines = self.header()
+        for labels, value in sorted(self._shards.merged().items()):
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} "
+                f"{_format_value(value)}"
+            )
+        return lines
+
+
+class Gauge(Counter):
+    """Summed across threads, so only ``inc``/``dec`` make sense."""
+
+    type = "gauge"
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        labels = tuple(labels)
+        shard = self._shards.local()
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                shard[(labels, index)] += 1
+                break
+        shard[(labels, "count")] += 1
+        shard[(labels, "sum")] += value
+
+    def collect(self):
+        merged = self._shards.merged()
+        series = sorted({labels for labels, _ in merged})
+        lines = self.header()
+        for labels in series:
+            cumulative = 0
+            for index, bound in enumerate(self.buckets):
+                cumulative += merged.get((labels, index), 0)
+                bucket = _format_labels(self.labelnames, labels, [("le", bound)])
+                lines.append(f"{self.name}_bucket{bucket} {_format_value(cumulative)}")
+            count = merged.get((labels, "count"), 0)
+            label_text = _format_labels(self.labelnames, labels)
+            inf = _format_labels(self.labelnames, labels, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{inf} {_format_value(count)}")
+            lines.append(
+                f"{self.name}_sum{label_text} "
+                f"{_format_value(merged.get((labels, 'sum'), 0))}"
+            )
+            lines.append(f"{self.name}_count{label_text} {_format_value(count)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """``collector()`` returns ready exposition lines, computed on scrape"""
+        self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.register(
+    Histogram(
+        "api_request_duration_seconds",
+        "API request latency by Ninja operation id and status code.",
+        ("operation_id", "status"),
+    )
+)
+REQUESTS_IN_FLIGHT = registry.register(
+    Gauge("api_requests_in_flight", "API requests currently being served.")
+)
+REQUEST_QUERIES = registry.register(
+    Histogram(
+        "api_request_db_queries",
+        "SQL queries run per API request.",
+        ("operation_id",),
+        buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+    )
+)
+REQUEST_SQL_TIME = registry.register(
+    Histogram(
+        "api_request_db_duration_seconds",
+        "Total SQL time per API request.",
+        ("operation_id",),
+    )
+)
+REQUEST_SERIALIZATION_TIME = registry.register(
+    Histogram(
+        "api_response_serialization_seconds",
+        "Response serialization time per API request.",
+        ("operation_id",),
+    )
+)
+QUERY_BUDGET_OVERRUNS = registry.register(
+    Counter(
+        "api_query_budget_exceeded_total",
+        "API requests that ran more SQL queries than their query_budget.",
+        ("operation_id",),
+    )
+)
+
+
+@registry.add_collector
+def auth_token_cache_metrics():
+    from auth_jwt.cache import token_cache
+
+    hits, misses = token_cache.hits, token_cache.misses
+    ratio = hits / (hits + misses) if hits + misses else 0.0
+    return [
+        "# HELP auth_token_cache_requests_total Access-token cache lookups.",
+        "# TYPE auth_token_cache_requests_total counter",
+        f'auth_token_cache_requests_total{{result="hit"}} {hits}',
+        f'auth_token_cache_requests_total{{result="miss"}} {misses}',
+        "# HELP auth_token_cache_hit_ratio Share of lookups answered by the cache.",
+        "# TYPE auth_token_cache_hit_ratio gauge",
+        f"auth_token_cache_hit_ratio {_format_value(ratio)}",
+    ]
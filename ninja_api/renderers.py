@@ -0,0 +1,65 @@
+import json
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from ninja.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSON renderer that leaves its duration on ``request.serialization_time``"""
+
+    def render(self, request, data, *, response_status):
+        started = time.perf_counter()
+        try:
+            return self.encode(data)
+        finally:
+            request.serialization_time = time.perf_counter() - started
+
+    def encode(self, data):
+        return json.dumps(data, cls=self.encoder_class, **self.json_dumps_params)
+
+
+class FastJSONRenderer(TimedJSONRenderer):
+    """
+    ``TimedJSONRenderer`` encoding with orjson when it is installed.
+
+    orjson handles dates, datetimes and UUIDs natively; anything else it
+    cannot encode (``Decimal``, pydantic models...) goes through Ninja's
+    encoder. Without orjson this is the plain ``json`` renderer.
+    """
+
+    def encode(self, data):
+        if orjson is None:
+            return super().encode(data)
+        return orjson.dumps(data, default=self.encoder_class().default)
+
+
+def trusted_response(request, data, response=None):
+    """
+    Render ``data`` straight to an ``HttpResponse``, skipping the pydantic
+    validation of the route's response schema.
+
+    Only for rows the view builds itself in the schema's exact shape
+    (typically ``.values()`` of the schema's columns). Headers set on the
+    temporal ``response``, if given, are kept. With ``API_TRUSTED_OUTPUT``
+    off ``data`` is returned as is and validated like any other result.
+    """
+    if not getattr(settings, "API_TRUSTED_OUTPUT", True):
+        return data
+
+    renderer = FastJSONRenderer()
+    content = renderer.render(request, data, response_status=200)
+    trusted = HttpResponse(
+        content, content_type=f"{renderer.media_type}; charset={renderer.charset}"
+    )
+    if response is not None:
+        for name, value in response.items():
+            if name != "Content-Type":
+                trusted[name] = value
+    return trusted
@@ -0,0 +1,165 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import parse_etags
+
+from .cache import acquire_fill, get_cache, release_fill, wait_for
+from .instrumentation import operation_id, resolve_operation
+
+
+KEY_PREFIX = "api-response"
+
+
+def cache_response(*namespaces, per_client=False):
+    """
+    Cache the serialized response of a GET view until any of ``namespaces``
+    is invalidated. ``per_client`` keys entries on the caller's IP too, for
+    views whose output depends on it. Handled by ``ResponseCacheMiddleware``;
+    apply it below the router decorator.
+    """
+
+    def decorator(view_func):
+        view_func.response_cache = (namespaces, per_client)
+        return view_func
+
+    return decorator
+
+
+def _generation_key(namespace):
+    return f"{KEY_PREFIX}:{namespace}:generation"
+
+
+def generations(namespaces):
+    """The current generation of each of ``namespaces``, in one lookup."""
+    cache = get_cache()
+    keys = [_generation_key(namespace) for namespace in namespaces]
+    values = cache.get_many(keys)
+    for key in keys:
+        if values.get(key) is None:
+            # Start from the clock, so an evicted counter never comes back
+            # to a value older entries were stored under.
+            cache.add(key, time.time_ns(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def _bump(namespaces):
+    cache = get_cache()
+    for namespace in namespaces:
+        key = _generation_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def invalidate(*namespaces):
+    """
+    Make every cached response of ``namespaces`` unreachable once the
+    current transaction commits, or right away outside of one. Until then
+    other requests cannot see the change, so their responses stay valid.
+    """
+    transaction.on_commit(lambda: _bump(namespaces))
+
+
+def make_etag(content):
+    return '"%s"' % hashlib.sha256(content).hexdigest()
+
+
+def etag_matches(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return "*" in etags or etag in (tag.removeprefix("W/") for tag in etags)
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    return response
+
+
+class ResponseCacheMiddleware(MiddlewareMixin):
+    """
+    Serves GET requests of views marked with ``cache_response`` from the
+    API cache (``ninja_api.cache``).
+
+    Entries hold the rendered bytes, headers and a strong ETag, and are keyed
+    on the Ninja operation, its namespaces' generations and the query string,
+    so a hit or a ``304 Not Modified`` never reaches the view or the ORM.
+    ``invalidate`` bumps the generation instead of deleting keys. On a miss
+    only one request renders the response, concurrent ones wait for it.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method != "GET":
+            return None
+        operation = resolve_operation(request)
+        marker = getattr(getattr(operation, "view_func", None), "response_cache", None)
+        if marker is None:
+            return None
+
+        namespaces, per_client = marker
+        parts = [
+            operation_id(operation),
+            *map(str, generations(namespaces)),
+            request.path,
+            urlencode(sorted(request.GET.lists()), doseq=True),
+        ]
+        if per_client:
+            parts.append(request.META.get("REMOTE_ADDR", ""))
+        digest = hashlib.sha256("\n".join(parts).encode()).hexdigest()
+        namespace = "+".join(namespaces)
+        key = request.response_cache_key = f"{KEY_PREFIX}:{namespace}:{digest}"
+
+        entry = get_cache().get(key)
+        if entry is None:
+            if acquire_fill(key):
+                request.response_cache_filling = True
+                return None
+            # Someone else is rendering this response: wait for it instead
+            # of running the same queries.
+            entry = wait_for(key)
+            if entry is None:
+                return None
+
+        etag, content, headers = entry
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response = HttpResponse(content)
+        for name, value in headers:
+            response[name] = value
+        return response
+
+    def process_response(self, request, response):
+        key = getattr(request, "response_cache_key", None)
+        if key is None:
+            return response
+        try:
+            if (
+                response.status_code != 200
+                or response.streaming
+                or response.get("ETag")
+            ):
+                return response
+
+            etag = make_etag(response.content)
+            response["ETag"] = etag
+            get_cache().set(
+                key,
+                (etag, response.content, list(response.items())),
+                getattr(settings, "API_RESPONSE_CACHE_TIMEOUT", 600),
+            )
+        finally:
+            if getattr(request, "response_cache_filling", False):
+                release_fill(key)
+
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        return response
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "ninja_api.instrumentation.QueryInstrumentationMiddleware",
+    "ninja_api.response_cache.ResponseCacheMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -85,6 +87,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # One SQLite file for all worker processes of this host. Point LOCATION
+    # at a tmpfs (e.g. /dev/shm) to keep it in memory.
+    "shared": {
+        "BACKEND": "ninja_api.cache_backends.SQLiteCache",
+        "LOCATION": BASE_DIR / "cache.sqlite3",
+        "OPTIONS": {"MAX_ENTRIES": 50000},
+    },
+}
+
+# CACHES alias used by the API caches (responses, single-flight locks).
+# "shared" makes cached entries and invalidations visible to every worker;
+# the per-process "default" only suits a single-process server.
+API_CACHE_ALIAS = "shared"
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -274,6 +298,46 @@ AUTH_USER_MODEL = "movie_ninja.CustomUser"
 NINJA_JWT_ALGORITHM = "HS256"
 NINJA_JWT_ACCESS_TOKEN_EXPIRES = 15
 NINJA_JWT_REFRESH_TOKEN_EXPIRES = 1440
+# Verify access tokens from their signature and claims only, without the
+# Token table lookup. Replaced or revoked tokens stay valid until they expire.
+NINJA_JWT_STATELESS_AUTH = False
+
+# Fail API requests that run more queries than their view's @query_budget
+# instead of only logging them.
+QUERY_BUDGET_STRICT = False
+
+# Serve the read endpoints from movie_ninja.async_views. Only useful under
+# an ASGI server (ninja_api.asgi); under WSGI every async view gets its own
+# event loop.
+API_ASYNC_VIEWS = False
+
+# Let list views render their .values() rows directly, without validating
+# every row against the response schema (ninja_api.renderers.trusted_response).
+API_TRUSTED_OUTPUT = True
+
+# Seconds a cached catalog response is kept; model signals drop it earlier.
+API_RESPONSE_CACHE_TIMEOUT = 600
+
+# Queue votes in memory and store them in batches (movie_ninja.ratings.RatingQueue);
+# POST /ratings then answers 202 before the vote is written.
+RATING_WRITE_BEHIND = False
+# Votes per batch, seconds between background flushes (0: no flusher thread)
+# and pending votes above which requests flush synchronously.
+RATING_BATCH_SIZE = 500
+RATING_FLUSH_INTERVAL = 0.5
+RATING_QUEUE_MAX = 10000
+
+# Seconds between background reloads of the in-memory suggest index, which
+# picks up titles and names changed by other worker processes (0: never).
+SUGGEST_REBUILD_INTERVAL = 300
+
+# Leaderboards (movie_ninja.charts): seconds between background re-scorings
+# of the movies rating and review writes marked (0: no thread, only chart
+# reads re-score), marks that wake the thread early, and seconds between
+# reloads of the charts other worker processes updated (0: never).
+CHARTS_FLUSH_INTERVAL = 1.0
+CHARTS_BATCH_SIZE = 100
+CHARTS_RELOAD_INTERVAL = 60
 
 
 # Default primary key field type
@@ -1,14 +1,28 @@
+from django.conf import settings
 from django.contrib import admin
+from django.http import HttpResponse
 from django.urls import path, include
 from ninja import NinjaAPI
 from auth_jwt.views import auth_router
+from movie_ninja.async_views import async_api_router
 from movie_ninja.views import api_router
+from .metrics import CONTENT_TYPE, registry
+from .renderers import FastJSONRenderer
 
 
-api = NinjaAPI()
+api = NinjaAPI(renderer=FastJSONRenderer())
 api.add_router('auth/', auth_router, tags=['auth'])
+if settings.API_ASYNC_VIEWS:
+    # Added first so its paths win over the sync views of the same name.
+    api.add_router('', async_api_router, tags=['api'])
 api.add_router('', api_router, tags=['api'])
 
+
+@api.get('/metrics', include_in_schema=False)
+def metrics(request):
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
+
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', api.urls),
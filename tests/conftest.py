@@ -7,11 +7,77 @@ from movie_ninja.models import (
     Review,
     RatingStar,
 )
+from django.test import Client
 from ninja.testing import TestClient
+from ninja_api import urls
+from auth_jwt.cache import token_cache
 from auth_jwt.views import auth_router
+from movie_ninja.charts import leaderboards
+from movie_ninja.ratings import clear_star_values, rating_queue
+from movie_ninja.suggest import suggest_index
 from movie_ninja.views import api_router
 
 
+@pytest.fixture
+def api_client():
+    """
+    Django test client going through the URLconf, middleware and the
+    project NinjaAPI. TestClient(router) rebinds routers to a bare API, so
+    they are attached back first.
+    """
+    api_router.set_api_instance(urls.api)
+    auth_router.set_api_instance(urls.api)
+    return Client()
+
+
+@pytest.fixture(autouse=True)
+def strict_query_budgets(settings):
+    settings.QUERY_BUDGET_STRICT = True
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def isolated_response_cache(settings, tmp_path):
+    """
+    An empty shared API cache in a file of the test's own, not the
+    cache.sqlite3 of the working tree that a local server or another test
+    run uses.
+    """
+    shared = {**settings.CACHES["shared"], "LOCATION": tmp_path / "cache.sqlite3"}
+    settings.CACHES = {**settings.CACHES, "shared": shared}
+
+
+@pytest.fixture(autouse=True)
+def clear_rating_state():
+    """Star ids are reused after a rollback; queued votes must not leak."""
+    clear_star_values()
+    yield
+    clear_star_values()
+    rating_queue._pending.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_suggest_index():
+    suggest_index.clear()
+    yield
+    suggest_index.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_leaderboards(settings):
+    # No flusher thread: it would not see the test's transaction.
+    settings.CHARTS_FLUSH_INTERVAL = 0
+    leaderboards.clear()
+    yield
+    leaderboards.clear()
+
+
 @pytest.mark.django_db
 @pytest.fixture
 def setup():
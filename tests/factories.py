@@ -36,14 +36,18 @@ class TokenFactory(DjangoModelFactory):
         model = Token
 
     user = factory.SubFactory(CustomUserFactory)
-    access_token = faker.pystr_format(
-        string_format="????-????-????-????",
-        letters="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789",
+    access_token = factory.LazyFunction(
+        lambda: faker.pystr_format(
+            string_format="????-????-????-????",
+            letters="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789",
+        )
     )
     access_token_expires_at = timezone.now() + timedelta(minutes=60)
-    refresh_token = faker.pystr_format(
-        string_format="????-????-????-????",
-        letters="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789",
+    refresh_token = factory.LazyFunction(
+        lambda: faker.pystr_format(
+            string_format="????-????-????-????",
+            letters="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789",
+        )
     )
     refresh_token_expires_at = timezone.now() + timedelta(days=30)
 
@@ -1,8 +1,50 @@
+import importlib
 import pytest, json
-from ninja.testing import TestClient
-from movie_ninja.views import api_router
+from copy import copy
+from django.db import IntegrityError, connection, transaction
+from io import StringIO
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
+from django.db.models.deletion import Collector
+from django.urls import clear_url_caches
+from django.utils import timezone
+from datetime import date
+from decimal import Decimal
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from ninja.testing import TestAsyncClient, TestClient
+from movie_ninja.async_views import async_api_router
+from movie_ninja.views import api_router, list_movies
+from ninja_api.instrumentation import QueryBudgetExceeded, route_stats
+from ninja_api import renderers, urls
+from auth_jwt.views import auth_router
+from ninja_api.cache import get_cache
+from ninja_api.metrics import ThreadShards, registry
 from ninja_extra import status
-from movie_ninja.schemas import MovieListSchema
+from movie_ninja.schemas import ChartEntrySchema, MovieListSchema
+from django.contrib.admin import site
+from movie_ninja.admin import MovieAdmin
+from movie_ninja.charts import TopN
+from movie_ninja.models import Actor, ChartEntry, Movie, Rating, RatingStar, Token
+from movie_ninja.pagination import DEFAULT_PAGE_SIZE, NEXT_CURSOR_HEADER
+from movie_ninja.reviews import (
+    DETAIL_THREAD_CHILDREN,
+    DETAIL_THREAD_DEPTH,
+    detail_reviews,
+    subtree_reviews,
+    thread_reviews,
+)
+from movie_ninja.ratings import rating_queue, star_values
+from movie_ninja.suggest import suggest_index
+from .factories import (
+    ActorFactory,
+    CategoryFactory,
+    GenreFactory,
+    MovieFactory,
+    ReviewFactory,
+    TokenFactory,
+)
+import threading
 import time
 
 
@@ -152,3 +194,1276 @@ def test_create_rating(status_code, rating_stars_creation, movie_creation):
     )
 
     assert response.status_code == status_code
+
+
+@pytest.mark.django_db
+def test_list_movies_cursor_pagination(django_assert_num_queries):
+    category = CategoryFactory()
+    movies = MovieFactory.create_batch(5, category=category, poster="poster.jpg")
+
+    with django_assert_num_queries(1):
+        response = client.get("/movies?limit=2")
+    assert response.status_code == 200
+    assert [m["id"] for m in response.json()] == [m.id for m in movies[:2]]
+    assert response.json()[0]["category"] == category.name
+
+    seen = [m["id"] for m in response.json()]
+    cursor = response[NEXT_CURSOR_HEADER]
+    while cursor:
+        response = client.get(f"/movies?limit=2&after={cursor}")
+        assert response.status_code == 200
+        seen.extend(m["id"] for m in response.json())
+        cursor = response._response.get(NEXT_CURSOR_HEADER)
+
+    assert seen == [m.id for m in movies]
+
+
+@pytest.mark.django_db
+def test_list_movies_invalid_cursor():
+    response = client.get("/movies?after=not-a-cursor")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_rating_aggregate_in_movie_list(movie_creation):
+    four = RatingStar.objects.create(value=4)
+    two = RatingStar.objects.create(value=2)
+    votes = [("10.0.0.1", four), ("10.0.0.2", four), ("10.0.0.1", two)]
+    for ip, star in votes:
+        data = {"ip": ip, "star_id": star.id, "movie_id": movie_creation.id}
+        response = client.post("/ratings", json=data)
+        assert response.status_code == 201
+
+    movie_creation.refresh_from_db()
+    assert movie_creation.rating_count == 2
+    assert movie_creation.rating_sum == 6
+    assert movie_creation.rating_avg == 3
+
+    response = client.get("/movies", META={"REMOTE_ADDR": "10.0.0.2"})
+    assert response.json()[0]["middle_star"] == 3
+    assert response.json()[0]["rating_user"] is True
+
+    response = client.get("/movies", META={"REMOTE_ADDR": "10.0.0.3"})
+    assert response.json()[0]["rating_user"] is False
+
+
+@pytest.mark.django_db
+def test_create_rating_is_two_statements(movie_creation, django_assert_num_queries):
+    four = RatingStar.objects.create(value=4)
+    two = RatingStar.objects.create(value=2)
+    unknown = {"ip": "10.0.0.9", "star_id": four.id, "movie_id": 0}
+    assert client.post("/ratings", json=unknown).status_code == 404
+
+    for star in (four, two, two):
+        data = {"ip": "10.0.0.1", "star_id": star.id, "movie_id": movie_creation.id}
+        # The aggregate UPDATE, then the upsert.
+        with django_assert_num_queries(2):
+            response = client.post("/ratings", json=data)
+        assert response.status_code == 201
+        assert response.json() == data
+
+    assert list(Rating.objects.values_list("ip", "star_id")) == [("10.0.0.1", two.id)]
+    movie_creation.refresh_from_db()
+    assert (movie_creation.rating_count, movie_creation.rating_sum) == (1, 2)
+
+
+@pytest.mark.django_db
+def test_rating_aggregate_follows_orm_writes(movie_creation):
+    four = RatingStar.objects.create(value=4)
+    two = RatingStar.objects.create(value=2)
+    other = MovieFactory()
+    first = Rating.objects.create(ip="10.0.0.1", movie=movie_creation, star=four)
+    second = Rating.objects.create(ip="10.0.0.2", movie=movie_creation, star=two)
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Rating.objects.create(ip="10.0.0.1", movie=movie_creation, star=two)
+
+    movie_creation.refresh_from_db()
+    assert (movie_creation.rating_count, movie_creation.rating_avg) == (2, 3)
+    updated_at = movie_creation.updated_at
+
+    second.movie = other
+    second.save()
+    first.delete()
+    movie_creation.refresh_from_db()
+    assert (movie_creation.rating_count, movie_creation.rating_sum) == (0, 0)
+    assert movie_creation.rating_avg == 0
+    assert movie_creation.updated_at > updated_at
+    other.refresh_from_db()
+    assert (other.rating_count, other.rating_avg) == (1, 2)
+
+
+@pytest.mark.django_db
+def test_movie_delete_skips_rating_aggregate(movie_creation):
+    star = RatingStar.objects.create(value=4)
+    Rating.objects.bulk_create(
+        Rating(ip=f"10.0.0.{number}", movie=movie_creation, star=star)
+        for number in range(20)
+    )
+    star_values()
+
+    with CaptureQueriesContext(connection) as queries:
+        movie_creation.delete()
+
+    movie_table = Movie._meta.db_table
+    assert not [q for q in queries if q["sql"].startswith(f'UPDATE "{movie_table}"')]
+    assert len(queries) < 20
+
+
+@pytest.mark.django_db(transaction=True)
+def test_movie_table_rebuild_keeps_rating_aggregates(movie_creation):
+    # Altering a column makes SQLite copy the movie table into a new one.
+    field = Movie._meta.get_field("tagline")
+    wider = copy(field)
+    wider.max_length = field.max_length + 50
+    with connection.schema_editor() as editor:
+        editor.alter_field(Movie, field, wider)
+        editor.alter_field(Movie, wider, field)
+
+    star = RatingStar.objects.create(value=4)
+    data = {"ip": "10.0.0.1", "star_id": star.id, "movie_id": movie_creation.id}
+    assert client.post("/ratings", json=data).status_code == 201
+    movie_creation.refresh_from_db()
+    assert (movie_creation.rating_count, movie_creation.rating_avg) == (1, 4)
+
+
+@pytest.mark.django_db
+def test_rating_write_behind(settings, movie_creation):
+    settings.RATING_WRITE_BEHIND = True
+    settings.RATING_FLUSH_INTERVAL = 0
+    four = RatingStar.objects.create(value=4)
+    two = RatingStar.objects.create(value=2)
+    other = MovieFactory()
+    Rating.objects.create(ip="10.0.0.3", movie=movie_creation, star=two)
+
+    votes = [
+        ("10.0.0.1", movie_creation, four),
+        ("10.0.0.1", movie_creation, two),
+        ("10.0.0.2", movie_creation, four),
+        ("10.0.0.3", movie_creation, four),
+        ("10.0.0.1", other, four),
+    ]
+    for ip, movie, star in votes:
+        data = {"ip": ip, "star_id": star.id, "movie_id": movie.id}
+        response = client.post("/ratings", json=data)
+        assert response.status_code == 202
+        assert response.json() == data
+    assert Rating.objects.count() == 1
+    assert len(rating_queue) == 4
+
+    assert rating_queue.flush() == 4
+    assert len(rating_queue) == 0
+    stored = Rating.objects.values_list("ip", "movie_id", "star__value")
+    assert sorted(stored) == [
+        ("10.0.0.1", movie_creation.id, 2),
+        ("10.0.0.1", other.id, 4),
+        ("10.0.0.2", movie_creation.id, 4),
+        ("10.0.0.3", movie_creation.id, 4),
+    ]
+    movie_creation.refresh_from_db()
+    assert (movie_creation.rating_count, movie_creation.rating_sum) == (3, 10)
+    other.refresh_from_db()
+    assert (other.rating_count, other.rating_avg) == (1, 4)
+
+
+@pytest.mark.django_db
+def test_rating_write_behind_flushes_full_queue(settings, movie_creation):
+    settings.RATING_WRITE_BEHIND = True
+    settings.RATING_FLUSH_INTERVAL = 0
+    settings.RATING_BATCH_SIZE = 3
+    star = RatingStar.objects.create(value=5)
+
+    for n in range(4):
+        data = {"ip": f"10.0.0.{n}", "star_id": star.id, "movie_id": movie_creation.id}
+        assert client.post("/ratings", json=data).status_code == 202
+
+    assert Rating.objects.count() == 3
+    assert len(rating_queue) == 1
+
+
+@pytest.mark.django_db
+def test_create_rating_validation(settings, movie_creation):
+    star = RatingStar.objects.create(value=5)
+    for write_behind in (False, True):
+        settings.RATING_WRITE_BEHIND = write_behind
+        data = {"ip": "10.0.0.1", "star_id": star.id + 1, "movie_id": movie_creation.id}
+        assert client.post("/ratings", json=data).status_code == 404
+        data = {"ip": "10.0.0.1", "star_id": star.id, "movie_id": movie_creation.id + 1}
+        assert client.post("/ratings", json=data).status_code == 404
+    assert len(rating_queue) == 0
+
+
+@pytest.mark.django_db
+def test_get_movie_detail_query_budget(django_assert_max_num_queries):
+    movie = MovieFactory(poster="poster.jpg")
+    movie.actors.set(ActorFactory.create_batch(5, image="actor.jpg"))
+    movie.directors.set(ActorFactory.create_batch(2, image="director.jpg"))
+    movie.genres.set(GenreFactory.create_batch(3))
+    root = ReviewFactory(movie=movie)
+    ReviewFactory.create_batch(3, movie=movie, parent=root)
+
+    with django_assert_max_num_queries(5):
+        response = client.get(f"/movies/{movie.id}")
+
+    assert response.status_code == 200
+    movie_data = response.json()
+    assert len(movie_data["actors"]) == 5
+    assert set(movie_data["directors"][0]) == {"id", "name", "image"}
+    assert len(movie_data["genres"]) == 3
+    assert movie_data["category"] == movie.category.name
+    assert movie_data["fees_in_world"] == movie.fess_in_world
+    assert [r["id"] for r in movie_data["reviews"]] == [root.id]
+    assert len(movie_data["reviews"][0]["children"]) == 3
+
+
+@pytest.mark.django_db
+def test_get_movie_reviews_tree(movie_creation, django_assert_num_queries):
+    root = ReviewFactory(movie=movie_creation)
+    parent = root
+    for _ in range(5):
+        parent = ReviewFactory(movie=movie_creation, parent=parent)
+    ReviewFactory.create_batch(3, movie=movie_creation, parent=root)
+    other_root = ReviewFactory(movie=movie_creation)
+
+    with django_assert_num_queries(2):
+        response = client.get(f"/movies/{movie_creation.id}/reviews")
+
+    assert response.status_code == 200
+    roots = response.json()
+    assert [r["id"] for r in roots] == [root.id, other_root.id]
+    assert len(roots[0]["children"]) == 4
+
+    depth, node = 0, roots[0]
+    while node["children"]:
+        node = node["children"][0]
+        depth += 1
+    assert depth == 5
+
+
+@pytest.mark.django_db
+def test_get_movie_reviews_paginated_and_truncated(movie_creation):
+    roots = ReviewFactory.create_batch(3, movie=movie_creation)
+    replies = ReviewFactory.create_batch(4, movie=movie_creation, parent=roots[0])
+    ReviewFactory(movie=movie_creation, parent=replies[0])
+
+    response = client.get(
+        f"/movies/{movie_creation.id}/reviews?limit=2&children_limit=3&max_depth=2"
+    )
+    assert response.status_code == 200
+    page = response.json()
+    assert [r["id"] for r in page] == [roots[0].id, roots[1].id]
+    assert [r["id"] for r in page[0]["children"]] == [r.id for r in replies[:3]]
+    assert page[0]["more_replies"] == 1
+    assert page[0]["children"][0]["children"] == []
+    assert page[0]["children"][0]["more_replies"] == 1
+
+    next_page = client.get(
+        f"/movies/{movie_creation.id}/reviews?after={response[NEXT_CURSOR_HEADER]}"
+    )
+    assert [r["id"] for r in next_page.json()] == [roots[2].id]
+
+    more = client.get(
+        f"/reviews/{roots[0].id}/replies?after={page[0]['replies_cursor']}"
+    )
+    assert more.status_code == 200
+    assert [r["id"] for r in more.json()] == [replies[3].id]
+
+
+@pytest.mark.django_db
+def test_get_movie_detail_limits_reviews(movie_creation):
+    roots = ReviewFactory.create_batch(DEFAULT_PAGE_SIZE + 1, movie=movie_creation)
+    ReviewFactory.create_batch(
+        DETAIL_THREAD_CHILDREN + 2, movie=movie_creation, parent=roots[0]
+    )
+    parent = roots[1]
+    for _ in range(DETAIL_THREAD_DEPTH + 2):
+        parent = ReviewFactory(movie=movie_creation, parent=parent)
+
+    movie = client.get(f"/movies/{movie_creation.id}").json()
+
+    assert [r["id"] for r in movie["reviews"]] == [
+        r.id for r in roots[:DEFAULT_PAGE_SIZE]
+    ]
+    assert len(movie["reviews"][0]["children"]) == DETAIL_THREAD_CHILDREN
+    assert movie["reviews"][0]["more_replies"] == 2
+    depth, node = 1, movie["reviews"][1]
+    while node["children"]:
+        node = node["children"][0]
+        depth += 1
+    assert depth == DETAIL_THREAD_DEPTH
+    assert node["more_replies"] == 1
+
+    rest = client.get(
+        f"/movies/{movie_creation.id}/reviews?after={movie['reviews_cursor']}"
+    )
+    assert [r["id"] for r in rest.json()] == [roots[-1].id]
+
+
+@pytest.mark.django_db
+def test_get_review_replies_loads_the_subtree(movie_creation):
+    root, other = ReviewFactory.create_batch(2, movie=movie_creation)
+    ReviewFactory.create_batch(3, movie=movie_creation, parent=other)
+    chain = [root]
+    for _ in range(4):
+        chain.append(ReviewFactory(movie=movie_creation, parent=chain[-1]))
+
+    response = client.get(f"/reviews/{root.id}/replies?max_depth=2")
+
+    assert response.status_code == 200
+    replies = response.json()
+    assert [r["id"] for r in replies] == [chain[1].id]
+    assert [r["id"] for r in replies[0]["children"]] == [chain[2].id]
+    assert replies[0]["children"][0]["more_replies"] == 1
+    # Neither the other thread nor the levels below the one counted are read.
+    assert list(subtree_reviews(root.id, 2).order_by("id")) == chain[1:4]
+    assert client.get(f"/reviews/{other.id}/replies").json()[0]["children"] == []
+
+
+@pytest.mark.django_db
+def test_movie_review_pages_load_their_threads(movie_creation):
+    roots = ReviewFactory.create_batch(4, movie=movie_creation)
+    chain = [roots[1]]
+    for _ in range(3):
+        chain.append(ReviewFactory(movie=movie_creation, parent=chain[-1]))
+    ReviewFactory(movie=movie_creation, parent=roots[3])
+    ReviewFactory(movie=MovieFactory())
+
+    page = client.get(f"/movies/{movie_creation.id}/reviews?limit=1&max_depth=1")
+    after = page[NEXT_CURSOR_HEADER]
+    second = client.get(f"/movies/{movie_creation.id}/reviews?limit=1&after={after}")
+
+    assert [r["id"] for r in page.json()] == [roots[0].id]
+    assert [r["id"] for r in second.json()] == [roots[1].id]
+    # The page's roots, one more to find the next page, and their replies
+    # down to the level counted in more_replies; never the whole movie.
+    loaded = thread_reviews(movie_creation.id, after, limit=1, max_depth=1)
+    assert list(loaded.order_by("id")) == [roots[1], roots[2], chain[1]]
+    detail = detail_reviews(movie_creation.id).order_by("id")
+    assert list(detail) == [*roots, *chain[1:], roots[3].children.get()]
+    invalid = client.get(f"/movies/{movie_creation.id}/reviews?after=broken")
+    assert invalid.status_code == 400
+
+
+@pytest.mark.django_db
+def test_query_instrumentation_headers_and_stats(movie_creation, api_client, settings):
+    settings.DEBUG = True
+    route_stats.reset()
+
+    response = api_client.get("/api/movies")
+
+    assert response.status_code == 200
+    assert response["X-Query-Count"] == "2"
+    assert float(response["X-Query-Time-Ms"]) >= 0
+    assert float(response["X-Serialization-Time-Ms"]) > 0
+
+    stats = route_stats.snapshot()["movie_ninja_views_list_movies"]
+    assert stats["requests"] == 1
+    assert stats["queries"] == 2
+    assert stats["over_budget"] == 0
+
+
+@pytest.mark.django_db
+def test_query_budget_exceeded_fails(movie_creation, api_client, monkeypatch):
+    monkeypatch.setattr(list_movies, "query_budget", 0)
+
+    with pytest.raises(QueryBudgetExceeded):
+        api_client.get("/api/movies")
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(movie_creation, api_client):
+    registry.clear()
+    api_client.get("/api/movies")
+
+    response = api_client.get("/api/metrics")
+
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+    body = response.content.decode()
+    labels = 'operation_id="movie_ninja_views_list_movies",status="200"'
+    assert f"api_request_duration_seconds_count{{{labels}}} 1" in body
+    assert f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1' in body
+    assert (
+        'api_request_db_queries_bucket{operation_id="movie_ninja_views_list_movies",'
+        'le="2"} 1' in body
+    )
+    assert "api_requests_in_flight 1" in body
+    assert "auth_token_cache_hit_ratio" in body
+    assert (
+        'api_response_serialization_seconds_count{operation_id="movie_ninja_views_'
+        'list_movies"} 1' in body
+    )
+    assert "api_query_budget_exceeded_total{" not in body
+
+
+@pytest.mark.django_db
+def test_metrics_count_query_budget_overruns(
+    movie_creation, api_client, monkeypatch, settings
+):
+    settings.QUERY_BUDGET_STRICT = False
+    monkeypatch.setattr(list_movies, "query_budget", 0)
+    registry.clear()
+    route_stats.reset()
+    api_client.get("/api/movies")
+
+    body = api_client.get("/api/metrics").content.decode()
+
+    assert (
+        'api_query_budget_exceeded_total{operation_id="movie_ninja_views_'
+        'list_movies"} 1' in body
+    )
+    assert route_stats.snapshot()["movie_ninja_views_list_movies"]["over_budget"] == 1
+
+
+def test_thread_shards_retire_finished_threads():
+    shards = ThreadShards()
+    shards.local()["hits"] += 1
+
+    def record():
+        shards.local()["hits"] += 2
+
+    threads = [threading.Thread(target=record) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+
+    assert shards.merged()["hits"] == 7
+    # The main thread's shard is live; the three finished ones are folded.
+    assert len(shards.all()) == 2
+    shards.clear()
+    assert shards.merged()["hits"] == 0
+
+
+@pytest.mark.django_db
+def test_async_views_match_sync(movie_creation, reviews_creation, actor_creation):
+    reply = ReviewFactory(movie=movie_creation, parent=reviews_creation["review1"])
+    ReviewFactory(movie=movie_creation, parent=reply)
+    MovieFactory.create_batch(3)
+    sync_client = TestClient(api_router)
+    async_client = TestAsyncClient(async_api_router)
+    paths = [
+        "/actors",
+        f"/actors/{actor_creation['id']}",
+        "/actors/0",
+        "/movies?limit=2",
+        "/movies?after=broken",
+        f"/movies?year_min={movie_creation.year}&draft=false",
+        f"/movies/{movie_creation.id}",
+        "/movies/0",
+        f"/movies/{movie_creation.id}/reviews?max_depth=2",
+        "/movies/0/reviews",
+    ]
+
+    for path in paths:
+        expected = sync_client.get(path)
+        response = async_to_sync(async_client.get)(path)
+        assert response.status_code == expected.status_code, path
+        assert response.json() == expected.json(), path
+        assert response.get(NEXT_CURSOR_HEADER) == expected.get(NEXT_CURSOR_HEADER)
+
+
+def _reload_urlconf():
+    # Each router refuses a second API unless detached first.
+    for router in (auth_router, async_api_router, api_router):
+        router.api = None
+    importlib.reload(urls)
+    clear_url_caches()
+
+
+@pytest.fixture
+def async_urlconf(settings, monkeypatch):
+    """The project URLconf as loaded with ``API_ASYNC_VIEWS`` on."""
+    monkeypatch.setenv("NINJA_SKIP_REGISTRY", "1")
+    settings.API_ASYNC_VIEWS = True
+    _reload_urlconf()
+    yield
+    settings.API_ASYNC_VIEWS = False
+    _reload_urlconf()
+
+
+@pytest.mark.django_db
+def test_async_urlconf_keeps_static_movie_paths(
+    async_urlconf, movie_creation, api_client
+):
+    for path in [
+        "/api/movies/search?q=test",
+        "/api/movies/facets",
+        "/api/movies/export",
+        "/api/charts/top-rated",
+        f"/api/movies/{movie_creation.id}",
+        f"/api/movies/{movie_creation.id}/reviews",
+    ]:
+        assert api_client.get(path).status_code == 200, path
+    assert api_client.get("/api/movies/0").status_code == 404
+    # Reaches the sync route, which wants a staff token.
+    assert api_client.post("/api/movies/bulk").status_code == 401
+
+
+@pytest.mark.django_db
+def test_query_instrumentation_async_chain(movie_creation, api_client, settings):
+    settings.DEBUG = True
+
+    response = async_to_sync(AsyncClient().get)("/api/movies")
+
+    assert response.status_code == 200
+    assert response["X-Query-Count"] == "2"
+
+
+@pytest.mark.django_db
+def test_response_cache_etag(
+    actor_creation, api_client, settings, django_capture_on_commit_callbacks
+):
+    settings.DEBUG = True
+
+    first = api_client.get("/api/actors")
+    etag = first["ETag"]
+    cached = api_client.get("/api/actors")
+    not_modified = api_client.get("/api/actors", HTTP_IF_NONE_MATCH=etag)
+
+    assert first["X-Query-Count"] == "1"
+    assert cached.status_code == 200
+    assert cached.content == first.content
+    assert cached["ETag"] == etag
+    assert cached["X-Query-Count"] == "0"
+    assert not_modified.status_code == 304
+    assert not_modified["ETag"] == etag
+    assert not_modified["X-Query-Count"] == "0"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ActorFactory(image="new.jpg")
+    changed = api_client.get("/api/actors", HTTP_IF_NONE_MATCH=etag)
+
+    assert changed.status_code == 200
+    assert changed["ETag"] != etag
+    assert len(changed.json()) == 2
+
+
+@pytest.mark.django_db
+def test_response_cache_keys_on_params_and_client(api_client):
+    MovieFactory.create_batch(3)
+
+    two = api_client.get("/api/movies?limit=2")
+    three = api_client.get("/api/movies?limit=3")
+    other_client = api_client.get("/api/movies?limit=2", REMOTE_ADDR="10.0.0.2")
+
+    assert len(two.json()) == 2
+    assert len(three.json()) == 3
+    assert (
+        two[NEXT_CURSOR_HEADER]
+        == api_client.get("/api/movies?limit=2")[NEXT_CURSOR_HEADER]
+    )
+    assert other_client.content == two.content
+
+
+@pytest.mark.django_db
+def test_response_cache_invalidation(
+    movie_creation, api_client, rf, settings, django_capture_on_commit_callbacks
+):
+    settings.DEBUG = True
+    path = f"/api/movies/{movie_creation.id}"
+    etag = api_client.get(path)["ETag"]
+
+    # Invalidations wait for the commit, which the test transaction never does.
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        movie_creation.genres.add(GenreFactory(name="Noir"))
+    assert callbacks
+    response = api_client.get(path)
+    assert response.json()["genres"] == ["Noir"]
+    assert response["ETag"] != etag
+    assert api_client.get(path)["X-Query-Count"] == "0"
+
+    admin = MovieAdmin(Movie, site)
+    admin.message_user = lambda request, message: None
+    with django_capture_on_commit_callbacks(execute=True):
+        admin.unpublish(rf.get("/"), Movie.objects.all())
+    assert api_client.get(path)["X-Query-Count"] != "0"
+
+
+@pytest.mark.django_db
+def test_vote_invalidates_only_rating_responses(
+    movie_creation, api_client, settings, django_capture_on_commit_callbacks
+):
+    settings.DEBUG = True
+    star = RatingStar.objects.create(value=4)
+    paths = [
+        f"/api/movies/{movie_creation.id}",
+        "/api/movies/facets",
+        "/api/movies",
+        "/api/charts/top-rated",
+    ]
+    for path in paths:
+        assert api_client.get(path).status_code == 200
+
+    vote = {"ip": "10.0.0.1", "star_id": star.id, "movie_id": movie_creation.id}
+    with django_capture_on_commit_callbacks(execute=True):
+        assert (
+            api_client.post("/api/ratings", vote, "application/json").status_code == 201
+        )
+
+    detail, facets, listing, chart = [api_client.get(path) for path in paths]
+    assert detail["X-Query-Count"] == facets["X-Query-Count"] == "0"
+    assert listing["X-Query-Count"] != "0"
+    assert listing.json()[0]["middle_star"] == 4
+    assert [entry["score"] for entry in chart.json()] == [4]
+
+
+@pytest.mark.django_db
+def test_uncached_models_fast_delete():
+    for queryset in (
+        Token.objects.all(),
+        ChartEntry.objects.all(),
+        Movie.genres.through.objects.all(),
+    ):
+        assert Collector(using="default").can_fast_delete(queryset)
+    assert not Collector(using="default").can_fast_delete(Movie.objects.all())
+
+
+@pytest.mark.django_db
+def test_trusted_output_matches_validated_output(api_client, settings):
+    MovieFactory.create_batch(3, category=None)
+    MovieFactory.create_batch(2)
+    ActorFactory.create_batch(2, image="actor.jpg")
+
+    for path in ("/api/movies?limit=3", "/api/actors"):
+        trusted = api_client.get(path)
+        settings.API_TRUSTED_OUTPUT = False
+        get_cache().clear()
+        validated = api_client.get(path)
+        settings.API_TRUSTED_OUTPUT = True
+
+        assert trusted.status_code == validated.status_code == 200
+        assert trusted["Content-Type"] == validated["Content-Type"]
+        assert trusted.json() == validated.json()
+        assert trusted.get(NEXT_CURSOR_HEADER) == validated.get(NEXT_CURSOR_HEADER)
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_fast_json_renderer(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(renderers, "orjson", None)
+    request = type("Request", (), {})()
+    data = {"day": date(2023, 1, 2), "price": Decimal("1.50"), "items": [1, "a"]}
+
+    content = renderers.FastJSONRenderer().render(request, data, response_status=200)
+
+    assert json.loads(content) == {
+        "day": "2023-01-02",
+        "price": "1.50",
+        "items": [1, "a"],
+    }
+    assert request.serialization_time >= 0
+
+
+def _search(api_client, query, **params):
+    response = api_client.get("/api/movies/search", {"q": query, **params})
+    assert response.status_code == 200
+    return [movie["title"] for movie in response.json()], response
+
+
+@pytest.mark.django_db
+def test_search_movies(api_client, settings, django_capture_on_commit_callbacks):
+    settings.DEBUG = True
+    kwargs = dict(description="<p>A quiet film</p>", category=None)
+    star = MovieFactory(title="Звёздные войны", tagline="", **kwargs)
+    trek = MovieFactory(title="Star Trek", tagline="", **kwargs)
+    nebula = MovieFactory(title="Nebula", tagline="Stars collide", **kwargs)
+    MovieFactory(title="Star Draft", tagline="", draft=True, **kwargs)
+    MovieFactory(title="Solaris", tagline="", **kwargs)
+    actor = ActorFactory(name="Harrison Ford", image="actor.jpg")
+    star.actors.add(actor)
+    trek.genres.add(GenreFactory(name="Космос"))
+
+    titles, response = _search(api_client, "star")
+    # Titles weigh more than taglines; drafts are not listed.
+    assert titles == ["Star Trek", "Nebula"]
+    assert response["X-Query-Count"] == "3"
+    assert _search(api_client, "ЗВЕЗДНЫЕ")[0] == ["Звёздные войны"]
+    assert _search(api_client, "harr")[0] == ["Звёздные войны"]
+    assert _search(api_client, "космос st")[0] == ["Star Trek"]
+    # Descriptions are indexed without their HTML tags.
+    assert len(_search(api_client, "quiet")[0]) == 4
+    assert _search(api_client, "p")[0] == []
+    assert _search(api_client, "?!")[0] == []
+    assert api_client.get("/api/movies/search?q=").status_code == 422
+
+    with django_capture_on_commit_callbacks(execute=True):
+        actor.name = "Mark Hamill"
+        actor.save()
+    assert _search(api_client, "harrison")[0] == []
+    assert _search(api_client, "hamill")[0] == ["Звёздные войны"]
+    with django_capture_on_commit_callbacks(execute=True):
+        star.actors.clear()
+    assert _search(api_client, "hamill")[0] == []
+    with django_capture_on_commit_callbacks(execute=True):
+        nebula.delete()
+    assert _search(api_client, "star")[0] == ["Star Trek"]
+
+
+@pytest.mark.django_db
+def test_search_movies_pagination(api_client):
+    movies = MovieFactory.create_batch(
+        5, title="Alien", tagline="", description="", category=None
+    )
+
+    titles, response = _search(api_client, "alien", limit=2)
+    seen = [movie["id"] for movie in response.json()]
+    while cursor := response.get(NEXT_CURSOR_HEADER):
+        response = _search(api_client, "alien", limit=2, after=cursor)[1]
+        seen += [movie["id"] for movie in response.json()]
+    assert seen == [movie.id for movie in movies]
+
+    response = api_client.get("/api/movies/search?q=alien&after=bad")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_rebuild_search_index(api_client):
+    MovieFactory.create_batch(2, title="Heat", category=None)
+    Movie.objects.filter(title="Heat").update(title="Ronin")
+    out = StringIO()
+
+    call_command("rebuild_search_index", stdout=out)
+
+    assert "Indexed 2 movies" in out.getvalue()
+    assert _search(api_client, "heat")[0] == []
+    assert _search(api_client, "ronin")[0] == ["Ronin", "Ronin"]
+
+
+@pytest.mark.django_db
+def test_admin_movie_search(rf):
+    MovieFactory(title="Blade Runner", category=CategoryFactory(name="Cyberpunk"))
+    MovieFactory(title="Runaway Train", category=None)
+    MovieFactory(title="Heat", category=None)
+    admin = MovieAdmin(Movie, site)
+
+    for term, expected in (("runner", 1), ("run", 2), ("cyberpunk", 1)):
+        movies, _ = admin.get_search_results(rf.get("/"), Movie.objects.all(), term)
+        assert movies.count() == expected
+
+
+def _suggest(api_client, prefix, limit=10):
+    response = api_client.get("/api/suggest", {"prefix": prefix, "limit": limit})
+    assert response.status_code == 200
+    return [(item["kind"], item["label"]) for item in response.json()]
+
+
+@pytest.mark.django_db
+def test_suggest(api_client, settings):
+    settings.DEBUG = True
+    wars = MovieFactory(title="Star Wars", category=None)
+    MovieFactory(title="Звёздные войны", category=None)
+    MovieFactory(title="Starship Troopers", category=None)
+    MovieFactory(title="Star Draft", draft=True, category=None)
+    ActorFactory(name="Ringo Starr", image="actor.jpg")
+    suggest_index.build()
+
+    response = api_client.get("/api/suggest?prefix=star")
+    assert response["X-Query-Count"] == "0"
+    assert _suggest(api_client, "star") == [
+        ("movie", "Star Wars"),
+        ("movie", "Starship Troopers"),
+        ("actor", "Ringo Starr"),
+    ]
+    assert _suggest(api_client, "STAR  w") == [("movie", "Star Wars")]
+    assert _suggest(api_client, "star", limit=1) == [("movie", "Star Wars")]
+    assert _suggest(api_client, "ЗВЕЗД") == [("movie", "Звёздные войны")]
+    assert _suggest(api_client, "wars") == [("movie", "Star Wars")]
+    assert _suggest(api_client, "-") == []
+
+    wars.title = "Solaris"
+    wars.save()
+    MovieFactory(title="Stalker", category=None)
+    Actor.objects.get(name="Ringo Starr").delete()
+    assert _suggest(api_client, "sta") == [
+        ("movie", "Stalker"),
+        ("movie", "Starship Troopers"),
+    ]
+
+    admin = MovieAdmin(Movie, site)
+    admin.message_user = lambda request, message: None
+    admin.unpublish(None, Movie.objects.filter(title="Stalker"))
+    assert _suggest(api_client, "sta") == [("movie", "Starship Troopers")]
+    admin.publish(None, Movie.objects.filter(title="Star Draft"))
+    assert _suggest(api_client, "star d") == [("movie", "Star Draft")]
+
+
+@pytest.mark.django_db
+def test_suggest_warm_up_closes_connection(monkeypatch):
+    MovieFactory(title="Star Wars", category=None)
+    closed = []
+    # Forked workers must not inherit the connection the build opened.
+    monkeypatch.setattr(connection, "close", lambda: closed.append(True))
+
+    suggest_index.warm_up()
+
+    assert suggest_index.built and closed
+    assert [label for _, _, label in suggest_index.suggest("star")] == ["Star Wars"]
+
+
+@pytest.fixture
+def filterable_movies():
+    drama, comedy, noir = (
+        GenreFactory(name=name, url=name.lower())
+        for name in ("Drama", "Comedy", "Noir")
+    )
+    cinema = CategoryFactory(url="cinema")
+    movies = {
+        "a": MovieFactory(year=1999, country="US", category=cinema),
+        "b": MovieFactory(year=2005, country="FR", category=cinema),
+        "c": MovieFactory(year=2005, country="US", category=None),
+        "d": MovieFactory(year=2010, country="US", category=cinema),
+        "draft": MovieFactory(year=2005, country="US", category=cinema, draft=True),
+    }
+    movies["a"].genres.set([drama, comedy])
+    movies["b"].genres.set([drama])
+    movies["c"].genres.set([comedy, noir])
+    movies["draft"].genres.set([drama])
+    return movies
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("", "abcd"),
+        ("genres=drama", "ab"),
+        ("genres=drama&genres=noir", "abc"),
+        ("year_min=2005", "bcd"),
+        ("year_min=2000&year_max=2005", "bc"),
+        ("country=US", "acd"),
+        ("category=cinema&country=US", "ad"),
+        ("genres=comedy&year_max=2000", "a"),
+        ("draft=true", ["draft"]),
+    ],
+)
+def test_list_movies_filters(api_client, filterable_movies, query, expected, settings):
+    settings.DEBUG = True
+    response = api_client.get(f"/api/movies?{query}")
+
+    assert response.status_code == 200
+    assert response["X-Query-Count"] == "2"
+    assert [m["id"] for m in response.json()] == [
+        filterable_movies[key].id for key in expected
+    ]
+
+
+@pytest.mark.django_db
+def test_list_movies_filters_with_cursor(api_client, filterable_movies):
+    response = api_client.get("/api/movies?country=US&limit=1")
+    seen = [m["id"] for m in response.json()]
+    while cursor := response.get(NEXT_CURSOR_HEADER):
+        response = api_client.get(f"/api/movies?country=US&limit=1&after={cursor}")
+        seen += [m["id"] for m in response.json()]
+
+    assert seen == [filterable_movies[key].id for key in "acd"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "sort, key",
+    [
+        ("-rating", lambda m: (-m.rating_avg, m.id)),
+        ("-fess_in_world", lambda m: (-m.fess_in_world, m.id)),
+        ("-budget", lambda m: (-m.budget, m.id)),
+        ("world_premiere", lambda m: (m.world_premiere, m.id)),
+    ],
+)
+def test_list_movies_sort(api_client, settings, sort, key):
+    settings.DEBUG = True
+    movies = [
+        MovieFactory(
+            budget=budget,
+            fess_in_world=fees,
+            world_premiere=date(2000 + n % 3, 1, 1),
+            rating_avg=n % 2,
+        )
+        for n, (budget, fees) in enumerate([(5, 1), (7, 3), (5, 3), (1, 9), (7, 1)])
+    ]
+
+    response = api_client.get(f"/api/movies?sort={sort}&limit=2")
+    assert response["X-Query-Count"] == "2"
+    assert set(response.json()[0]) == set(MovieListSchema.__fields__)
+    seen = [movie["id"] for movie in response.json()]
+    while cursor := response.get(NEXT_CURSOR_HEADER):
+        response = api_client.get(f"/api/movies?sort={sort}&limit=2&after={cursor}")
+        seen += [movie["id"] for movie in response.json()]
+
+    assert seen == [movie.id for movie in sorted(movies, key=key)]
+
+
+@pytest.mark.django_db
+def test_list_movies_sort_cursor_is_scoped(api_client):
+    MovieFactory.create_batch(3)
+    by_budget = api_client.get("/api/movies?sort=-budget&limit=1")[NEXT_CURSOR_HEADER]
+    by_id = api_client.get("/api/movies?limit=1")[NEXT_CURSOR_HEADER]
+
+    for sort, cursor, status_code in [
+        ("-budget", by_budget, 200),
+        ("-fess_in_world", by_budget, 400),
+        ("-budget", by_id, 400),
+        ("id", by_id, 200),
+    ]:
+        response = api_client.get(f"/api/movies?sort={sort}&after={cursor}")
+        assert response.status_code == status_code
+    assert api_client.get("/api/movies?sort=title").status_code == 422
+
+
+@pytest.mark.django_db
+def test_movie_facets(api_client, filterable_movies, settings):
+    settings.DEBUG = True
+    response = api_client.get("/api/movies/facets")
+    assert response.status_code == 200
+    assert response["X-Query-Count"] == "2"
+    assert response.json() == {
+        "genres": [
+            {"slug": "comedy", "name": "Comedy", "count": 2},
+            {"slug": "drama", "name": "Drama", "count": 2},
+            {"slug": "noir", "name": "Noir", "count": 1},
+        ],
+        "years": [
+            {"year": 2010, "count": 1},
+            {"year": 2005, "count": 2},
+            {"year": 1999, "count": 1},
+        ],
+    }
+
+    # A facet ignores its own filter but honours the others.
+    facets = api_client.get("/api/movies/facets?genres=drama&year_min=2000").json()
+    assert facets["genres"] == [
+        {"slug": "comedy", "name": "Comedy", "count": 1},
+        {"slug": "drama", "name": "Drama", "count": 1},
+        {"slug": "noir", "name": "Noir", "count": 1},
+    ]
+    assert facets["years"] == [
+        {"year": 2005, "count": 1},
+        {"year": 1999, "count": 1},
+    ]
+
+
+def test_top_n():
+    chart = TopN([(1, 3.0), (2, 5.0), (3, 4.0), (4, 1.0)], size=3)
+    assert chart.ranked() == [(2, 5.0), (3, 4.0), (1, 3.0)]
+
+    assert chart.offer(5, 2.0) == (False, None)
+    assert chart.offer(5, 3.0) == (False, None)  # ties rank the lower id first
+    assert chart.offer(1, 6.0) == (True, None)
+    assert chart.offer(6, 4.5) == (True, 3)
+    assert chart.ranked(2) == [(1, 6.0), (2, 5.0)]
+
+    assert chart.discard(2) and not chart.discard(2)
+    assert chart.offer(7, 0.5) == (True, None)
+    for score in range(100):
+        chart.offer(1, float(score))
+    assert len(chart._heap) <= 2 * chart.size
+    assert chart.ranked() == [(1, 99.0), (6, 4.5), (7, 0.5)]
+
+
+def _chart(api_client, kind, **params):
+    response = api_client.get(f"/api/charts/{kind}", params)
+    assert response.status_code == 200
+    return [(entry["title"], entry["score"]) for entry in response.json()]
+
+
+@pytest.mark.django_db
+def test_charts(api_client, filterable_movies, settings):
+    settings.DEBUG = True
+    movies = filterable_movies
+    for name, count, avg in [
+        ("a", 2, 3.5),
+        ("b", 1, 4.0),
+        ("c", 0, 0),
+        ("draft", 5, 5),
+    ]:
+        movies[name].title = name
+        movies[name].save()
+        Movie.objects.filter(id=movies[name].id).update(
+            rating_count=count, rating_avg=avg
+        )
+    ReviewFactory.create_batch(2, movie=movies["c"])
+    ReviewFactory(movie=movies["b"])
+    out = StringIO()
+
+    call_command("rebuild_charts", stdout=out)
+
+    assert "Rebuilt" in out.getvalue()
+    assert ChartEntry.objects.filter(movie=movies["draft"]).count() == 0
+    response = api_client.get("/api/charts/top-rated")
+    assert response["X-Query-Count"] == "1"
+    assert set(response.json()[0]) == set(ChartEntrySchema.__fields__)
+    assert [entry["rank"] for entry in response.json()] == [1, 2]
+    assert _chart(api_client, "top-rated") == [("b", 4.0), ("a", 3.5)]
+    assert _chart(api_client, "top-rated", limit=1) == [("b", 4.0)]
+    assert _chart(api_client, "top-rated", genre="comedy") == [("a", 3.5)]
+    assert _chart(api_client, "top-rated", year=2005) == [("b", 4.0)]
+    assert _chart(api_client, "top-rated", year=1900) == []
+    assert _chart(api_client, "most-reviewed") == [("c", 2.0), ("b", 1.0)]
+    assert _chart(api_client, "most-reviewed", genre="noir") == [("c", 2.0)]
+
+    for query, status_code in [
+        ("top-rated?genre=drama&year=2005", 400),
+        ("top-rated?genre=western", 404),
+        ("most-liked", 422),
+    ]:
+        assert api_client.get(f"/api/charts/{query}").status_code == status_code
+
+
+@pytest.mark.django_db
+def test_charts_follow_writes(
+    api_client, settings, django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    settings.CHARTS_BATCH_SIZE = 1
+    heat, ronin = MovieFactory(title="Heat"), MovieFactory(title="Ronin")
+    five, two = RatingStar.objects.create(value=5), RatingStar.objects.create(value=2)
+    star_values()
+
+    # Writes only mark their movies, even with no chart loaded yet.
+    for ip, movie, star in [("1", heat, two), ("2", ronin, five), ("1", heat, five)]:
+        vote = {"ip": ip, "star_id": star.id, "movie_id": movie.id}
+        with django_assert_num_queries(2):
+            response = api_client.post("/api/ratings", vote, "application/json")
+        assert response.status_code == 201
+    with CaptureQueriesContext(connection) as queries:
+        review = {"email": "a@example.com", "name": "A", "text": "Fine"}
+        response = api_client.post(
+            f"/api/reviews?movie_id={heat.id}", review, "application/json"
+        )
+    assert response.status_code == 201
+    assert not any("chartentry" in query["sql"] for query in queries)
+    assert not ChartEntry.objects.exists()
+
+    assert _chart(api_client, "top-rated") == [("Heat", 5.0), ("Ronin", 5.0)]
+    assert _chart(api_client, "most-reviewed") == [("Heat", 1.0)]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Rating.objects.get(ip="1").delete()
+        heat.reviews.all().delete()
+        ReviewFactory(movie=ronin)
+    assert _chart(api_client, "top-rated") == [("Ronin", 5.0)]
+    assert _chart(api_client, "most-reviewed") == [("Ronin", 1.0)]
+    assert set(
+        ChartEntry.objects.filter(scope="all").values_list("kind", "movie_id")
+    ) == {("top-rated", ronin.id), ("most-reviewed", ronin.id)}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ronin.draft = True
+        ronin.save()
+    assert _chart(api_client, "most-reviewed") == []
+    assert not ChartEntry.objects.exists()
+
+
+@pytest.mark.django_db
+def test_export_movies_ndjson(api_client, django_assert_num_queries, monkeypatch):
+    genre = GenreFactory(name="Drama")
+    actor = ActorFactory(image="actor.jpg")
+    movies = MovieFactory.create_batch(5)
+    movies[0].genres.add(genre)
+    movies[0].actors.add(actor)
+    draft = MovieFactory(draft=True)
+    monkeypatch.setattr("movie_ninja.export.EXPORT_CHUNK_SIZE", 2)
+
+    response = api_client.get("/api/movies/export")
+    assert response["Content-Type"] == "application/x-ndjson"
+    assert response["X-Export-Started-At"]
+    # One movie query, three prefetches per chunk of two movies.
+    with django_assert_num_queries(1 + 3 * 3):
+        lines = b"".join(response.streaming_content).splitlines()
+
+    rows = [json.loads(line) for line in lines]
+    assert [row["id"] for row in rows] == [movie.id for movie in movies]
+    assert draft.id not in {row["id"] for row in rows}
+    assert rows[0]["genres"] == ["Drama"]
+    assert rows[0]["actors"] == [actor.id]
+    assert rows[0]["rating_count"] == 0
+
+
+@pytest.mark.django_db
+def test_export_movies_streams_under_asgi(api_client, monkeypatch):
+    movies = MovieFactory.create_batch(5)
+    monkeypatch.setattr("movie_ninja.export.EXPORT_CHUNK_SIZE", 2)
+
+    async def export():
+        response = await AsyncClient().get("/api/movies/export")
+        return response, [chunk async for chunk in response.streaming_content]
+
+    response, chunks = async_to_sync(export)()
+
+    assert response.is_async
+    # Sent as it is read, one chunk of lines per chunk of movies.
+    assert [len(chunk.splitlines()) for chunk in chunks] == [2, 2, 1]
+    rows = [json.loads(line) for line in b"".join(chunks).splitlines()]
+    assert [row["id"] for row in rows] == [movie.id for movie in movies]
+
+
+def _export_since(api_client, since):
+    response = api_client.get("/api/movies/export", {"since": since})
+    return [
+        json.loads(line) for line in b"".join(response.streaming_content).splitlines()
+    ]
+
+
+@pytest.mark.django_db
+def test_export_movies_since(api_client):
+    old, changed = MovieFactory.create_batch(2)
+    Movie.objects.filter(id=old.id).update(updated_at="2020-01-01T00:00:00Z")
+
+    rows = _export_since(api_client, "2021-01-01T00:00:00")
+
+    assert [row["id"] for row in rows] == [changed.id]
+
+
+@pytest.mark.django_db
+def test_export_movies_since_lists_tombstones(api_client):
+    unpublished, deleted, linked, kept = MovieFactory.create_batch(4)
+    Movie.objects.update(updated_at="2020-01-01T00:00:00Z")
+    since = timezone.now().isoformat()
+
+    unpublished.draft = True
+    unpublished.save()
+    deleted_id = deleted.id
+    deleted.delete()
+    linked.genres.add(GenreFactory())
+    rows = _export_since(api_client, since)
+
+    assert [row["id"] for row in rows] == [linked.id, unpublished.id, deleted_id]
+    assert {key: rows[1][key] for key in ("id", "draft")} == {
+        "id": unpublished.id,
+        "draft": True,
+    }
+    assert {key: rows[2][key] for key in ("id", "deleted")} == {
+        "id": deleted_id,
+        "deleted": True,
+    }
+    # A full export has no tombstones.
+    response = api_client.get("/api/movies/export")
+    full = [
+        json.loads(line) for line in b"".join(response.streaming_content).splitlines()
+    ]
+    assert [row["id"] for row in full] == [linked.id, kept.id]
+
+
+def _movie_row(url, **fields):
+    row = {
+        "title": url.title(),
+        "description": "d",
+        "poster": "poster.jpg",
+        "country": "US",
+        "url": url,
+    }
+    row.update(fields)
+    return row
+
+
+@pytest.mark.django_db
+def test_import_movies_bulk(api_client, monkeypatch):
+    monkeypatch.setattr("movie_ninja.importer.IMPORT_CHUNK_SIZE", 2)
+    token = TokenFactory(user__is_staff=True)
+    category = CategoryFactory()
+    genre = GenreFactory()
+    actor = ActorFactory(image="actor.jpg")
+    rows = [
+        _movie_row(
+            "first",
+            category=category.url,
+            genres=[genre.url],
+            actors=[actor.id, actor.id],
+            directors=[actor.id],
+        ),
+        _movie_row("second", category="missing", actors=[0]),
+        _movie_row("third", budget=-1),
+        _movie_row("first"),
+        _movie_row("fourth"),
+    ]
+
+    response = api_client.post(
+        "/api/movies/bulk",
+        json.dumps(rows),
+        content_type="application/json",
+        HTTP_AUTHORIZATION=f"Bearer {token.access_token}",
+    )
+
+    assert response.status_code == 200
+    result = response.json()
+    assert result["created"] == 2
+    assert [(error["row"], error["url"]) for error in result["errors"]] == [
+        (2, "second"),
+        (3, "third"),
+        (4, "first"),
+    ]
+    assert result["errors"][0]["errors"] == [
+        "category: unknown slug 'missing'",
+        "actors: unknown id 0",
+    ]
+    first = Movie.objects.get(url="first")
+    assert first.category == category
+    assert list(first.genres.all()) == [genre]
+    assert list(first.actors.all()) == [actor]
+    assert list(first.directors.all()) == [actor]
+    assert Movie.objects.filter(url="fourth").exists()
+
+
+@pytest.mark.django_db
+def test_import_movies_bulk_ndjson_and_errors(api_client):
+    staff = TokenFactory(user__is_staff=True)
+    user = TokenFactory()
+    body = json.dumps(_movie_row("lines")) + "\nnot json\n"
+
+    def post(token, content_type):
+        return api_client.post(
+            "/api/movies/bulk",
+            body,
+            content_type=content_type,
+            HTTP_AUTHORIZATION=f"Bearer {token.access_token}",
+        )
+
+    assert post(user, "application/x-ndjson").status_code == 403
+    assert post(staff, "text/plain").status_code == 415
+    response = post(staff, "application/x-ndjson")
+    assert response.json()["created"] == 1
+    assert response.json()["errors"][0]["row"] == 2
+    assert post(staff, "application/json").status_code == 400
+
+
+@pytest.mark.django_db
+def test_import_movies_bulk_json_size_limit(api_client, settings):
+    token = TokenFactory(user__is_staff=True)
+    rows = [_movie_row(f"movie-{number}") for number in range(3)]
+    settings.DATA_UPLOAD_MAX_MEMORY_SIZE = len(json.dumps(rows[:2])) + 1
+
+    def post(rows, content_type):
+        if content_type == "application/json":
+            body = json.dumps(rows)
+        else:
+            body = "\n".join(json.dumps(row) for row in rows)
+        return api_client.post(
+            "/api/movies/bulk",
+            body,
+            content_type=content_type,
+            HTTP_AUTHORIZATION=f"Bearer {token.access_token}",
+        )
+
+    response = post(rows, "application/json")
+    assert response.status_code == 413
+    assert "JSON lines" in response.json()["detail"]
+    assert not Movie.objects.exists()
+    assert post(rows[:2], "application/json").json()["created"] == 2
+    big = [_movie_row(f"line-{number}") for number in range(3)]
+    assert post(big, "application/x-ndjson").json()["created"] == 3
+
+
+@pytest.mark.django_db
+def test_import_movies_command(tmp_path):
+    genre = GenreFactory()
+    path = tmp_path / "movies.csv"
+    path.write_text(
+        "title,description,poster,country,url,genres,year\n"
+        f"Csv,d,p.jpg,US,csv-movie,{genre.url},2001\n"
+        "Bad,d,p.jpg,US,bad movie,,\n"
+    )
+    out, err = StringIO(), StringIO()
+
+    call_command("import_movies", str(path), stdout=out, stderr=err)
+
+    assert "Imported 1 movies, 1 rows rejected" in out.getvalue()
+    assert "row 2 (bad movie): url:" in err.getvalue()
+    movie = Movie.objects.get(url="csv-movie")
+    assert movie.year == 2001
+    assert list(movie.genres.all()) == [genre]
@@ -1,10 +1,17 @@
 import pytest
+from io import StringIO
+from datetime import timedelta
+from django.core.management import call_command
+from django.utils import timezone
 from ninja.testing import TestClient
+from ninja_jwt.tokens import AccessToken
+from auth_jwt.jwt import AuthBearer, TokenHandler
 from auth_jwt.views import auth_router
 from ninja_extra import status
-from movie_ninja.models import CustomUser
+from movie_ninja.models import CustomUser, Token
 from django.shortcuts import get_object_or_404
 from django.http import Http404
+from .factories import TokenFactory
 
 
 @pytest.mark.django_db
@@ -255,3 +262,118 @@ def test_user_delete(auth_client):
 
     with pytest.raises(Http404):
         get_object_or_404(CustomUser, username="gigia")
+
+
+@pytest.mark.django_db
+def test_authenticate_warm_cache_skips_db(auth_client, django_assert_num_queries):
+    _, token = auth_client
+    bearer = AuthBearer()
+
+    user = bearer.authenticate(None, token.access_token)
+    assert user.username == "gigia"
+
+    with django_assert_num_queries(0):
+        cached_user = bearer.authenticate(None, token.access_token)
+        assert cached_user
+    assert cached_user.pk == user.pk
+
+
+@pytest.mark.django_db
+def test_refresh_invalidates_cached_access_token(auth_client):
+    client, token = auth_client
+    headers = {"Authorization": f"Bearer {token.access_token}"}
+    assert client.patch("/profile", json={}, headers=headers).status_code == 200
+
+    response = client.post("/refresh", json={"refresh_token": str(token.refresh_token)})
+    assert response.status_code == status.HTTP_200_OK
+
+    response = client.patch("/profile", json={}, headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_expired_access_token_rejected(auth_client):
+    client, token = auth_client
+    token.access_token_expires_at = timezone.now() - timedelta(minutes=1)
+    token.save()
+
+    headers = {"Authorization": f"Bearer {token.access_token}"}
+    response = client.patch("/profile", json={}, headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_stateless_auth_skips_token_table(
+    auth_client, settings, django_assert_num_queries
+):
+    settings.NINJA_JWT_STATELESS_AUTH = True
+    _, token = auth_client
+    bearer = AuthBearer()
+
+    with django_assert_num_queries(0):
+        user = bearer.authenticate(None, token.access_token)
+        assert user
+    assert user.username == "gigia"
+
+    tampered = token.access_token[:-2] + (
+        "aa" if token.access_token[-2:] != "aa" else "bb"
+    )
+    assert bearer.authenticate(None, tampered) is None
+    assert bearer.authenticate(None, str(token.refresh_token)) is None
+
+
+@pytest.mark.django_db
+def test_stateless_auth_rejects_expired_token(setup, settings):
+    settings.NINJA_JWT_STATELESS_AUTH = True
+    user = CustomUser.objects.get(username="gigia")
+    expired, _ = TokenHandler.issue_token(AccessToken, user.id, -1)
+
+    assert AuthBearer().authenticate(None, str(expired)) is None
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("stateless", [False, True])
+def test_deleted_user_token_rejected(auth_client, api_client, settings, stateless):
+    settings.NINJA_JWT_STATELESS_AUTH = stateless
+    _, token = auth_client
+    headers = {"HTTP_AUTHORIZATION": f"Bearer {token.access_token}"}
+
+    def update_profile():
+        return api_client.patch(
+            "/api/auth/profile", "{}", content_type="application/json", **headers
+        )
+
+    # Caches the access token for the non-stateless lookup.
+    assert update_profile().status_code == status.HTTP_200_OK
+
+    CustomUser.objects.filter(username="gigia").delete()
+
+    response = update_profile()
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.json() == {"detail": "Unauthorized"}
+
+
+@pytest.mark.django_db
+def test_tokens_looked_up_by_digest(auth_client):
+    _, token = auth_client
+
+    assert token.access_token_digest == Token.digest(token.access_token)
+    assert token.refresh_token_digest == Token.digest(token.refresh_token)
+    assert len(token.access_token_digest) == 64
+
+    user = TokenHandler.get_user_from_token(token.access_token)
+    assert user.username == "gigia"
+    assert TokenHandler.get_user_from_token(token.access_token + "x") is None
+
+
+@pytest.mark.django_db
+def test_reap_expired_tokens_command():
+    expired_at = timezone.now() - timedelta(minutes=1)
+    TokenFactory.create_batch(5, refresh_token_expires_at=expired_at)
+    live = TokenFactory()
+
+    out = StringIO()
+    call_command("reap_expired_tokens", batch_size=2, sleep=0, stdout=out)
+
+    assert "Removed 5 expired tokens" in out.getvalue()
+    assert list(Token.objects.values_list("id", flat=True)) == [live.id]
@@ -0,0 +1,33 @@
+import json
+
+import pytest
+from django.test import Client
+
+from benchmarks.suite import RouteFailed, measure, run_benchmarks
+
+
+@pytest.mark.django_db
+def test_benchmark_suite_smoke(api_client):
+    report = run_benchmarks(
+        scale=0.001,
+        iterations=3,
+        only={"list_movies", "get_movie", "get_movie_reviews_viral", "refresh"},
+    )
+
+    assert set(report["routes"]) == {
+        "list_movies",
+        "get_movie",
+        "get_movie_reviews_viral",
+        "refresh",
+    }
+    for result in report["routes"].values():
+        assert set(result["status_codes"]) == {"200"}
+        assert result["latency_ms"]["p50"] <= result["latency_ms"]["p99"]
+        assert result["queries"]["max"] >= 1
+    json.dumps(report)
+
+
+@pytest.mark.django_db
+def test_benchmark_fails_on_error_responses():
+    with pytest.raises(RouteFailed, match="GET /api/movies/0 returned 404"):
+        measure(Client(), "GET", lambda i: ("/api/movies/0", None, {}), 1)
@@ -0,0 +1,158 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+from django.http import HttpResponse
+
+from ninja_api.cache import acquire_fill, get_cache, release_fill, wait_for
+from ninja_api.cache_backends import SQLiteCache
+from ninja_api.response_cache import ResponseCacheMiddleware, generations, invalidate
+from .factories import ActorFactory
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    return SQLiteCache(tmp_path / "cache.sqlite3", {})
+
+
+@pytest.fixture
+def shared_cache(settings, tmp_path):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "shared": {
+            "BACKEND": "ninja_api.cache_backends.SQLiteCache",
+            "LOCATION": tmp_path / "shared.sqlite3",
+        },
+    }
+    settings.API_CACHE_ALIAS = "shared"
+    yield get_cache()
+    get_cache().clear()
+
+
+def test_sqlite_cache_operations(sqlite_cache):
+    sqlite_cache.set("movie", {"id": 1, "title": "Test"})
+    assert sqlite_cache.get("movie") == {"id": 1, "title": "Test"}
+    assert sqlite_cache.get("missing", "default") == "default"
+    assert sqlite_cache.has_key("movie")
+
+    assert not sqlite_cache.add("movie", "other")
+    assert sqlite_cache.add("fresh", "value")
+    assert sqlite_cache.get("fresh") == "value"
+
+    sqlite_cache.set("counter", 1)
+    assert sqlite_cache.incr("counter", 5) == 6
+    with pytest.raises(ValueError):
+        sqlite_cache.incr("missing")
+
+    assert sqlite_cache.delete("movie")
+    assert sqlite_cache.get("movie") is None
+    sqlite_cache.clear()
+    assert sqlite_cache.get("counter") is None
+
+
+def test_sqlite_cache_expiry(sqlite_cache):
+    sqlite_cache.set("short", "value", 0.05)
+    sqlite_cache.set("forever", "value", None)
+    time.sleep(0.1)
+
+    assert sqlite_cache.get("short") is None
+    assert sqlite_cache.get("forever") == "value"
+    # An expired key can be added again.
+    assert sqlite_cache.add("short", "again")
+
+
+def test_sqlite_cache_culls(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.sqlite3", {"OPTIONS": {"MAX_ENTRIES": 50}})
+    for i in range(SQLiteCache.CULL_EVERY):
+        cache.set(f"key{i}", i)
+
+    count = cache._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+    assert count < SQLiteCache.CULL_EVERY
+    assert cache.get(f"key{SQLiteCache.CULL_EVERY - 1}") == SQLiteCache.CULL_EVERY - 1
+
+
+def _increment(path, times):
+    cache = SQLiteCache(path, {})
+    for _ in range(times):
+        cache.incr("counter")
+
+
+def test_sqlite_cache_incr_is_atomic_across_processes(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    SQLiteCache(path, {}).set("counter", 0)
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_increment, args=(path, 100)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert SQLiteCache(path, {}).get("counter") == 400
+
+
+def test_single_flight_fill(shared_cache):
+    calls = []
+
+    def fill():
+        if acquire_fill("page"):
+            calls.append(1)
+            time.sleep(0.1)
+            shared_cache.set("page", "rendered")
+            release_fill("page")
+            results.append("rendered")
+        else:
+            results.append(wait_for("page"))
+
+    results = []
+    threads = [threading.Thread(target=fill) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["rendered"] * 8
+    assert len(calls) == 1
+    assert acquire_fill("page")
+
+
+@pytest.mark.django_db
+def test_response_cache_on_shared_backend(shared_cache, api_client, settings):
+    settings.DEBUG = True
+    ActorFactory(image="actor.jpg")
+
+    first = api_client.get("/api/actors")
+    second = api_client.get("/api/actors")
+
+    assert first["X-Query-Count"] == "1"
+    assert second["X-Query-Count"] == "0"
+    assert second["ETag"] == first["ETag"]
+
+
+@pytest.mark.django_db
+def test_invalidate_bumps_once_on_commit(django_capture_on_commit_callbacks):
+    (before,) = generations(["movies"])
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        invalidate("movies")
+        assert generations(["movies"]) == [before]
+
+    assert len(callbacks) == 1
+    callbacks[0]()
+    assert generations(["movies"]) == [before + 1]
+
+
+def test_response_with_etag_releases_fill(rf):
+    request = rf.get("/api/movies")
+    request.response_cache_key = "api-response:movies:key"
+    assert acquire_fill(request.response_cache_key)
+    request.response_cache_filling = True
+    response = HttpResponse(b"[]")
+    response["ETag"] = '"own"'
+
+    ResponseCacheMiddleware(lambda request: response).process_response(
+        request, response
+    )
+
+    assert response["ETag"] == '"own"'
+    assert acquire_fill(request.response_cache_key)